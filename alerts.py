@@ -0,0 +1,236 @@
+"""Alertes matériel : arcs à vérifier et prêts en retard.
+
+Le calcul est fait par `refresh_alerts()` (commande `flask alerts refresh`, à
+planifier en cron). Les pages ne lisent que la table `alert`. En option, sans
+cron (ALERTS_MAX_AGE_MINUTES > 0, désactivé par défaut) : quand la table est plus
+ancienne que ce délai, le tableau de bord lance le calcul dans un thread du
+worker (un à la fois par worker, mais chaque worker peut lancer le sien) et
+s'affiche sans l'attendre, sans écrire dans la requête.
+
+Seuils (config / `.env`) :
+  - VERIFICATION_INTERVAL_DAYS : un arc jamais vérifié, ou vérifié il y a plus
+    longtemps que ce délai, est « à vérifier » ;
+  - LOAN_OVERDUE_DAYS : un prêt en cours plus ancien que ce délai est « en retard ».
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, or_, select
+
+from models import Alert, Archer, Assignment, Category, CompositeProduct, Product, ProductAssignment, db
+
+logger = logging.getLogger(__name__)
+
+KIND_VERIFICATION_DUE = 'verification_due'
+KIND_LOAN_OVERDUE = 'loan_overdue'
+
+KIND_LABELS = {
+    KIND_VERIFICATION_DUE: 'Arcs à vérifier',
+    KIND_LOAN_OVERDUE: 'Prêts en retard',
+}
+
+# Dernier calcul fait par ce processus : évite de recalculer à chaque page quand
+# la table est vide (aucune ligne ne porte alors de `computed_at`).
+_last_refresh = None
+# Pris par la requête qui lance le recalcul en arrière-plan, rendu par le thread.
+_background_lock = threading.Lock()
+
+
+def _archer_name(first_name, last_name):
+    return f"{first_name} {last_name}" if first_name else (last_name or '')
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).date()
+    return value
+
+
+def _verification_due_rows(today, interval_days, computed_at):
+    """Arcs jamais vérifiés ou dont la dernière vérification dépasse l'intervalle.
+
+    Requête par plage sur `composite_product.last_verification_date` (indexée).
+    """
+    threshold = today - timedelta(days=interval_days)
+    stmt = (
+        select(CompositeProduct.id, CompositeProduct.name, CompositeProduct.tag,
+               CompositeProduct.last_verification_date)
+        .where(or_(
+            CompositeProduct.last_verification_date.is_(None),
+            CompositeProduct.last_verification_date < threshold,
+        ))
+        .order_by(CompositeProduct.last_verification_date.asc().nulls_first(), CompositeProduct.name)
+    )
+    rows = []
+    for cid, name, tag, last in db.session.execute(stmt):
+        last = _as_date(last)
+        label = f"{name} [{tag}]" if tag else name
+        rows.append({
+            'kind': KIND_VERIFICATION_DUE,
+            'entity_type': 'composite',
+            'entity_id': cid,
+            'summary': (f"{label} : dernière vérification le {last.strftime('%d/%m/%Y')}"
+                        if last else f"{label} : jamais vérifié"),
+            'due_date': last + timedelta(days=interval_days) if last else None,
+            'details': {'last_verification_date': last.isoformat() if last else None},
+            'computed_at': computed_at,
+        })
+    return rows
+
+
+def _overdue_loan_rows(now, overdue_days, computed_at):
+    """Prêts en cours (arcs et produits) plus anciens que le seuil.
+
+    Requêtes par plage sur `date_assigned`, servies par les index partiels
+    `ix_*_open_date_assigned` (WHERE date_returned IS NULL).
+    """
+    threshold = now - timedelta(days=overdue_days)
+    rows = []
+
+    bows = (
+        select(Assignment.id, Assignment.date_assigned, Assignment.archer_id,
+               Archer.first_name, Archer.last_name, CompositeProduct.id, CompositeProduct.name,
+               CompositeProduct.tag)
+        .join(Archer, Archer.id == Assignment.archer_id)
+        .join(CompositeProduct, CompositeProduct.id == Assignment.composite_id)
+        .where(Assignment.date_returned.is_(None), Assignment.date_assigned < threshold)
+        .order_by(Assignment.date_assigned)
+    )
+    for aid, assigned, archer_id, first, last, cid, cname, ctag in db.session.execute(bows):
+        assigned = _as_date(assigned)
+        item = f"{cname} [{ctag}]" if ctag else cname
+        rows.append({
+            'kind': KIND_LOAN_OVERDUE,
+            'entity_type': 'assignment',
+            'entity_id': aid,
+            'summary': f"{item} prêté à {_archer_name(first, last)} depuis le {assigned.strftime('%d/%m/%Y')}",
+            'due_date': assigned + timedelta(days=overdue_days),
+            'details': {'archer_id': archer_id, 'composite_id': cid,
+                        'days': (now.date() - assigned).days},
+            'computed_at': computed_at,
+        })
+
+    products = (
+        select(ProductAssignment.id, ProductAssignment.date_assigned, ProductAssignment.archer_id,
+               Archer.first_name, Archer.last_name, Product.id, Category.name, Product.brand,
+               Product.model, Product.tag)
+        .join(Archer, Archer.id == ProductAssignment.archer_id)
+        .join(Product, Product.id == ProductAssignment.product_id)
+        .outerjoin(Category, Category.id == Product.category_id)
+        .where(ProductAssignment.date_returned.is_(None), ProductAssignment.date_assigned < threshold)
+        .order_by(ProductAssignment.date_assigned)
+    )
+    for paid, assigned, archer_id, first, last, pid, cat, brand, model, tag in db.session.execute(products):
+        assigned = _as_date(assigned)
+        item = ' '.join(x for x in (cat, brand, model) if x) or f"Produit #{pid}"
+        if tag:
+            item += f" [{tag}]"
+        rows.append({
+            'kind': KIND_LOAN_OVERDUE,
+            'entity_type': 'product_assignment',
+            'entity_id': paid,
+            'summary': f"{item} prêté à {_archer_name(first, last)} depuis le {assigned.strftime('%d/%m/%Y')}",
+            'due_date': assigned + timedelta(days=overdue_days),
+            'details': {'archer_id': archer_id, 'product_id': pid,
+                        'days': (now.date() - assigned).days},
+            'computed_at': computed_at,
+        })
+    return rows
+
+
+def refresh_alerts(now: datetime | None = None) -> dict[str, int]:
+    """Recalcule la table `alert` en une transaction (DELETE + INSERT groupé)."""
+    global _last_refresh
+    now = now or datetime.now()
+    cfg = current_app.config
+    rows = _verification_due_rows(now.date(), cfg['VERIFICATION_INTERVAL_DAYS'], now)
+    rows += _overdue_loan_rows(now, cfg['LOAN_OVERDUE_DAYS'], now)
+    db.session.execute(delete(Alert))
+    if rows:
+        db.session.execute(insert(Alert), rows)
+    db.session.commit()
+    _last_refresh = now
+    counts = {kind: 0 for kind in KIND_LABELS}
+    for row in rows:
+        counts[row['kind']] += 1
+    return counts
+
+
+def last_computed_at():
+    return db.session.execute(select(func.max(Alert.computed_at))).scalar()
+
+
+def _is_stale(max_age: int) -> bool:
+    computed = last_computed_at() or _last_refresh
+    if isinstance(computed, str):
+        computed = datetime.fromisoformat(computed)
+    return computed is None or datetime.now() - computed > timedelta(minutes=max_age)
+
+
+def _background_refresh(app, max_age):
+    try:
+        with app.app_context():
+            # Un autre worker (ou le cron) a pu recalculer depuis le lancement.
+            if _is_stale(max_age):
+                refresh_alerts()
+    except Exception:
+        logger.exception("Recalcul des alertes en arrière-plan en échec")
+    finally:
+        _background_lock.release()
+
+
+def refresh_in_background() -> bool:
+    """Lance le recalcul dans un thread si la table a plus de ALERTS_MAX_AGE_MINUTES (0 = cron seul).
+
+    N'écrit rien et n'attend rien dans la requête appelante ; au plus un
+    recalcul à la fois par worker. Renvoie vrai si un recalcul a été lancé.
+    """
+    max_age = current_app.config['ALERTS_MAX_AGE_MINUTES']
+    if max_age <= 0 or not _is_stale(max_age):
+        return False
+    if not _background_lock.acquire(blocking=False):
+        return False
+    try:
+        threading.Thread(
+            target=_background_refresh,
+            args=(current_app._get_current_object(), max_age),
+            name='alerts-refresh',
+            daemon=True,
+        ).start()
+    except BaseException:
+        _background_lock.release()
+        raise
+    return True
+
+
+def dashboard_alerts(limit_per_kind: int = 5) -> dict:
+    """Compteurs et premières alertes de chaque type pour le tableau de bord."""
+    counts = dict(
+        db.session.execute(select(Alert.kind, func.count()).group_by(Alert.kind)).all()
+    )
+    by_kind = {}
+    for kind, label in KIND_LABELS.items():
+        items = (
+            Alert.query.filter_by(kind=kind)
+            .order_by(Alert.due_date.asc().nulls_first(), Alert.id)
+            .limit(limit_per_kind)
+            .all()
+        )
+        by_kind[kind] = {'label': label, 'count': counts.get(kind, 0), 'entries': items}
+    return {'kinds': by_kind, 'computed_at': last_computed_at()}
+
+
+def alerts_for_digest():
+    return Alert.query.order_by(Alert.kind, Alert.due_date.asc().nulls_first(), Alert.id).all()
+
+
+def mail_recipients() -> list[str]:
+    raw = current_app.config.get('ALERTS_MAIL_RECIPIENTS') or ''
+    return [addr.strip() for addr in raw.replace(';', ',').split(',') if addr.strip()]
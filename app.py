@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, session, flash
+from flask import Flask, Response, abort, g, render_template, request, redirect, url_for, send_file, session, flash, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
@@ -14,21 +14,42 @@ from models import (
     Assignment,
     ProductAssignment,
     HistoryEvent,
+    composite_components,
     Course,
     Attendance,
     InscriptionEvent,
     InscriptionEventRegistration,
 )
-from mail import mail, send_archer_credentials, generate_temporary_password
+from mail import mail, send_archer_credentials, generate_temporary_password, send_alerts_digest
+import alerts
+from csv_import import CsvImportError, CsvUpload, import_in_batches
+import exports
+import loan_analytics
+from db_profiles import install_engine_profile
+from data_versions import conditional_get, install_data_version_hooks
+from cache import app_cache, install_cache_invalidation
+from export_cache import cached_export, export_cache
+import fragment_cache
+import metrics
+import perf
+from pdf_rendering import pdf_renderer
+import pdf_tables
+import slow_queries
+import snapshot
 from datetime import datetime, date, timedelta
-from sqlalchemy import func, or_
-from sqlalchemy.orm import selectinload
+from sqlalchemy import func, or_, insert, update, select, union_all, literal
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import contains_eager, selectinload, joinedload
 from dateutil import parser as date_parser
+import codecs
 import csv
+import hmac
 import json
+import os
 import re
+import time
 import unicodedata
-from io import StringIO
+from io import BytesIO, StringIO
 from functools import wraps
 import click
 
@@ -548,7 +569,13 @@ def _inscription_blason_choices_for_discipline(discipline_code, current_blason='
 
 
 def _inscription_blason_distance_choices_json():
-    """Pour le JS : listes par code discipline (sans valeur orpheline)."""
+    """Pour le JS : listes par code discipline (mises en cache, ne dépendent que du code)."""
+    return app_cache.get_or_set(
+        'inscription_blason_distance_choices', (), _build_inscription_blason_distance_choices_json,
+    )
+
+
+def _build_inscription_blason_distance_choices_json():
     bl = {}
     di = {}
     for code, _lbl, _m in INSCRIPTION_DISCIPLINES:
@@ -1125,6 +1152,16 @@ app.config.from_object(Config)
 app.secret_key = 'your-secret-key-change-this'  # À changer en production
 
 db.init_app(app)
+install_engine_profile(app, db)
+perf.init_app(app, db)
+metrics.init_app(app, db)
+slow_queries.init_app(app, db)
+install_data_version_hooks()
+app_cache.init_app(app)
+install_cache_invalidation(db)
+fragment_cache.init_app(app)
+pdf_renderer.init_app(app)
+export_cache.init_app(app)
 migrate = Migrate(app, db)
 
 # Initialiser Flask-Login et Flask-Mail
@@ -1266,6 +1303,7 @@ def get_client_ip():
 
 
 def _record_login_event(*, user_id, attempted_username, success):
+    metrics.inc('aim_logins_total', result='success' if success else 'failure')
     try:
         ua = request.headers.get('User-Agent') or None
         if ua and len(ua) > 4000:
@@ -1383,62 +1421,6 @@ def logout():
     logout_user()
     return redirect(url_for('login'))
 
-def _decode_csv_bytes(raw: bytes) -> str:
-    """
-    Décode un CSV (import archers, etc.).
-
-    Ordre : UTF-16 avec BOM, UTF-8 avec BOM (Excel « CSV UTF-8 »), puis **Windows-1252**
-    (cp1252, « Western European (Windows) » — encodage par défaut d’Excel pour un CSV
-    classique en France), puis UTF-8 sans BOM et autres pages Latin.
-    """
-    if raw.startswith((b'\xff\xfe', b'\xfe\xff')):
-        return raw.decode('utf-16-sig')
-    # utf-8-sig = UTF-8 avec BOM ; cp1252 = Windows-1252 avant utf-8 nu (exports Excel FR)
-    for encoding in (
-        'utf-8-sig',
-        'cp1252',
-        'utf-8',
-        'cp1250',
-        'iso-8859-15',
-        'iso-8859-1',
-    ):
-        try:
-            return raw.decode(encoding)
-        except UnicodeDecodeError:
-            continue
-    return raw.decode('utf-8', errors='replace')
-
-
-def _detect_csv_delimiter(content: str) -> str:
-    """Point-virgule (Excel FR), virgule ou tabulation selon le fichier."""
-    sample = (content[:8192] if content else '').strip()
-    if not sample:
-        return ';'
-    try:
-        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t|')
-        return dialect.delimiter
-    except csv.Error:
-        pass
-    first = content.splitlines()[0] if content.splitlines() else ''
-    sc = first.count(';')
-    cc = first.count(',')
-    if cc > sc:
-        return ','
-    return ';'
-
-
-def _make_unique_csv_fieldnames(headers):
-    """Évite les clés dupliquées (ex. deux colonnes « Catégorie ») qui écrasent les valeurs dans DictReader."""
-    seen = {}
-    out = []
-    for h in headers:
-        key = (h or '').strip()
-        n = seen.get(key, 0) + 1
-        seen[key] = n
-        out.append(key if n == 1 else f'{key}_{n}')
-    return out
-
-
 _IMPORT_LICENSE_RE = re.compile(r'^[0-9]{5,}[A-Za-z0-9-]*$')
 
 
@@ -1661,15 +1643,20 @@ def log_history(event_type, entity_type, entity_id, summary, details=None):
 def index():
     if getattr(current_user, 'role', None) == 'archer':
         return redirect(url_for('archer_portal'))
-    products_count = Product.query.count()
-    archers_count = Archer.query.count()
-    composites_count = CompositeProduct.query.count()
-    categories_count = Category.query.count()
+    counts = app_cache.get_or_set(
+        'dashboard_counts',
+        ('products', 'archers', 'composites', 'categories'),
+        lambda: {
+            'products_count': Product.query.count(),
+            'archers_count': Archer.query.count(),
+            'composites_count': CompositeProduct.query.count(),
+            'categories_count': Category.query.count(),
+        },
+    )
+    alerts.refresh_in_background()
     return render_template('index.html', 
-                         products_count=products_count,
-                         archers_count=archers_count,
-                         composites_count=composites_count,
-                         categories_count=categories_count)
+                         alerts=alerts.dashboard_alerts(),
+                         **counts)
 
 @app.route('/categories')
 @login_required
@@ -1957,12 +1944,26 @@ def _is_tag_taken(tag, *, exclude_product_id=None, exclude_composite_id=None):
     return q.first() is not None
 
 
+# Tables lues par les listes / exports (validateurs ETag, cf. data_versions.conditional_get).
+EQUIPMENT_TABLES = ('category', 'product', 'composite_product', 'composite_components')
+LOAN_TABLES = ('assignment', 'product_assignment', 'archer')
+COURSE_TABLES = ('course', 'archer_courses', 'archer')
+
+
 @app.route('/products')
 @login_required
 @require_permission('view_equipment')
+@conditional_get(*EQUIPMENT_TABLES, *LOAN_TABLES)
 def products():
     # fetch products sorted according to the category position first, then name/brand
-    prods = Product.query.join(Category).order_by(Category.position.asc(), Category.name.asc(), Product.brand.asc()).all()
+    prods = (
+        Product.query.join(Category)
+        .options(contains_eager(Product.category), selectinload(Product.composites))
+        .order_by(Category.position.asc(), Category.name.asc(), Product.brand.asc())
+        .all()
+    )
+    bow_loans = _open_loans(Assignment, 'composite_id', Assignment.archer)
+    product_loans = _open_loans(ProductAssignment, 'product_id', ProductAssignment.archer)
     
     # Group products by category name in the order they appear in the query above
     from collections import defaultdict
@@ -1973,7 +1974,69 @@ def products():
     
     # also supply ordered list of categories for tabs/panels
     cats = Category.query.order_by(Category.position.asc(), Category.name.asc()).all()
-    return render_template('products.html', products=prods, grouped_products=grouped, categories=cats)
+    row_fps = _product_row_fingerprints(prods, bow_loans, product_loans)
+    panel_fps = {
+        cat.id: fragment_cache.fingerprint(
+            cat.name, [row_fps[p.id] for p in grouped.get(cat.name, [])]
+        )
+        for cat in cats
+    }
+    return render_template(
+        'products.html',
+        products=prods,
+        grouped_products=grouped,
+        categories=cats,
+        product_fingerprints=row_fps,
+        panel_fingerprints=panel_fps,
+        bow_loans=bow_loans,
+        product_loans=product_loans,
+    )
+
+
+def _open_loans(model, key, *related):
+    """{getattr(prêt, key): prêt en cours}, relations `related` chargées — une requête pour toute une liste.
+
+    À la place de `archer.current_assignment` / `product.current_assignment`
+    (une requête par ligne) dans les listes.
+    """
+    loans = {}
+    query = (
+        model.query.options(*(joinedload(rel) for rel in related))
+        .filter(model.date_returned.is_(None))
+        .order_by(model.id)
+    )
+    for loan in query:
+        loans.setdefault(getattr(loan, key), loan)
+    return loans
+
+
+def _loan_holder(loan):
+    """(archer_id, prénom, nom, date) d'un prêt de `_open_loans`, pour les empreintes de fragments."""
+    if loan is None:
+        return None
+    return (loan.archer_id, loan.archer.first_name, loan.archer.last_name, loan.date_assigned)
+
+
+def _product_row_fingerprints(prods, bow_loans, product_loans):
+    """Empreinte de chaque ligne de products.html : tout ce que la ligne affiche.
+
+    Arcs d'appartenance (`Product.composites`, préchargés) et prêts en cours
+    (`_open_loans`) : une ligne dont l'empreinte n'a pas changé est servie
+    depuis le cache de fragments.
+    """
+    fps = {}
+    for p in prods:
+        comps = sorted((c.id, c.name, c.status) for c in p.composites)
+        cat = p.category
+        fps[p.id] = fragment_cache.fingerprint(
+            p.id, p.tag, p.brand, p.model, p.size, p.power, p.location, p.state, p.comments,
+            p.custom_values,
+            (cat.field_units, cat.custom_fields) if cat else None,
+            comps,
+            [_loan_holder(bow_loans.get(cid)) for cid, _n, _s in comps],
+            _loan_holder(product_loans.get(p.id)),
+        )
+    return fps
 
 @app.route('/add_product', methods=['GET', 'POST'])
 @login_required
@@ -2171,13 +2234,85 @@ def _product_power_display(product):
         u = ' ' + str(cat.field_units.get('power'))
     return f"{raw}{u}"
 
+def _composite_summary(comp):
+    """Résumé d'un arc (mis en cache, invalidé à toute modification d'arc ou de produit)."""
+    return app_cache.get_or_set(
+        f'composite_summary:{comp.id}',
+        ('composites', 'products'),
+        lambda: _compute_composite_summary(comp),
+    )
+
+
+def _compute_composite_summary(comp):
+    """Résumé d'un arc : poignée, branche, puissance (branche), taille AMO = branche + poignée - 25."""
+    handle = None
+    branch = None
+    handle_prod = None
+    branch_prod = None
+    for p in comp.components:
+        cname = (p.category.name or '').lower()
+        if 'poign' in cname or 'handle' in cname:
+            if not handle:
+                parts = []
+                if p.size:
+                    parts.append(str(p.size))
+                if p.custom_values:
+                    for k in ('latéralité', 'lateralite', 'side', 'hand', 'lat'):
+                        if k in p.custom_values:
+                            parts.append(str(p.custom_values[k]))
+                            break
+                handle = ' '.join(parts) if parts else p.brand or ''
+            if handle_prod is None:
+                handle_prod = p
+        if 'branche' in cname or 'branch' in cname or 'limb' in cname:
+            if not branch:
+                parts = []
+                if p.model:
+                    parts.append(p.model)
+                if p.size:
+                    parts.append(str(p.size))
+                if p.power:
+                    parts.append(str(p.power))
+                if p.custom_values and not parts:
+                    if 'size' in p.custom_values:
+                        parts.append(str(p.custom_values['size']))
+                    if 'power' in p.custom_values:
+                        parts.append(str(p.custom_values['power']))
+                branch = ' '.join(parts) if parts else p.brand or ''
+            if branch_prod is None:
+                branch_prod = p
+    handle_num = None
+    branch_num = None
+    if handle_prod:
+        handle_num = _first_int_from_text(handle_prod.size)
+        if handle_num is None and handle_prod.custom_values:
+            handle_num = _first_int_from_text(handle_prod.custom_values.get('size'))
+    if branch_prod:
+        branch_num = _first_int_from_text(branch_prod.size)
+        if branch_num is None and branch_prod.custom_values:
+            branch_num = _first_int_from_text(branch_prod.custom_values.get('size'))
+    taille = None
+    if handle_num is not None and branch_num is not None:
+        taille = branch_num + handle_num - 25
+    return {
+        'handle': handle,
+        'branch': branch,
+        'handle_size_display': _product_size_display(handle_prod),
+        'branch_size_display': _product_size_display(branch_prod),
+        'power_display': _product_power_display(branch_prod),
+        'taille': taille,
+    }
+
 @app.route('/composites')
 @login_required
+@conditional_get(*EQUIPMENT_TABLES, *LOAN_TABLES)
 def composites():
     # Get sort parameter from query string
     sort_by = request.args.get('sort', 'name')  # default sort by name
     
-    comps = CompositeProduct.query.all()
+    comps = CompositeProduct.query.options(
+        selectinload(CompositeProduct.components).joinedload(Product.category)
+    ).all()
     
     # Sort the composites
     if sort_by == 'type':
@@ -2187,73 +2322,34 @@ def composites():
     elif sort_by == 'name':
         comps = sorted(comps, key=lambda x: natural_sort_key(x.name))
     
-    # Résumé par arc : poignée, branche, puissance (branche), taille AMO = branche + poignée - 25
+    # Résumé par arc (voir _composite_summary) + archer qui l'a en prêt
     summaries = {}
+    bow_loans = _open_loans(Assignment, 'composite_id', Assignment.archer)
     for comp in comps:
-        handle = None
-        branch = None
-        handle_prod = None
-        branch_prod = None
-        for p in comp.components:
-            cname = (p.category.name or '').lower()
-            if 'poign' in cname or 'handle' in cname:
-                if not handle:
-                    parts = []
-                    if p.size:
-                        parts.append(str(p.size))
-                    if p.custom_values:
-                        for k in ('latéralité', 'lateralite', 'side', 'hand', 'lat'):
-                            if k in p.custom_values:
-                                parts.append(str(p.custom_values[k]))
-                                break
-                    handle = ' '.join(parts) if parts else p.brand or ''
-                if handle_prod is None:
-                    handle_prod = p
-            if 'branche' in cname or 'branch' in cname or 'limb' in cname:
-                if not branch:
-                    parts = []
-                    if p.model:
-                        parts.append(p.model)
-                    if p.size:
-                        parts.append(str(p.size))
-                    if p.power:
-                        parts.append(str(p.power))
-                    if p.custom_values and not parts:
-                        if 'size' in p.custom_values:
-                            parts.append(str(p.custom_values['size']))
-                        if 'power' in p.custom_values:
-                            parts.append(str(p.custom_values['power']))
-                    branch = ' '.join(parts) if parts else p.brand or ''
-                if branch_prod is None:
-                    branch_prod = p
-        handle_num = None
-        branch_num = None
-        if handle_prod:
-            handle_num = _first_int_from_text(handle_prod.size)
-            if handle_num is None and handle_prod.custom_values:
-                handle_num = _first_int_from_text(handle_prod.custom_values.get('size'))
-        if branch_prod:
-            branch_num = _first_int_from_text(branch_prod.size)
-            if branch_num is None and branch_prod.custom_values:
-                branch_num = _first_int_from_text(branch_prod.custom_values.get('size'))
-        taille = None
-        if handle_num is not None and branch_num is not None:
-            taille = branch_num + handle_num - 25
-        assigned = None
-        for a in comp.assignments:
-            if not a.date_returned:
-                assigned = a.archer.name if a.archer else 'Assigné'
-                break
-        summaries[comp.id] = {
-            'handle': handle,
-            'branch': branch,
-            'handle_size_display': _product_size_display(handle_prod),
-            'branch_size_display': _product_size_display(branch_prod),
-            'power_display': _product_power_display(branch_prod),
-            'taille': taille,
-            'assigned_to': assigned,
-        }
-    return render_template('composites.html', composites=comps, composite_summaries=summaries, current_sort=sort_by)
+        summary = dict(_composite_summary(comp))
+        loan = bow_loans.get(comp.id)
+        summary['assigned_to'] = loan.archer.name if loan else None
+        summaries[comp.id] = summary
+    return render_template(
+        'composites.html',
+        composites=comps,
+        composite_summaries=summaries,
+        current_sort=sort_by,
+        composite_fingerprints=_composite_card_fingerprints(comps, summaries, bow_loans),
+        bow_loans=bow_loans,
+    )
+
+
+def _composite_card_fingerprints(comps, summaries, bow_loans):
+    """Empreinte de chaque carte de composites.html (arc, résumé, nombre de pièces, prêt en cours)."""
+    return {
+        c.id: fragment_cache.fingerprint(
+            c.id, c.name, c.tag, c.type, c.status, c.last_verification_date,
+            len(c.components), sorted(summaries[c.id].items(), key=lambda kv: kv[0]),
+            _loan_holder(bow_loans.get(c.id)),
+        )
+        for c in comps
+    }
 
 @app.route('/add_composite', methods=['GET', 'POST'])
 @login_required
@@ -2314,7 +2410,10 @@ def add_composite():
         return redirect(url_for('composites'))
     # pass categories (ordered by user-defined position) so template can group products by category
     # Show products that are free or mounted on another bow that is not on loan.
-    cats = Category.query.order_by(Category.position.asc(), Category.name.asc()).all()
+    cats = (
+        Category.query.options(selectinload(Category.products).selectinload(Product.composites))
+        .order_by(Category.position.asc(), Category.name.asc()).all()
+    )
     cats_with_available = []
     for c in cats:
         available = []
@@ -2425,7 +2524,7 @@ def edit_composite(comp_id):
     # assigned to an archer yet.  When such an item is selected we will also
     # swap the old component back onto the other bow on save (see POST logic
     # below).
-    prods = Product.query.all()
+    prods = Product.query.options(joinedload(Product.category), selectinload(Product.composites)).all()
     prods_filtered = []
     for p in prods:
         if (not p.composites) or (p in comp.components):
@@ -2448,6 +2547,7 @@ def edit_composite(comp_id):
 
 @app.route('/archers')
 @login_required
+@conditional_get(*LOAN_TABLES, *COURSE_TABLES, 'composite_product')
 def archers():
     sort_by = request.args.get('sort_by', 'nom')
     sort_order = request.args.get('sort_order', 'asc')
@@ -2459,45 +2559,9 @@ def archers():
     filter_min_age = request.args.get('min_age')
     filter_max_age = request.args.get('max_age')
     
-    query = Archer.query
-
-    # apply filters
-    if filter_q:
-        q = f"%{filter_q}%"
-        query = query.filter(db.or_(Archer.first_name.ilike(q), Archer.last_name.ilike(q)))
-
-    if filter_category:
-        query = query.filter(Archer.categorie == filter_category)
-
-    if filter_min_age:
-        try:
-            query = query.filter(Archer.age >= int(filter_min_age))
-        except ValueError:
-            pass
-    if filter_max_age:
-        try:
-            query = query.filter(Archer.age <= int(filter_max_age))
-        except ValueError:
-            pass
+    # apply filters (shared with /export/archers)
+    query = Archer.query.filter(*exports.archer_filters(request.args))
 
-    # filter by course
-    if filter_course:
-        try:
-            cid = int(filter_course)
-            query = query.join(Archer.courses).filter(Course.id == cid)
-        except Exception:
-            pass
-
-    # filter by has arc (active assignment)
-    if filter_has_arc in ('yes','no'):
-        from sqlalchemy.orm import aliased
-        AssignmentAlias = aliased(Assignment)
-        if filter_has_arc == 'yes':
-            query = query.join(AssignmentAlias, (AssignmentAlias.archer_id == Archer.id) & (AssignmentAlias.date_returned == None))
-        else:
-            # archers without active assignment
-            query = query.outerjoin(AssignmentAlias, (AssignmentAlias.archer_id == Archer.id) & (AssignmentAlias.date_returned == None)).filter(AssignmentAlias.id == None)
-    
     # Apply sorting
     if sort_by == 'nom':
         query = query.order_by(Archer.last_name if sort_order == 'asc' else Archer.last_name.desc())
@@ -2532,14 +2596,15 @@ def archers():
     else:
         query = query.order_by(Archer.last_name.asc())
     
-    archs = query.all()
+    archs = query.options(selectinload(Archer.courses)).all()
+    current_loans = _open_loans(Assignment, 'archer_id', Assignment.composite)
     current_sort = {'by': sort_by, 'order': sort_order}
     # pass filter options
     courses = Course.query.order_by(Course.name).all()
     # distinct categories from archers
     cats = [c[0] for c in db.session.query(Archer.categorie).distinct().order_by(Archer.categorie).all() if c[0]]
     current_filters = {'q': filter_q, 'course_id': filter_course, 'has_arc': filter_has_arc, 'category': filter_category, 'min_age': filter_min_age, 'max_age': filter_max_age}
-    return render_template('archers.html', archers=archs, current_sort=current_sort, courses=courses, categories=cats, current_filters=current_filters)
+    return render_template('archers.html', archers=archs, current_loans=current_loans, current_sort=current_sort, courses=courses, categories=cats, current_filters=current_filters)
 
 @app.route('/add_archer', methods=['GET', 'POST'])
 @login_required
@@ -3275,34 +3340,10 @@ def inscription_evenement_pdf():
         start_date=(request.form.get('start_date') or '').strip() or None,
         end_date=(request.form.get('end_date') or '').strip() or None,
     )
-    try:
-        from io import BytesIO
-        from weasyprint import HTML, CSS
-
-        html = render_template('inscription_evenement_pdf.html', body_text=body)
-        css = CSS(
-            string='''
-            @page { margin: 2cm; size: A4; }
-            body {
-              font-family: "DejaVu Serif", "Liberation Serif", Georgia, serif;
-              font-size: 11pt;
-              line-height: 1.45;
-              color: #1a1a1a;
-            }
-            .letter {
-              white-space: pre-wrap;
-              word-wrap: break-word;
-            }
-            '''
-        )
-        buffer = BytesIO()
-        HTML(string=html).write_pdf(target=buffer, stylesheets=[css])
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='inscription.pdf', mimetype='application/pdf')
-    except Exception:
+
+    def fallback():
         import textwrap
         from reportlab.pdfgen import canvas
-        from io import BytesIO
 
         buffer = BytesIO()
         p = canvas.Canvas(buffer, pagesize=(595, 842))
@@ -3319,8 +3360,13 @@ def inscription_evenement_pdf():
                 p.drawString(x, y, chunk[:200])
                 y -= 14
         p.save()
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='inscription.pdf', mimetype='application/pdf')
+        return buffer.getvalue()
+
+    return _pdf_download(
+        'inscription.pdf', 'letter',
+        lambda: render_template('inscription_evenement_pdf.html', body_text=body),
+        fallback,
+    )
 
 
 @app.route('/search')
@@ -3370,9 +3416,19 @@ def search():
 @app.route('/assignments')
 @login_required
 @require_permission('view_assignments')
+@conditional_get(*EQUIPMENT_TABLES, *LOAN_TABLES)
 def assignments():
-    assigns = Assignment.query.filter_by(date_returned=None).all()
-    product_assigns = ProductAssignment.query.filter_by(date_returned=None).all()
+    assigns = (
+        Assignment.query.options(joinedload(Assignment.archer), joinedload(Assignment.composite))
+        .filter_by(date_returned=None).all()
+    )
+    product_assigns = (
+        ProductAssignment.query.options(
+            joinedload(ProductAssignment.archer),
+            joinedload(ProductAssignment.product).joinedload(Product.category),
+        )
+        .filter_by(date_returned=None).all()
+    )
     # Regroupement par archer : une carte = tout le matériel emprunté par un archer
     by_archer = {}
     for a in assigns:
@@ -3395,7 +3451,9 @@ def assignments():
 @require_permission('manage_assignments_for_coach')
 def return_assignment(assign_id):
     assign = Assignment.query.get_or_404(assign_id)
-    assign.date_returned = db.func.now()
+    if not _close_open_loans(Assignment, [assign.id]):
+        flash('Ce retour a déjà été enregistré.', 'info')
+        return redirect(url_for('assignments'))
     assign.composite.status = 'club'
     log_history(
         event_type='assignment_return',
@@ -3471,6 +3529,16 @@ LABEL_CODE_MODES = ('qr', 'barcode', 'none')
 
 
 def _qr_img_data_url(payload, *, border=2, scale=12):
+    """QR en PNG (data URL), mis en cache : l'image ne dépend que du contenu."""
+    if not payload:
+        return ''
+    return app_cache.get_or_set(
+        f'label_qr:{border}:{scale}:{payload}', (),
+        lambda: _render_qr_img_data_url(payload, border=border, scale=scale),
+    )
+
+
+def _render_qr_img_data_url(payload, *, border=2, scale=12):
     """QR en PNG (data URL) pour un rendu fiable à l'écran et à l'impression.
 
     Les SVG segno (25×25 px + tracés stroke) se redimensionnent mal en CSS et
@@ -3493,9 +3561,18 @@ def _qr_img_data_url(payload, *, border=2, scale=12):
 
 
 def _barcode_img_data_url(payload, *, module_height=14, module_width=0.28):
-    """Code-barres Code 128 en PNG (data URL), sans texte sous les barres."""
+    """Code-barres Code 128 en PNG (data URL), sans texte sous les barres (mis en cache)."""
     if not payload:
         return ''
+    return app_cache.get_or_set(
+        f'label_barcode:{module_height}:{module_width}:{payload}', (),
+        lambda: _render_barcode_img_data_url(
+            payload, module_height=module_height, module_width=module_width,
+        ),
+    )
+
+
+def _render_barcode_img_data_url(payload, *, module_height=14, module_width=0.28):
     try:
         import barcode
         from barcode.writer import ImageWriter
@@ -3941,6 +4018,8 @@ def inventaire_etiquettes():
         for _ in range(copies):
             expanded.append(it)
 
+    metrics.inc('aim_label_renders_total', len(expanded), kind=kind)
+
     # Cases vides en début de page (utile sur planche déjà entamée).
     padded = ([None] * skip) + expanded
     _enrich_label_items_code_images(padded, code_mode, layout)
@@ -3990,25 +4069,34 @@ def inventaire_etiquettes():
 @require_permission('manage_assignments_for_coach')
 def assign():
     if request.method == 'POST':
-        archer_id = request.form['archer_id']
-        composite_id = request.form['composite_id']
-        assign_obj = Assignment(archer_id=archer_id, composite_id=composite_id)
+        archer = Archer.query.get_or_404(request.form['archer_id'])
+        comp = CompositeProduct.query.get_or_404(request.form['composite_id'])
+        # Réservation atomique : seul le premier UPDATE … WHERE status='club' gagne.
+        unavailable_msg = f"L'arc « {comp.name} » n'est plus disponible (prêté entre-temps)."
+        if not _claim_composites_for_loan([comp.id]):
+            db.session.rollback()
+            flash(unavailable_msg, 'error')
+            return redirect(url_for('assign'))
+        assign_obj = Assignment(archer_id=archer.id, composite_id=comp.id)
         db.session.add(assign_obj)
-        comp = CompositeProduct.query.get(composite_id)
-        comp.status = 'loan'
-        archer = Archer.query.get(archer_id)
         log_history(
             event_type='assignment',
             entity_type='assignment',
             entity_id=None,
-            summary=f"Assigné: {archer.name if archer else 'Archer inconnu'} ← {comp.name if comp else 'Arc inconnu'}",
-            details={'archer': archer.name if archer else None, 'composite': comp.name if comp else None}
+            summary=f"Assigné: {archer.name} ← {comp.name}",
+            details={'archer': archer.name, 'composite': comp.name}
         )
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash(unavailable_msg, 'error')
+            return redirect(url_for('assign'))
         return redirect(url_for('assignments'))
     archer_id = request.args.get('archer_id')
     composite_id = request.args.get('composite_id', type=int)
     archs = Archer.query.all()
+    current_loans = _open_loans(Assignment, 'archer_id', Assignment.composite)
     comps = CompositeProduct.query.filter_by(status='club').all()
     all_comps = CompositeProduct.query.all()
     selected_archer = Archer.query.get(archer_id) if archer_id else None
@@ -4016,6 +4104,7 @@ def assign():
     return render_template(
         'assign.html',
         archers=archs,
+        current_loans=current_loans,
         composites=comps,
         selected_archer=selected_archer,
         selected_composite=selected_composite,
@@ -4031,12 +4120,13 @@ def assign_product():
         product_id = request.form['product_id']
         prod = Product.query.get_or_404(product_id)
         archer = Archer.query.get_or_404(archer_id)
-        # Garde-fou : produit déjà prêté ou monté sur un arc
-        if prod.current_assignment or prod.composites:
-            flash("Ce produit n'est pas disponible (déjà prêté ou monté sur un arc).", 'error')
+        # Garde-fou atomique : produit déjà prêté, monté sur un arc ou cassé → 0 ligne modifiée
+        unavailable_msg = "Ce produit n'est pas disponible (déjà prêté ou monté sur un arc)."
+        if not _claim_products_for_loan([prod.id]):
+            db.session.rollback()
+            flash(unavailable_msg, 'error')
             return redirect(url_for('assign_product'))
         pa = ProductAssignment(archer_id=archer.id, product_id=prod.id)
-        prod.state = 'loan'
         db.session.add(pa)
         log_history(
             event_type='product_assignment',
@@ -4045,16 +4135,22 @@ def assign_product():
             summary=f"Produit assigné: {archer.name} ← {_product_label(prod)}",
             details={'archer': archer.name, 'product': _product_label(prod)}
         )
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash(unavailable_msg, 'error')
+            return redirect(url_for('assign_product'))
         return redirect(url_for('assignments'))
     archer_id = request.args.get('archer_id')
     archs = Archer.query.order_by(Archer.last_name).all()
-    all_products = Product.query.join(Category).order_by(Category.position.asc(), Product.brand.asc()).all()
-    open_loan_ids = {pa.product_id for pa in ProductAssignment.query.filter_by(date_returned=None).all()}
-    available_products = [
-        p for p in all_products
-        if p.id not in open_loan_ids and not p.composites and p.state != 'broken'
-    ]
+    available_products = (
+        Product.query.join(Category)
+        .options(contains_eager(Product.category))
+        .filter(*_product_available_for_loan())
+        .order_by(Category.position.asc(), Product.brand.asc())
+        .all()
+    )
     selected_archer = Archer.query.get(archer_id) if archer_id else None
     return render_template(
         'assign_product.html',
@@ -4068,7 +4164,9 @@ def assign_product():
 @require_permission('manage_assignments_for_coach')
 def return_product_assignment(passign_id):
     pa = ProductAssignment.query.get_or_404(passign_id)
-    pa.date_returned = db.func.now()
+    if not _close_open_loans(ProductAssignment, [pa.id]):
+        flash('Ce retour a déjà été enregistré.', 'info')
+        return redirect(url_for('assignments'))
     if pa.product and pa.product.state == 'loan':
         pa.product.state = 'stock'
     log_history(
@@ -4100,6 +4198,715 @@ def reset_composite_status(comp_id):
     db.session.commit()
     return redirect(url_for('assign'))
 
+# =============================================================================
+# Comptoir de prêt : sorties / retours groupés par scan des codes (« tags »)
+# =============================================================================
+
+LOAN_DESK_ACTIONS = ('return', 'checkout')
+
+
+def _parse_scanned_tags(raw):
+    """Liste de codes scannés (lignes, virgules, espaces…) → tags normalisés, sans doublon."""
+    if isinstance(raw, str):
+        chunks = re.split(r'[\s,;]+', raw)
+    else:
+        chunks = [str(x) for x in (raw or [])]
+    tags = []
+    seen = set()
+    for chunk in chunks:
+        tag = _normalize_tag(chunk)
+        if tag and tag not in seen:
+            seen.add(tag)
+            tags.append(tag)
+    return tags
+
+
+def _resolve_scanned_tags(tags):
+    """Résout tous les codes en une seule requête (UNION ALL arcs + produits).
+
+    Comme `inventaire_lookup`, un code inconnu suffixé `-H` / `-B` (étiquette de
+    branche) retombe sur la pièce de base. Renvoie `{tag scanné: ('composite' |
+    'product', id)}` et la liste des codes introuvables. Deux codes désignant la
+    même pièce ne sont traités qu'une fois.
+    """
+    if not tags:
+        return {}, []
+    base_by_tag = {t: _strip_branch_suffix(t)[0] for t in tags}
+    wanted = set(tags) | set(base_by_tag.values())
+    stmt = union_all(
+        select(literal('composite').label('kind'), CompositeProduct.id, CompositeProduct.tag)
+        .where(CompositeProduct.tag.in_(wanted)),
+        select(literal('product').label('kind'), Product.id, Product.tag)
+        .where(Product.tag.in_(wanted)),
+    )
+    found = {}
+    for kind, entity_id, tag in db.session.execute(stmt):
+        found.setdefault(tag, (kind, entity_id))
+    resolved = {}
+    not_found = []
+    seen = set()
+    for t in tags:
+        hit = found.get(t)
+        if hit is None and base_by_tag[t] != t:
+            hit = found.get(base_by_tag[t])
+            if hit is not None and hit[0] != 'product':
+                hit = None
+        if hit is None:
+            not_found.append(t)
+        elif hit not in seen:
+            seen.add(hit)
+            resolved[t] = hit
+    return resolved, not_found
+
+
+def _log_history_bulk(events):
+    """Insère plusieurs événements d'historique en un seul INSERT multi-lignes."""
+    if events:
+        db.session.execute(insert(HistoryEvent), events)
+
+
+# -----------------------------------------------------------------------------
+# Moteur d'assignation : réservations conditionnelles (UPDATE … WHERE + rowcount)
+#
+# Plusieurs entraîneurs peuvent prêter en même temps (3 workers gunicorn) : on ne
+# lit jamais « disponible ? » pour écrire ensuite. Chaque réservation est un
+# UPDATE conditionnel dont on vérifie les lignes touchées ; les index uniques
+# partiels sur les prêts ouverts (voir models.py) bloquent le cas restant.
+# -----------------------------------------------------------------------------
+
+def _conditional_update_ids(stmt, id_col, ids):
+    """Exécute un UPDATE conditionnel et renvoie l'ensemble des ids réellement modifiés.
+
+    Utilise RETURNING quand le SGBD le permet (SQLite ≥ 3.35, PostgreSQL), sinon
+    un UPDATE par id avec contrôle du `rowcount`.
+    """
+    ids = list(ids)
+    if not ids:
+        return set()
+    no_sync = {'synchronize_session': False}
+    if db.session.get_bind().dialect.update_returning:
+        rows = db.session.execute(stmt.returning(id_col), execution_options=no_sync)
+        return {row[0] for row in rows}
+    claimed = set()
+    for entity_id in ids:
+        res = db.session.execute(stmt.where(id_col == entity_id), execution_options=no_sync)
+        if res.rowcount == 1:
+            claimed.add(entity_id)
+    return claimed
+
+
+def _claim_composites_for_loan(comp_ids):
+    """Passe en « loan » les arcs encore au club ; renvoie les ids obtenus."""
+    stmt = (
+        update(CompositeProduct)
+        .where(CompositeProduct.id.in_(list(comp_ids)), CompositeProduct.status == 'club')
+        .values(status='loan')
+    )
+    return _conditional_update_ids(stmt, CompositeProduct.id, comp_ids)
+
+
+def _product_available_for_loan():
+    """Critères SQL d'un produit prêtable : ni prêté, ni monté sur un arc, ni cassé."""
+    open_loan = (
+        select(ProductAssignment.id)
+        .where(ProductAssignment.product_id == Product.id, ProductAssignment.date_returned.is_(None))
+        .exists()
+    )
+    mounted = (
+        select(composite_components.c.product_id)
+        .where(composite_components.c.product_id == Product.id)
+        .exists()
+    )
+    return (or_(Product.state.is_(None), Product.state != 'broken'), ~open_loan, ~mounted)
+
+
+def _claim_products_for_loan(prod_ids):
+    """Passe en « loan » les produits libres (ni prêtés, ni montés, ni cassés)."""
+    stmt = (
+        update(Product)
+        .where(Product.id.in_(list(prod_ids)), *_product_available_for_loan())
+        .values(state='loan')
+    )
+    return _conditional_update_ids(stmt, Product.id, prod_ids)
+
+
+def _close_open_loans(model, loan_ids):
+    """Clôt les prêts (Assignment / ProductAssignment) encore ouverts ; renvoie les ids clos."""
+    stmt = (
+        update(model)
+        .where(model.id.in_(list(loan_ids)), model.date_returned.is_(None))
+        .values(date_returned=func.now())
+    )
+    return _conditional_update_ids(stmt, model.id, loan_ids)
+
+
+def _loan_desk_return(resolved):
+    """Clôt en une transaction les prêts en cours des codes scannés."""
+    result = {'returned': [], 'skipped': []}
+    comp_ids = [eid for kind, eid in resolved.values() if kind == 'composite']
+    prod_ids = [eid for kind, eid in resolved.values() if kind == 'product']
+
+    comps = {
+        c.id: c for c in CompositeProduct.query.filter(CompositeProduct.id.in_(comp_ids)).all()
+    } if comp_ids else {}
+    open_assigns = {
+        a.composite_id: a
+        for a in Assignment.query.options(joinedload(Assignment.archer))
+        .filter(Assignment.composite_id.in_(comp_ids), Assignment.date_returned.is_(None))
+        .all()
+    } if comp_ids else {}
+    prods = {
+        p.id: p
+        for p in Product.query.options(joinedload(Product.category))
+        .filter(Product.id.in_(prod_ids)).all()
+    } if prod_ids else {}
+    open_passigns = {
+        pa.product_id: pa
+        for pa in ProductAssignment.query.options(joinedload(ProductAssignment.archer))
+        .filter(ProductAssignment.product_id.in_(prod_ids), ProductAssignment.date_returned.is_(None))
+        .all()
+    } if prod_ids else {}
+
+    closed_assign_ids = _close_open_loans(Assignment, [a.id for a in open_assigns.values()])
+    closed_passign_ids = _close_open_loans(ProductAssignment, [pa.id for pa in open_passigns.values()])
+
+    reset_comp_ids, restock_prod_ids = [], []
+    events = []
+    for tag, (kind, eid) in resolved.items():
+        if kind == 'composite':
+            comp = comps[eid]
+            assign = open_assigns.get(eid)
+            if assign is not None and assign.id not in closed_assign_ids:
+                result['skipped'].append({'tag': tag, 'label': comp.name, 'reason': 'retour déjà enregistré'})
+                continue
+            if assign is None and comp.status != 'loan':
+                result['skipped'].append({'tag': tag, 'label': comp.name, 'reason': 'déjà au club'})
+                continue
+            reset_comp_ids.append(eid)
+            archer_name = assign.archer.name if assign and assign.archer else None
+            if assign is not None:
+                events.append({
+                    'event_type': 'assignment_return',
+                    'entity_type': 'assignment',
+                    'entity_id': assign.id,
+                    'summary': f"Retour: {archer_name} → {comp.name}",
+                    'details': {'archer': archer_name, 'composite': comp.name, 'via': 'comptoir'},
+                })
+            result['returned'].append({'tag': tag, 'kind': kind, 'label': comp.name, 'archer': archer_name})
+        else:
+            prod = prods[eid]
+            pa = open_passigns.get(eid)
+            label = _product_label(prod)
+            if pa is None or pa.id not in closed_passign_ids:
+                result['skipped'].append({'tag': tag, 'label': label, 'reason': 'aucun prêt en cours'})
+                continue
+            if prod.state == 'loan':
+                restock_prod_ids.append(eid)
+            archer_name = pa.archer.name if pa.archer else None
+            events.append({
+                'event_type': 'product_assignment_return',
+                'entity_type': 'product_assignment',
+                'entity_id': pa.id,
+                'summary': f"Retour produit: {archer_name} → {label}",
+                'details': {'archer': archer_name, 'product': label, 'via': 'comptoir'},
+            })
+            result['returned'].append({'tag': tag, 'kind': kind, 'label': label, 'archer': archer_name})
+
+    no_sync = {'synchronize_session': False}
+    if reset_comp_ids:
+        db.session.execute(
+            update(CompositeProduct).where(CompositeProduct.id.in_(reset_comp_ids)).values(status='club'),
+            execution_options=no_sync,
+        )
+    if restock_prod_ids:
+        db.session.execute(
+            update(Product).where(Product.id.in_(restock_prod_ids), Product.state == 'loan').values(state='stock'),
+            execution_options=no_sync,
+        )
+    _log_history_bulk(events)
+    return result
+
+
+def _loan_desk_checkout(resolved, archer):
+    """Prête à `archer`, en une transaction, tout le matériel disponible parmi les codes scannés."""
+    result = {'loaned': [], 'skipped': []}
+    comp_ids = [eid for kind, eid in resolved.values() if kind == 'composite']
+    prod_ids = [eid for kind, eid in resolved.values() if kind == 'product']
+
+    comps = {
+        c.id: c for c in CompositeProduct.query.filter(CompositeProduct.id.in_(comp_ids)).all()
+    } if comp_ids else {}
+    prods = {
+        p.id: p
+        for p in Product.query.options(joinedload(Product.category))
+        .filter(Product.id.in_(prod_ids)).all()
+    } if prod_ids else {}
+    mounted_ids = {
+        pid for (pid,) in db.session.execute(
+            select(composite_components.c.product_id)
+            .where(composite_components.c.product_id.in_(prod_ids))
+        )
+    } if prod_ids else set()
+
+    claimed_comp_ids = _claim_composites_for_loan(comp_ids)
+    claimed_prod_ids = _claim_products_for_loan(prod_ids)
+
+    new_assigns, new_passigns = [], []
+    events = []
+    for tag, (kind, eid) in resolved.items():
+        if kind == 'composite':
+            comp = comps[eid]
+            if eid not in claimed_comp_ids:
+                result['skipped'].append({'tag': tag, 'label': comp.name, 'reason': 'arc non disponible (déjà prêté)'})
+                continue
+            new_assigns.append({'archer_id': archer.id, 'composite_id': eid})
+            events.append({
+                'event_type': 'assignment',
+                'entity_type': 'assignment',
+                'entity_id': None,
+                'summary': f"Assigné: {archer.name} ← {comp.name}",
+                'details': {'archer': archer.name, 'composite': comp.name, 'via': 'comptoir'},
+            })
+            result['loaned'].append({'tag': tag, 'kind': kind, 'label': comp.name, 'archer': archer.name})
+        else:
+            prod = prods[eid]
+            label = _product_label(prod)
+            if eid not in claimed_prod_ids:
+                if eid in mounted_ids:
+                    reason = 'monté sur un arc'
+                elif prod.state == 'broken':
+                    reason = 'cassé'
+                else:
+                    reason = 'déjà prêté'
+                result['skipped'].append({'tag': tag, 'label': label, 'reason': reason})
+                continue
+            new_passigns.append({'archer_id': archer.id, 'product_id': eid})
+            events.append({
+                'event_type': 'product_assignment',
+                'entity_type': 'product_assignment',
+                'entity_id': None,
+                'summary': f"Produit assigné: {archer.name} ← {label}",
+                'details': {'archer': archer.name, 'product': label, 'via': 'comptoir'},
+            })
+            result['loaned'].append({'tag': tag, 'kind': kind, 'label': label, 'archer': archer.name})
+
+    if new_assigns:
+        db.session.execute(insert(Assignment), new_assigns)
+    if new_passigns:
+        db.session.execute(insert(ProductAssignment), new_passigns)
+    _log_history_bulk(events)
+    return result
+
+
+def _process_loan_desk_batch(raw_tags, *, action, archer=None):
+    """Traite un lot de codes scannés (retour ou sortie) dans une seule transaction."""
+    tags = _parse_scanned_tags(raw_tags)
+    resolved, not_found = _resolve_scanned_tags(tags)
+    if action == 'checkout':
+        result = _loan_desk_checkout(resolved, archer)
+        result['returned'] = []
+    else:
+        result = _loan_desk_return(resolved)
+        result['loaned'] = []
+    result['not_found'] = not_found
+    result['scanned'] = len(tags)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Index unique « prêt ouvert » : un autre poste a prêté la même pièce entre-temps.
+        db.session.rollback()
+        return None
+    return result
+
+
+@app.route('/comptoir', methods=['GET', 'POST'])
+@login_required
+@require_permission('manage_assignments_for_coach')
+def loan_desk():
+    """Comptoir de prêt : une liste de codes scannés → un seul aller-retour serveur.
+
+    Accepte un formulaire (`tags`, `archer_id`, `action`) ou un corps JSON
+    `{"tags": [...], "archer_id": 12, "action": "return"}` (réponse JSON).
+    Sans action explicite : sortie si un archer est choisi, retour sinon.
+    """
+    result = None
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) if request.is_json else None
+        if request.is_json and (
+            not isinstance(payload, dict)
+            or not isinstance(payload.get('tags', []), (str, list))
+        ):
+            return jsonify({'error': 'Corps JSON attendu : {"tags": [...], "archer_id": …, "action": …}.'}), 400
+        source = payload if payload is not None else request.form
+        raw_tags = source.get('tags')
+        archer_id = source.get('archer_id') or None
+        action = source.get('action') or ('checkout' if archer_id else 'return')
+        archer = None
+        error = None
+        if action not in LOAN_DESK_ACTIONS:
+            error = 'Action inconnue.'
+        elif action == 'checkout':
+            try:
+                archer = db.session.get(Archer, int(archer_id)) if archer_id else None
+            except (TypeError, ValueError):
+                archer = None
+            if archer is None:
+                error = 'Choisissez l\'archer à qui prêter le matériel.'
+        if error:
+            if payload is not None:
+                return jsonify({'error': error}), 400
+            flash(error, 'error')
+            return redirect(url_for('loan_desk'))
+        result = _process_loan_desk_batch(raw_tags, action=action, archer=archer)
+        if result is None:
+            error = 'Conflit : une de ces pièces vient d\'être prêtée depuis un autre poste. Relancez le lot.'
+            if payload is not None:
+                return jsonify({'error': error}), 409
+            flash(error, 'error')
+            return redirect(url_for('loan_desk'))
+        if payload is not None:
+            return jsonify(result)
+        done = len(result['returned']) + len(result['loaned'])
+        verb = 'prêté(s)' if action == 'checkout' else 'retourné(s)'
+        flash(f"{done} élément(s) {verb} sur {result['scanned']} code(s) scanné(s).", 'success' if done else 'info')
+    archs = Archer.query.order_by(Archer.last_name, Archer.first_name).all()
+    return render_template('loan_desk.html', archers=archs, result=result)
+
+
+# =============================================================================
+# Distribution de début de saison : un arc par archer d'un cours, en un lot
+# =============================================================================
+
+# Allonge (pouces) → taille d'arc AMO conseillée (pouces), barème usuel des clubs.
+AMO_BOW_LENGTH_BY_DRAW = [
+    (16, 48),
+    (20, 54),
+    (22, 62),
+    (24, 64),
+    (26, 66),
+    (28, 68),
+    (30, 70),
+]
+AMO_BOW_LENGTH_MAX = 72
+
+
+def _inches_from_text(val, cm_threshold):
+    """Premier nombre d'une saisie libre (`68"`, `28 pouces`, `71 cm`) converti en pouces."""
+    n = _first_int_from_text(val)
+    if n is None or n <= 0:
+        return None
+    if 'cm' in str(val).lower() or n > cm_threshold:
+        return round(n / 2.54)
+    return n
+
+
+def _archer_target_bow_size(archer):
+    """Taille AMO visée : taille d'arc de la fiche, sinon déduite de l'allonge."""
+    size = _inches_from_text(archer.bow_length, cm_threshold=80)
+    if size:
+        return size
+    draw = _inches_from_text(archer.draw_length, cm_threshold=40)
+    if not draw:
+        return None
+    for max_draw, bow_len in AMO_BOW_LENGTH_BY_DRAW:
+        if draw <= max_draw:
+            return bow_len
+    return AMO_BOW_LENGTH_MAX
+
+
+def _distribution_archers(course_id=None, archer_ids=None):
+    """Archers concernés (cours ou sélection) sans arc en prêt, triés par nom."""
+    q = Archer.query
+    if course_id:
+        q = q.join(Archer.courses).filter(Course.id == course_id)
+    elif archer_ids:
+        q = q.filter(Archer.id.in_(archer_ids))
+    else:
+        return []
+    has_bow = (
+        select(Assignment.id)
+        .where(Assignment.archer_id == Archer.id, Assignment.date_returned.is_(None))
+        .exists()
+    )
+    return q.filter(~has_bow).order_by(Archer.last_name, Archer.first_name).all()
+
+
+def _available_composites_with_size():
+    """Arcs au club avec leur taille AMO calculée (composants chargés en 2 requêtes)."""
+    comps = (
+        CompositeProduct.query.filter_by(status='club')
+        .options(selectinload(CompositeProduct.components).joinedload(Product.category))
+        .all()
+    )
+    comps.sort(key=lambda c: natural_sort_key(c.name))
+    return [(c, _composite_summary(c)['taille']) for c in comps]
+
+
+def _propose_distribution(archers, available):
+    """Appariement glouton archer → arc : écart de taille minimal, puis même type d'arc.
+
+    Les archers aux tailles les plus grandes choisissent en premier (les grands
+    arcs sont les plus rares) ; ceux sans taille connue passent en dernier.
+    Renvoie `{archer_id: (composite | None, taille visée)}`.
+    """
+    targets = {a.id: _archer_target_bow_size(a) for a in archers}
+    order = sorted(archers, key=lambda a: (targets[a.id] is None, -(targets[a.id] or 0)))
+    pool = list(available)
+    proposal = {}
+    for archer in order:
+        target = targets[archer.id]
+        wanted_type = _canonical_archer_bow_type_code(archer.bow_type)
+        best = None
+        best_cost = None
+        for idx, (comp, taille) in enumerate(pool):
+            if target is None or taille is None:
+                size_gap = 0 if target is None else 99
+            else:
+                size_gap = abs(taille - target)
+            type_gap = 0 if not wanted_type or (comp.type or '') == wanted_type else 1
+            cost = (size_gap, type_gap)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = idx, cost
+        comp = pool.pop(best)[0] if best is not None else None
+        proposal[archer.id] = (comp, target)
+    return proposal
+
+
+def _commit_distribution(pairs):
+    """Crée tous les prêts `(archer, arc)` en une transaction.
+
+    Renvoie (prêtés, refusés, déjà équipés) : un arc prêté entre-temps est
+    refusé ; un archer qui a déjà un arc en prêt n'en reçoit pas un second.
+    """
+    equipped_ids = set(db.session.scalars(
+        select(Assignment.archer_id).where(
+            Assignment.archer_id.in_([archer.id for archer, _comp in pairs]),
+            Assignment.date_returned.is_(None),
+        )
+    )) if pairs else set()
+    equipped = [(archer, comp) for archer, comp in pairs if archer.id in equipped_ids]
+    pairs = [(archer, comp) for archer, comp in pairs if archer.id not in equipped_ids]
+    claimed = _claim_composites_for_loan([comp.id for _archer, comp in pairs])
+    loaned, refused = [], []
+    rows, events = [], []
+    for archer, comp in pairs:
+        if comp.id not in claimed:
+            refused.append((archer, comp))
+            continue
+        rows.append({'archer_id': archer.id, 'composite_id': comp.id})
+        events.append({
+            'event_type': 'assignment',
+            'entity_type': 'assignment',
+            'entity_id': None,
+            'summary': f"Assigné: {archer.name} ← {comp.name}",
+            'details': {'archer': archer.name, 'composite': comp.name, 'via': 'distribution'},
+        })
+        loaned.append((archer, comp))
+    if rows:
+        db.session.execute(insert(Assignment), rows)
+    _log_history_bulk(events)
+    db.session.commit()
+    return loaned, refused, equipped
+
+
+def _distribution_json_request(payload):
+    """(course_id, archer_ids, [(archer_id, composite_id), …]) d'un POST JSON ; ValueError si mal formé."""
+    if not isinstance(payload, dict):
+        raise ValueError('objet JSON attendu')
+    items = payload.get('assignments') or []
+    archer_ids = payload.get('archer_ids') or []
+    if not isinstance(items, list) or not isinstance(archer_ids, list):
+        raise ValueError('« assignments » et « archer_ids » doivent être des listes')
+    wanted = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('chaque élément de « assignments » doit être un objet')
+        try:
+            wanted.append((int(item['archer_id']), int(item['composite_id'])))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('« archer_id » et « composite_id » entiers attendus') from None
+    try:
+        course_id = int(payload['course_id']) if payload.get('course_id') else None
+        archer_ids = [int(aid) for aid in archer_ids]
+    except (TypeError, ValueError):
+        raise ValueError('« course_id » et « archer_ids » entiers attendus') from None
+    return course_id, archer_ids, wanted
+
+
+@app.route('/distribution', methods=['GET', 'POST'])
+@login_required
+@require_permission('manage_assignments_for_coach')
+def distribution():
+    """Distribution groupée des arcs aux archers d'un cours (ou d'une sélection).
+
+    GET : proposition d'appariement (`?format=json` pour l'API).
+    POST formulaire : `composite_for_<archer_id>` ; POST JSON :
+    `{"assignments": [{"archer_id": 1, "composite_id": 4}, …]}`.
+    """
+    json_post = request.method == 'POST' and request.is_json
+    if json_post:
+        try:
+            course_id, archer_ids, wanted = _distribution_json_request(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': f'Requête invalide : {e}.'}), 400
+    else:
+        course_id = request.values.get('course_id', type=int)
+        archer_ids = request.values.getlist('archer_ids', type=int)
+    course = db.session.get(Course, course_id) if course_id else None
+
+    if request.method == 'POST':
+        if not json_post:
+            wanted = []
+            for key, value in request.form.items():
+                if key.startswith('composite_for_') and value:
+                    try:
+                        wanted.append((int(key[len('composite_for_'):]), int(value)))
+                    except ValueError:
+                        continue
+        comp_ids = [cid for _aid, cid in wanted]
+        wanted_archer_ids = [aid for aid, _cid in wanted]
+        error = None
+        if len(set(comp_ids)) != len(comp_ids):
+            error = 'Un même arc a été attribué à plusieurs archers.'
+        elif len(set(wanted_archer_ids)) != len(wanted_archer_ids):
+            error = 'Un même archer a reçu plusieurs arcs.'
+        if error:
+            if json_post:
+                return jsonify({'error': error}), 400
+            flash(error, 'error')
+            return redirect(url_for('distribution', course_id=course_id, archer_ids=archer_ids))
+        archers_by_id = {
+            a.id: a for a in Archer.query.filter(Archer.id.in_(wanted_archer_ids)).all()
+        } if wanted else {}
+        comps_by_id = {
+            c.id: c for c in CompositeProduct.query.filter(CompositeProduct.id.in_(comp_ids)).all()
+        } if wanted else {}
+        pairs = [
+            (archers_by_id[aid], comps_by_id[cid])
+            for aid, cid in wanted
+            if aid in archers_by_id and cid in comps_by_id
+        ]
+        try:
+            loaned, refused, equipped = _commit_distribution(pairs)
+        except IntegrityError:
+            db.session.rollback()
+            error = 'Conflit : un de ces arcs vient d\'être prêté depuis un autre poste. Rechargez la proposition.'
+            if json_post:
+                return jsonify({'error': error}), 409
+            flash(error, 'error')
+            return redirect(url_for('distribution', course_id=course_id, archer_ids=archer_ids))
+        if json_post:
+            return jsonify({
+                'loaned': [{'archer_id': a.id, 'composite_id': c.id} for a, c in loaned],
+                'refused': [{'archer_id': a.id, 'composite_id': c.id} for a, c in refused],
+                'already_equipped': [{'archer_id': a.id, 'composite_id': c.id} for a, c in equipped],
+            })
+        flash(f"{len(loaned)} arc(s) distribué(s) en une fois.", 'success' if loaned else 'info')
+        if refused:
+            flash(
+                'Déjà prêtés entre-temps : ' + ', '.join(c.name for _a, c in refused) + '.',
+                'error',
+            )
+        if equipped:
+            flash(
+                'Ont déjà un arc en prêt : ' + ', '.join(a.name for a, _c in equipped) + '.',
+                'error',
+            )
+        return redirect(url_for('distribution', course_id=course_id, archer_ids=archer_ids))
+
+    archs = _distribution_archers(course_id=course_id, archer_ids=archer_ids)
+    available = _available_composites_with_size()
+    proposal = _propose_distribution(archs, available)
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'course_id': course.id if course else None,
+            'proposal': [
+                {
+                    'archer_id': a.id,
+                    'archer': a.name,
+                    'target_size': proposal[a.id][1],
+                    'composite_id': proposal[a.id][0].id if proposal[a.id][0] else None,
+                    'composite': proposal[a.id][0].name if proposal[a.id][0] else None,
+                }
+                for a in archs
+            ],
+            'available': [
+                {'composite_id': c.id, 'name': c.name, 'type': c.type, 'taille': taille}
+                for c, taille in available
+            ],
+        })
+    sizes = {c.id: taille for c, taille in available}
+    courses_list = Course.query.filter_by(active=True).order_by(Course.day_of_week, Course.start_time).all()
+    return render_template(
+        'distribution.html',
+        course=course,
+        courses=courses_list,
+        archers=archs,
+        proposal=proposal,
+        available=available,
+        sizes=sizes,
+        archer_ids=archer_ids,
+    )
+
+
+# =============================================================================
+# Statistiques de prêt : utilisation, durée médiane, inactivité (loan_analytics)
+# =============================================================================
+
+LOAN_STATS_SCOPE_LABELS = {
+    'composite': 'Arcs',
+    'product': 'Produits (prêts directs)',
+    'category': 'Catégories',
+    'season': 'Saisons',
+}
+
+
+def _loan_stats_params():
+    scope = request.args.get('scope', 'composite')
+    if scope not in loan_analytics.SCOPES:
+        scope = 'composite'
+    seasons = loan_analytics.available_seasons()
+    season = request.args.get('season', type=int)
+    if season not in seasons:
+        season = seasons[0]
+    return scope, season, seasons
+
+
+@app.route('/statistiques/prets')
+@login_required
+@require_permission('view_assignments')
+def loan_stats():
+    scope, season, seasons = _loan_stats_params()
+    rows = loan_analytics.loan_stats(scope, season)
+    return render_template(
+        'loan_stats.html',
+        rows=rows,
+        scope=scope,
+        scope_labels=LOAN_STATS_SCOPE_LABELS,
+        season=season,
+        seasons=seasons,
+        season_label=loan_analytics.season_label,
+    )
+
+
+@app.route('/statistiques/prets.csv')
+@login_required
+@require_permission('view_assignments')
+def export_loan_stats_csv():
+    scope, season, _seasons = _loan_stats_params()
+    stats = loan_analytics.loan_stats(scope, season)
+    rows = (
+        ['' if row[key] is None else row[key] for key, _label in loan_analytics.CSV_HEADERS]
+        for row in stats
+    )
+    suffix = 'toutes-saisons' if scope == 'season' else loan_analytics.season_label(season)
+    return _stream_csv(
+        f'statistiques_prets_{scope}_{suffix}.csv',
+        [label for _key, label in loan_analytics.CSV_HEADERS],
+        rows,
+    )
+
+
 @app.route('/history')
 @login_required
 def history():
@@ -4117,6 +4924,7 @@ def history():
 @app.route('/courses')
 @login_required
 @require_permission('view_courses')
+@conditional_get(*COURSE_TABLES)
 def courses():
     days_names = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
     courses_list = Course.query.filter_by(active=True).order_by(Course.day_of_week, Course.start_time).all()
@@ -4277,181 +5085,257 @@ def mark_attendance(course_id):
     db.session.commit()
     return redirect(url_for('course_attendance', course_id=course_id))
 
+def _export_rows(query):
+    """Parcourt un export par lots de EXPORT_YIELD_PER lignes (`yield_per`).
+
+    Sous Postgres, le driver ouvre un curseur côté serveur : la table n'est
+    jamais chargée en entier dans la mémoire du worker. À parcourir une seule fois.
+    """
+    return query.yield_per(app.config['EXPORT_YIELD_PER'])
+
+
+def _stream_csv(download_name, header, rows):
+    """Réponse CSV (`;`, UTF-8 avec BOM pour Excel) envoyée au fil de l'eau.
+
+    `rows` est un itérable paresseux (générateur sur `_export_rows`) : la
+    requête n'est parcourue qu'au moment de l'envoi et le texte part par blocs
+    d'environ EXPORT_CSV_CHUNK_SIZE octets. Mémoire constante, premier octet
+    immédiat.
+    """
+    chunk_size = app.config['EXPORT_CSV_CHUNK_SIZE']
+
+    def generate():
+        yield codecs.BOM_UTF8
+        buf = StringIO()
+        writer = csv.writer(buf, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buf.tell() >= chunk_size:
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode('utf-8')
+
+    return _streamed_download(download_name, 'text/csv', generate())
+
+
+def _stream_jsonl(download_name, keys, rows):
+    """Réponse JSON Lines (un objet par ligne, dates ISO) envoyée au fil de l'eau, comme `_stream_csv`."""
+    chunk_size = app.config['EXPORT_CSV_CHUNK_SIZE']
+
+    def generate():
+        buf = StringIO()
+        for row in rows:
+            buf.write(json.dumps(dict(zip(keys, row)), ensure_ascii=False, default=_jsonl_default))
+            buf.write('\n')
+            if buf.tell() >= chunk_size:
+                yield buf.getvalue().encode('utf-8')
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue().encode('utf-8')
+
+    return _streamed_download(download_name, 'application/x-ndjson', generate())
+
+
+def _jsonl_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} non sérialisable")
+
+
+def _streamed_download(download_name, mimetype, chunks):
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    # nginx met sinon la réponse entière en tampon avant de la transmettre.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _pdf_download(download_name, stylesheet, render_html, render_reportlab, engine='weasyprint'):
+    """Réponse PDF rendue par `engine` : WeasyPrint (`pdf_rendering`, feuille `stylesheet`) ou reportlab.
+
+    `render_html` et `render_reportlab` (→ bytes) sont des fonctions : seule celle
+    du moteur retenu est appelée. WeasyPrint absent ou en échec : rendu reportlab,
+    journalisé et compté ; après un échec, la réponse est marquée dégradée
+    (`g.degraded_response`) pour ne pas être mise en cache ni validée par ETag.
+    """
+    data = None
+    if engine == 'weasyprint':
+        if pdf_renderer.available():
+            try:
+                data = pdf_renderer.render(render_html(), stylesheet)
+            except Exception:
+                app.logger.exception('Export PDF %s : échec du rendu WeasyPrint, rendu reportlab de secours',
+                                     request.endpoint)
+                metrics.inc('aim_pdf_fallbacks_total', endpoint=request.endpoint, reason='error')
+                g.degraded_response = True
+        else:
+            metrics.inc('aim_pdf_fallbacks_total', endpoint=request.endpoint, reason='unavailable')
+    if data is None:
+        started = time.perf_counter()
+        data = render_reportlab()
+        metrics.observe('aim_pdf_render_duration_seconds', time.perf_counter() - started,
+                        engine='reportlab', kind='export')
+    return send_file(BytesIO(data), as_attachment=True, download_name=download_name, mimetype='application/pdf')
+
+
+def _pdf_table_engine(count_rows):
+    """Moteur d'un export tabulaire : `?engine=weasyprint|reportlab`, sinon (auto)
+    reportlab (`pdf_tables`) au-delà de PDF_TABLE_ENGINE_THRESHOLD lignes (`count_rows()`)."""
+    engine = request.args.get('engine') or 'auto'
+    if engine not in ('auto', 'weasyprint', 'reportlab'):
+        abort(400, description="Paramètre engine : auto, weasyprint ou reportlab.")
+    if engine == 'auto':
+        engine = 'reportlab' if count_rows() > app.config['PDF_TABLE_ENGINE_THRESHOLD'] else 'weasyprint'
+    return engine
+
+
+def _count(model, *criteria):
+    return db.session.scalar(select(func.count()).select_from(model).where(*criteria))
+
+
+_PRODUCTS_PDF_COLUMNS = [
+    pdf_tables.Column('ID', 0.07),
+    pdf_tables.Column('Code', 0.17),
+    pdf_tables.Column('Marque', 0.17),
+    pdf_tables.Column('Modèle', 0.17),
+    pdf_tables.Column('Taille', 0.09),
+    pdf_tables.Column('Puissance', 0.09),
+    pdf_tables.Column('État', 0.12),
+    pdf_tables.Column('Lieu', 0.12),
+]
+_ASSIGNMENTS_PDF_COLUMNS = [
+    pdf_tables.Column('Archer', 0.35),
+    pdf_tables.Column('Produit', 0.5),
+    pdf_tables.Column('Date assignée', 0.15),
+]
+_COMPOSITES_PDF_COLUMNS = [
+    pdf_tables.Column('Nom', 0.25),
+    pdf_tables.Column('Type', 0.08),
+    pdf_tables.Column('Statut', 0.1),
+    pdf_tables.Column('Composants', 0.57, wrap=True),
+]
+_ARCHERS_PDF_COLUMNS = [
+    pdf_tables.Column('Nom', 0.34),
+    pdf_tables.Column('Licence', 0.16),
+    pdf_tables.Column('Âge', 0.08),
+    pdf_tables.Column('Catégorie', 0.2),
+    pdf_tables.Column("Type d'arc", 0.22),
+]
+
+
 @app.route('/export_products')
 @login_required
+@conditional_get(*EQUIPMENT_TABLES, daily=True)
+@cached_export(*EQUIPMENT_TABLES)
 def export_products():
-    try:
-        from io import BytesIO
-        from weasyprint import HTML, CSS
-        from flask import render_template
-
-        prods = Product.query.all()
-        html = render_template('products_pdf.html', prods=prods)
-        css = CSS(string='''
-            body { font-family: Arial, sans-serif; font-size:12px; }
-            h1 { font-size:18px; }
-            table { width:100%; border-collapse: collapse; }
-            th, td { border: 1px solid #ddd; padding: 6px; }
-        ''')
-        buffer = BytesIO()
-        HTML(string=html).write_pdf(target=buffer, stylesheets=[css])
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='products.pdf', mimetype='application/pdf')
-    except Exception:
-        from reportlab.pdfgen import canvas
-        from io import BytesIO
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer)
-        prods = Product.query.all()
-        p.drawString(100, 800, "Liste des produits")
-        y = 780
-        for prod in prods:
-            p.drawString(100, y, f"{prod.id}: {prod.brand} - {prod.category.name} - Etat: {prod.state}")
-            y -= 20
-            if y < 50:
-                p.showPage()
-                y = 800
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='products.pdf', mimetype='application/pdf')
+    def render_reportlab():
+        # Regroupé par catégorie, dans l'ordre de la liste du matériel.
+        query = (
+            Product.query.outerjoin(Product.category).options(contains_eager(Product.category))
+            .order_by(Category.position, Category.name, Product.id)
+        )
+        rows = (
+            (p.category.name if p.category else 'Sans catégorie',
+             (p.id, p.tag, p.brand, p.model, p.size, p.power, p.state, p.location))
+            for p in _export_rows(query)
+        )
+        return pdf_tables.render_table_pdf('Liste des produits', _PRODUCTS_PDF_COLUMNS, rows, grouped=True)
+
+    return _pdf_download(
+        'products.pdf', 'table',
+        lambda: render_template('products_pdf.html', prods=_export_rows(
+            Product.query.options(joinedload(Product.category)).order_by(Product.id)
+        )),
+        render_reportlab,
+        engine=_pdf_table_engine(lambda: _count(Product)),
+    )
 
 @app.route('/export_assignments')
 @login_required
+@conditional_get(*EQUIPMENT_TABLES, *LOAN_TABLES, daily=True)
+@cached_export(*EQUIPMENT_TABLES, *LOAN_TABLES)
 def export_assignments():
-    try:
-        from io import BytesIO
-        from weasyprint import HTML, CSS
-        from flask import render_template
-
-        assigns = Assignment.query.filter_by(date_returned=None).all()
-        product_assigns = ProductAssignment.query.filter_by(date_returned=None).all()
-        html = render_template('assignments_pdf.html', assigns=assigns, product_assigns=product_assigns)
-        css = CSS(string='''
-            body { font-family: Arial, sans-serif; font-size:12px; }
-            h1 { font-size:18px; }
-            table { width:100%; border-collapse: collapse; }
-            th, td { border: 1px solid #ddd; padding: 6px; }
-        ''')
-        buffer = BytesIO()
-        HTML(string=html).write_pdf(target=buffer, stylesheets=[css])
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='assignments.pdf', mimetype='application/pdf')
-    except Exception:
-        from reportlab.pdfgen import canvas
-        from io import BytesIO
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer)
-        assigns = Assignment.query.filter_by(date_returned=None).all()
-        product_assigns = ProductAssignment.query.filter_by(date_returned=None).all()
-        p.drawString(100, 800, "Assignations actuelles")
-        y = 780
-        for ass in assigns:
-            p.drawString(100, y, f"{ass.archer.name} - {ass.composite.name} - {ass.date_assigned.strftime('%d/%m/%Y')}")
-            y -= 20
-            if y < 50:
-                p.showPage()
-                y = 800
-        for pa in product_assigns:
-            p.drawString(100, y, f"{pa.archer.name} - {_product_label(pa.product)} - {pa.date_assigned.strftime('%d/%m/%Y')}")
-            y -= 20
-            if y < 50:
-                p.showPage()
-                y = 800
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='assignments.pdf', mimetype='application/pdf')
+    assigns_query = (
+        Assignment.query.filter_by(date_returned=None)
+        .options(joinedload(Assignment.archer), joinedload(Assignment.composite))
+        .order_by(Assignment.id)
+    )
+    product_assigns_query = (
+        ProductAssignment.query.filter_by(date_returned=None)
+        .options(joinedload(ProductAssignment.archer),
+                 joinedload(ProductAssignment.product).joinedload(Product.category))
+        .order_by(ProductAssignment.id)
+    )
+
+    def render_reportlab():
+        def rows():
+            for ass in _export_rows(assigns_query):
+                yield 'Arcs', (ass.archer.name, ass.composite.name if ass.composite else '', ass.date_assigned)
+            for pa in _export_rows(product_assigns_query):
+                yield 'Matériel', (pa.archer.name, _product_label(pa.product), pa.date_assigned)
+        return pdf_tables.render_table_pdf('Assignations actuelles', _ASSIGNMENTS_PDF_COLUMNS, rows(),
+                                           grouped=True)
+
+    return _pdf_download(
+        'assignments.pdf', 'table',
+        lambda: render_template('assignments_pdf.html', assigns=_export_rows(assigns_query),
+                                product_assigns=_export_rows(product_assigns_query)),
+        render_reportlab,
+        engine=_pdf_table_engine(
+            lambda: _count(Assignment, Assignment.date_returned.is_(None))
+            + _count(ProductAssignment, ProductAssignment.date_returned.is_(None))
+        ),
+    )
 
 @app.route('/export_composites')
 @login_required
+@conditional_get(*EQUIPMENT_TABLES, daily=True)
+@cached_export(*EQUIPMENT_TABLES)
 def export_composites():
-    try:
-        from io import BytesIO
-        from weasyprint import HTML, CSS
-        from flask import render_template
-
-        comps = CompositeProduct.query.all()
-        html = render_template('composites_pdf.html', comps=comps)
-        css = CSS(string='''
-            body { font-family: Arial, sans-serif; font-size:12px; }
-            h1 { font-size:18px; }
-            table { width:100%; border-collapse: collapse; }
-            th, td { border: 1px solid #ddd; padding: 6px; }
-        ''')
-        buffer = BytesIO()
-        HTML(string=html).write_pdf(target=buffer, stylesheets=[css])
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='composites.pdf', mimetype='application/pdf')
-    except Exception:
-        from reportlab.pdfgen import canvas
-        from io import BytesIO
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer)
-        comps = CompositeProduct.query.all()
-        p.drawString(100, 800, "Liste des arcs")
-        y = 780
-        for c in comps:
-            p.drawString(100, y, f"{c.name} - Type: {c.type} - Statut: {c.status}")
-            y -= 20
-            for comp in c.components:
-                p.drawString(120, y, f"- {comp.brand} ({comp.category.name})")
-                y -= 15
-            y -= 5
-            if y < 50:
-                p.showPage()
-                y = 800
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='composites.pdf', mimetype='application/pdf')
+    query = CompositeProduct.query.options(
+        selectinload(CompositeProduct.components).joinedload(Product.category)
+    ).order_by(CompositeProduct.id)
+
+    def render_reportlab():
+        rows = (
+            (c.name, c.type, c.status, ', '.join(
+                f"{com.brand} ({com.category.name if com.category else ''})" for com in c.components
+            ))
+            for c in _export_rows(query)
+        )
+        return pdf_tables.render_table_pdf('Liste des arcs composites', _COMPOSITES_PDF_COLUMNS, rows)
+
+    return _pdf_download(
+        'composites.pdf', 'table',
+        lambda: render_template('composites_pdf.html', comps=_export_rows(query)),
+        render_reportlab,
+        engine=_pdf_table_engine(lambda: _count(CompositeProduct)),
+    )
 
 @app.route('/export_archers')
 @login_required
+@conditional_get('archer', daily=True)
+@cached_export('archer')
 def export_archers():
-    try:
-        from io import BytesIO
-        from weasyprint import HTML, CSS
-        from flask import render_template
-
-        archers = Archer.query.all()
-        html = render_template('archers_pdf.html', archers=archers)
-        css = CSS(string='''
-            body { font-family: Arial, sans-serif; font-size:12px; }
-            h1 { font-size:18px; }
-            table { width:100%; border-collapse: collapse; }
-            th, td { border: 1px solid #ddd; padding: 6px; }
-        ''')
-        buffer = BytesIO()
-        HTML(string=html).write_pdf(target=buffer, stylesheets=[css])
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='archers.pdf', mimetype='application/pdf')
-    except Exception:
-        from reportlab.pdfgen import canvas
-        from io import BytesIO
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer)
-        archers = Archer.query.all()
-        p.drawString(100, 800, "Liste des archérs")
-        y = 780
-        for archer in archers:
-            archer_info = f"{archer.name} - License: {archer.license_number}"
-            if archer.age:
-                archer_info += f" - Age: {archer.age}"
-            if archer.categorie:
-                archer_info += f" - Catégorie: {archer.categorie}"
-            p.drawString(100, y, archer_info)
-            y -= 20
-            if archer.bow_type:
-                p.drawString(120, y, f"Type d'arc: {archer.bow_type}")
-                y -= 15
-            if y < 50:
-                p.showPage()
-                y = 800
-        p.showPage()
-        p.save()
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name='archers.pdf', mimetype='application/pdf')
+    query = Archer.query.order_by(Archer.id)
+
+    def render_reportlab():
+        rows = (
+            (a.name, a.license_number, a.age, a.categorie, a.bow_type)
+            for a in _export_rows(query)
+        )
+        return pdf_tables.render_table_pdf('Liste des archers', _ARCHERS_PDF_COLUMNS, rows)
+
+    return _pdf_download(
+        'archers.pdf', 'table',
+        lambda: render_template('archers_pdf.html', archers=_export_rows(query)),
+        render_reportlab,
+        engine=_pdf_table_engine(lambda: _count(Archer)),
+    )
 
 @app.route('/import_archers', methods=['GET', 'POST'])
 @login_required
@@ -4465,31 +5349,12 @@ def import_archers():
             return redirect(url_for('import_archers'))
         if file and file.filename.endswith('.csv'):
             try:
-                raw = file.stream.read()
-                content = _decode_csv_bytes(raw)
-                delim = _detect_csv_delimiter(content)
-                lines = content.splitlines()
-                if not lines:
-                    return render_template(
-                        'import_archers.html',
-                        error='Le fichier CSV est vide ou mal formaté',
-                    )
-                header_reader = csv.reader(StringIO(lines[0]), delimiter=delim, quotechar='"')
                 try:
-                    header_cells = next(header_reader)
-                except StopIteration:
-                    return render_template(
-                        'import_archers.html',
-                        error='Le fichier CSV est vide ou mal formaté',
-                    )
-                fieldnames = _make_unique_csv_fieldnames(header_cells)
-                body = '\n'.join(lines[1:])
-                stream = StringIO(body, newline=None)
-                csv_reader = csv.DictReader(
-                    stream, fieldnames=fieldnames, delimiter=delim, quotechar='"'
-                )
+                    upload = CsvUpload(file.stream)
+                except CsvImportError as e:
+                    return render_template('import_archers.html', error=str(e))
+                fieldnames = upload.fieldnames
 
-                imported = 0
                 errors = []
                 
                 def clean_key(key):
@@ -4580,7 +5445,7 @@ def import_archers():
                     re.I,
                 )
 
-                for row_num, row in enumerate(csv_reader, start=2):
+                def import_row(row_num, row):
                     try:
                         license_number = find_column(
                             row,
@@ -4687,12 +5552,12 @@ def import_archers():
                                 for k in row
                                 if k is not None
                             ):
-                                continue
+                                return False
                             errors.append(
                                 f"Ligne {row_num}: Code adhérent et Nom sont obligatoires "
                                 f"(reçu: code='{license_number}', nom='{last_name}')"
                             )
-                            continue
+                            return False
                         
                         # Calculer l'âge à partir de la date de naissance
                         age = None
@@ -4718,7 +5583,7 @@ def import_archers():
                                 existing.categorie = categorie
                             if email_val is not None:
                                 existing.email = email_val
-                            imported += 1
+                            return True
                         else:
                             # Créer un nouvel archer
                             archer = Archer(
@@ -4730,11 +5595,16 @@ def import_archers():
                                 categorie=categorie if categorie else None
                             )
                             db.session.add(archer)
-                            imported += 1
+                            return True
+                    except SQLAlchemyError:
+                        raise
                     except Exception as e:
                         errors.append(f"Ligne {row_num}: Erreur - {str(e)}")
                 
-                db.session.commit()
+                imported, _ = import_in_batches(
+                    db.session, upload, import_row,
+                    batch_size=app.config['IMPORT_BATCH_SIZE'], errors=errors,
+                )
                 return render_template('import_archers.html', 
                                      success=True,
                                      imported=imported,
@@ -4758,29 +5628,11 @@ def import_composites():
             return redirect(url_for('import_composites'))
         if file and file.filename.endswith('.csv'):
             try:
-                raw = file.stream.read()
-                content = _decode_csv_bytes(raw)
-                delim = _detect_csv_delimiter(content)
-                lines = content.splitlines()
-                if not lines:
-                    return render_template(
-                        'import_composites.html',
-                        error='Le fichier CSV est vide ou mal formaté',
-                    )
-                header_reader = csv.reader(StringIO(lines[0]), delimiter=delim, quotechar='"')
                 try:
-                    header_cells = next(header_reader)
-                except StopIteration:
-                    return render_template(
-                        'import_composites.html',
-                        error='Le fichier CSV est vide ou mal formaté',
-                    )
-                fieldnames = _make_unique_csv_fieldnames(header_cells)
-                body = '\n'.join(lines[1:])
-                stream = StringIO(body, newline=None)
-                csv_reader = csv.DictReader(
-                    stream, fieldnames=fieldnames, delimiter=delim, quotechar='"'
-                )
+                    upload = CsvUpload(file.stream)
+                except CsvImportError as e:
+                    return render_template('import_composites.html', error=str(e))
+                fieldnames = upload.fieldnames
 
                 def normalize_header_for_match(s):
                     if s is None:
@@ -4815,15 +5667,15 @@ def import_composites():
                                 return cell_value(row_dict, key)
                     return ''
 
-                imported = 0
                 errors = []
                 notices = []
                 missing_export_arc_ids = 0
 
-                for row_num, row in enumerate(csv_reader, start=2):
+                def import_row(row_num, row):
+                    nonlocal missing_export_arc_ids
                     try:
                         if not any(cell_value(row, k).strip() for k in row if k is not None):
-                            continue
+                            return False
 
                         id_raw = find_column(row, 'ID', 'Id').strip()
                         name = find_column(row, 'Nom', 'Name', 'Référence', 'Reference').strip()
@@ -4836,7 +5688,7 @@ def import_composites():
                                 f"Ligne {row_num}: le nom de l'arc est obligatoire "
                                 f"(reçu: « {name} »)"
                             )
-                            continue
+                            return False
 
                         ctype = _normalize_composite_type_import(type_raw)
                         status = _normalize_composite_status_import(status_raw)
@@ -4849,7 +5701,7 @@ def import_composites():
                                 cid = int(id_raw)
                             except ValueError:
                                 errors.append(f"Ligne {row_num}: ID arc invalide « {id_raw} »")
-                                continue
+                                return False
                             if not CompositeProduct.query.get(cid):
                                 missing_export_arc_ids += 1
                                 cid = None
@@ -4940,13 +5792,18 @@ def import_composites():
                                             'status': comp.status,
                                         },
                                     )
-                                imported += 1
+                                return True
                         except Exception as e:
                             errors.append(f"Ligne {row_num}: {str(e)}")
+                    except SQLAlchemyError:
+                        raise
                     except Exception as e:
                         errors.append(f"Ligne {row_num}: {str(e)}")
 
-                db.session.commit()
+                imported, _ = import_in_batches(
+                    db.session, upload, import_row,
+                    batch_size=app.config['IMPORT_BATCH_SIZE'], errors=errors,
+                )
                 if missing_export_arc_ids:
                     notices.insert(
                         0,
@@ -4974,18 +5831,14 @@ def import_composites():
 @app.route('/export_products_csv')
 @login_required
 @require_permission('view_equipment')
+@conditional_get(*EQUIPMENT_TABLES, daily=True)
+@cached_export(*EQUIPMENT_TABLES)
 def export_products_csv():
-    from io import BytesIO
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Headers
-    writer.writerow(['ID', 'Catégorie', 'Marque', 'Modèle', 'Taille', 'Puissance', 'État', 'Lieu', 'Commentaires'])
-    
-    # Data
-    prods = Product.query.join(Category).order_by(Category.name, Product.brand).all()
-    for prod in prods:
-        writer.writerow([
+    prods = _export_rows(
+        Product.query.join(Category).options(joinedload(Product.category)).order_by(Category.name, Product.brand)
+    )
+    rows = (
+        [
             prod.id,
             prod.category.name if prod.category else '',
             prod.brand or '',
@@ -4995,31 +5848,23 @@ def export_products_csv():
             prod.state or '',
             prod.location or '',
             prod.comments or ''
-        ])
-    
-    buffer = BytesIO(output.getvalue().encode('utf-8-sig'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'produits_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+        ]
+        for prod in prods
+    )
+    return _stream_csv(
+        f'produits_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['ID', 'Catégorie', 'Marque', 'Modèle', 'Taille', 'Puissance', 'État', 'Lieu', 'Commentaires'],
+        rows,
     )
 
 @app.route('/export_archers_csv')
 @login_required
+@conditional_get('archer', daily=True)
+@cached_export('archer')
 def export_archers_csv():
-    from io import BytesIO
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Headers
-    writer.writerow(['ID', 'Prénom', 'Nom', 'Email', 'Numéro Licence', 'Âge', 'Catégorie', 'Type d\'arc', 'Personnel', 'Archer'])
-    
-    # Data
-    archers = Archer.query.all()
-    for archer in archers:
-        writer.writerow([
+    archers = _export_rows(Archer.query.order_by(Archer.id))
+    rows = (
+        [
             archer.id,
             archer.first_name or '',
             archer.last_name or '',
@@ -5030,59 +5875,47 @@ def export_archers_csv():
             archer.bow_type or '',
             'Oui' if getattr(archer, 'personal_equipment', None) else 'Non',
             'Oui' if getattr(archer, 'is_archer', None) else 'Non'
-        ])
-    
-    buffer = BytesIO(output.getvalue().encode('utf-8-sig'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'archers_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+        ]
+        for archer in archers
+    )
+    return _stream_csv(
+        f'archers_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['ID', 'Prénom', 'Nom', 'Email', 'Numéro Licence', 'Âge', 'Catégorie', 'Type d\'arc', 'Personnel', 'Archer'],
+        rows,
     )
 
 @app.route('/export_composites_csv')
 @login_required
+@conditional_get(*EQUIPMENT_TABLES, daily=True)
+@cached_export(*EQUIPMENT_TABLES)
 def export_composites_csv():
-    from io import BytesIO
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Headers
-    writer.writerow(['ID', 'Nom', 'Type', 'Statut', 'Composants'])
-    
-    # Data
-    comps = CompositeProduct.query.all()
-    for comp in comps:
-        components_str = ' | '.join([f"{p.brand} ({p.category.name})" for p in comp.components])
-        writer.writerow([
+    comps = _export_rows(
+        CompositeProduct.query.options(
+            selectinload(CompositeProduct.components).joinedload(Product.category)
+        ).order_by(CompositeProduct.id)
+    )
+    rows = (
+        [
             comp.id,
             comp.name or '',
             comp.type or '',
             comp.status or '',
-            components_str
-        ])
-    
-    buffer = BytesIO(output.getvalue().encode('utf-8-sig'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'arcs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+            ' | '.join([f"{p.brand} ({p.category.name})" for p in comp.components])
+        ]
+        for comp in comps
+    )
+    return _stream_csv(
+        f'arcs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['ID', 'Nom', 'Type', 'Statut', 'Composants'],
+        rows,
     )
 
 @app.route('/export_assignments_csv')
 @login_required
 @require_permission('view_assignments')
+@conditional_get(*EQUIPMENT_TABLES, *LOAN_TABLES, daily=True)
+@cached_export(*EQUIPMENT_TABLES, *LOAN_TABLES)
 def export_assignments_csv():
-    from io import BytesIO
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Headers
-    writer.writerow(['ID', 'Type', 'Archer', 'Matériel', 'Date d\'assignation', 'Date de retour', 'Durée (jours)', 'Statut'])
-
     def _row(ass, kind, label):
         duration = ''
         status = 'Actif'
@@ -5091,7 +5924,7 @@ def export_assignments_csv():
             status = 'Retourné'
         else:
             duration = (datetime.now().date() - ass.date_assigned.date()).days if isinstance(ass.date_assigned, datetime) else ''
-        writer.writerow([
+        return [
             ass.id,
             kind,
             f"{ass.archer.first_name} {ass.archer.last_name}" if ass.archer else '',
@@ -5100,37 +5933,40 @@ def export_assignments_csv():
             ass.date_returned.strftime('%d/%m/%Y') if ass.date_returned else '',
             duration,
             status
-        ])
+        ]
 
-    for ass in Assignment.query.all():
-        _row(ass, 'Arc', ass.composite.name if ass.composite else '')
-    for pa in ProductAssignment.query.all():
-        _row(pa, 'Produit', _product_label(pa.product))
-    
-    buffer = BytesIO(output.getvalue().encode('utf-8-sig'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'assignations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+    def _rows():
+        bow_loans = Assignment.query.options(
+            joinedload(Assignment.archer), joinedload(Assignment.composite)
+        ).order_by(Assignment.id)
+        for ass in _export_rows(bow_loans):
+            yield _row(ass, 'Arc', ass.composite.name if ass.composite else '')
+        product_loans = ProductAssignment.query.options(
+            joinedload(ProductAssignment.archer),
+            joinedload(ProductAssignment.product).joinedload(Product.category),
+        ).order_by(ProductAssignment.id)
+        for pa in _export_rows(product_loans):
+            yield _row(pa, 'Produit', _product_label(pa.product))
+
+    return _stream_csv(
+        f'assignations_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['ID', 'Type', 'Archer', 'Matériel', 'Date d\'assignation', 'Date de retour', 'Durée (jours)', 'Statut'],
+        _rows(),
     )
 
 @app.route('/export_categories_csv')
 @login_required
 @require_permission('view_equipment')
+@conditional_get('category', 'product', daily=True)
+@cached_export('category', 'product')
 def export_categories_csv():
-    from io import BytesIO
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Headers
-    writer.writerow(['ID', 'Nom', 'Taille', 'Puissance', 'Modèle', 'Marque', 'Champs personnalisés', 'Nombre de produits'])
-    
-    # Data
-    cats = Category.query.all()
-    for cat in cats:
-        writer.writerow([
+    # Nombre de produits compté en SQL : pas de chargement de `cat.products`.
+    product_count = (
+        select(func.count(Product.id)).where(Product.category_id == Category.id).scalar_subquery()
+    )
+    cats = _export_rows(db.session.query(Category, product_count).order_by(Category.id))
+    rows = (
+        [
             cat.id,
             cat.name or '',
             'Oui' if cat.has_size else 'Non',
@@ -5138,81 +5974,101 @@ def export_categories_csv():
             'Oui' if cat.has_model else 'Non',
             'Oui' if cat.has_brand else 'Non',
             cat.custom_fields or '',
-            len(cat.products)
-        ])
-    
-    buffer = BytesIO(output.getvalue().encode('utf-8-sig'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'categories_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+            count
+        ]
+        for cat, count in cats
+    )
+    return _stream_csv(
+        f'categories_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['ID', 'Nom', 'Taille', 'Puissance', 'Modèle', 'Marque', 'Champs personnalisés', 'Nombre de produits'],
+        rows,
     )
 
 @app.route('/export_courses_csv')
 @login_required
 @require_permission('view_courses')
+@conditional_get(*COURSE_TABLES, daily=True)
+@cached_export(*COURSE_TABLES)
 def export_courses_csv():
-    from io import BytesIO
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Headers
-    writer.writerow(['ID', 'Nom', 'Date', 'Heure', 'Lieu', 'Nombre d\'archers inscrits', 'Capacité', 'Statut'])
-    
-    # Data
-    courses = Course.query.all()
-    for course in courses:
-        writer.writerow([
+    weekday_names = ['lundi','mardi','mercredi','jeudi','vendredi','samedi','dimanche']
+    courses = _export_rows(Course.query.options(selectinload(Course.archers)).order_by(Course.id))
+    # Colonnes du modèle Course (cours hebdomadaire) : l'export ne peut plus échouer au milieu du flux.
+    rows = (
+        [
             course.id,
             course.name or '',
-            course.date.strftime('%d/%m/%Y') if hasattr(course, 'date') and course.date else '',
-            course.time.strftime('%H:%M') if hasattr(course, 'time') and course.time else '',
-            course.location or '',
-            len(course.archers) if hasattr(course, 'archers') else 0,
-            getattr(course, 'capacity', ''),
-            'Actif' if not hasattr(course, 'cancelled') or not course.cancelled else 'Annulé'
-        ])
-    
-    buffer = BytesIO(output.getvalue().encode('utf-8-sig'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'cours_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+            weekday_names[course.day_of_week] if course.day_of_week is not None else '',
+            f"{course.start_time}-{course.end_time}" if course.start_time else '',
+            course.level or '',
+            len(course.archers),
+            course.max_archers or '',
+            'Actif' if course.active else 'Inactif'
+        ]
+        for course in courses
+    )
+    return _stream_csv(
+        f'cours_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['ID', 'Nom', 'Jour', 'Horaire', 'Niveau', 'Nombre d\'archers inscrits', 'Capacité', 'Statut'],
+        rows,
     )
 
 @app.route('/export_users_csv')
 @login_required
 @require_permission('admin')
+@conditional_get('user', daily=True)
+@cached_export('user')
 def export_users_csv():
-    from io import BytesIO
-    output = StringIO()
-    writer = csv.writer(output, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    # Headers
-    writer.writerow(['ID', 'Nom d\'utilisateur', 'Rôle'])
-    
-    # Data
-    all_users = User.query.all()
-    for user in all_users:
-        writer.writerow([
-            user.id,
-            user.username or '',
-            user.role or ''
-        ])
-    
-    buffer = BytesIO(output.getvalue().encode('utf-8-sig'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'utilisateurs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+    all_users = _export_rows(User.query.order_by(User.id))
+    rows = ([user.id, user.username or '', user.role or ''] for user in all_users)
+    return _stream_csv(
+        f'utilisateurs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        ['ID', 'Nom d\'utilisateur', 'Rôle'],
+        rows,
     )
 
+def _csv_export_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Oui' if value else 'Non'
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%d/%m/%Y')
+    return value
+
+
+@app.route('/export/<dataset>')
+@login_required
+def export_dataset(dataset):
+    """Export filtré (mêmes filtres que les listes) limité aux colonnes demandées — voir exports.py."""
+    if dataset not in exports.DATASETS:
+        abort(404)
+    file_prefix, permission, _columns, _query = exports.DATASETS[dataset]
+    if not getattr(current_user, f'can_{permission}')():
+        flash('Vous n\'avez pas la permission pour exporter ces données.', 'error')
+        return redirect(url_for('index'))
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        abort(400, description=f"Format inconnu : {fmt} (csv ou jsonl)")
+    try:
+        keys = exports.parse_columns(dataset, request.args.getlist('columns'))
+    except ValueError as exc:
+        abort(400, description=str(exc))
+
+    def build():
+        stmt = exports.export_query(dataset, keys, request.args)
+        rows = db.session.execute(stmt.execution_options(yield_per=app.config['EXPORT_YIELD_PER']))
+        download_name = f'{file_prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{fmt}'
+        if fmt == 'jsonl':
+            return _stream_jsonl(download_name, keys, rows)
+        return _stream_csv(
+            download_name,
+            exports.headers(dataset, keys),
+            ([_csv_export_value(v) for v in row] for row in rows),
+        )
+
+    # Après les contrôles : le cache ne sert que des utilisateurs autorisés.
+    return export_cache.serve(exports.DATASET_TABLES[dataset], build)
+
 # Routes de gestion des utilisateurs (Admin only)
 @app.route('/users')
 @login_required
@@ -5254,6 +6110,67 @@ def login_history():
     )
 
 
+@app.route('/perf')
+@login_required
+@require_permission('admin')
+def perf_log():
+    entries = perf.recent_requests()
+    sort = request.args.get('sort')
+    if sort in ('total_ms', 'queries', 'sql_ms', 'template_ms'):
+        entries = sorted(entries, key=lambda e: e[sort], reverse=True)
+    return render_template(
+        'perf_log.html',
+        entries=entries,
+        enabled=app.config.get('PERF_INSTRUMENTATION'),
+        current_sort=sort,
+    )
+
+
+@app.route('/perf/requetes-lentes')
+@login_required
+@require_permission('admin')
+def slow_query_log():
+    order = 'slowest' if request.args.get('sort') == 'slowest' else 'recent'
+    return render_template(
+        'slow_queries.html',
+        entries=slow_queries.slow_query_log.entries(limit=200, order=order),
+        threshold_ms=app.config.get('SLOW_QUERY_THRESHOLD_MS'),
+        current_sort=order,
+    )
+
+
+@app.route('/perf/requetes-lentes/vider', methods=['POST'])
+@login_required
+@require_permission('admin')
+def clear_slow_query_log():
+    slow_queries.slow_query_log.clear()
+    flash('Journal des requêtes lentes vidé.', 'success')
+    return redirect(url_for('slow_query_log'))
+
+
+def _metrics_scrape_allowed():
+    """Jeton `Authorization: Bearer <METRICS_TOKEN>`, sinon appel direct depuis METRICS_ALLOWED_IPS.
+
+    Derrière le reverse proxy toutes les requêtes arrivent de 127.0.0.1 : un appel
+    portant X-Forwarded-For vient donc de l'extérieur et exige le jeton.
+    """
+    token = app.config.get('METRICS_TOKEN')
+    if token:
+        auth = request.headers.get('Authorization') or ''
+        if auth.startswith('Bearer ') and hmac.compare_digest(auth[7:].strip(), token):
+            return True
+    if request.headers.get('X-Forwarded-For'):
+        return False
+    return (request.remote_addr or '') in app.config['METRICS_ALLOWED_IPS']
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    if not app.config.get('METRICS_ENABLED') or not _metrics_scrape_allowed():
+        abort(404)
+    return Response(metrics.store.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/add_user', methods=['GET', 'POST'])
 @login_required
 @require_permission('admin')
@@ -5741,6 +6658,129 @@ def seed_demo_command(club_name):
         )
 
 
+@app.cli.command('seed-synthetic')
+@click.option('--archers', default=200, show_default=True, help="Nombre d'archers à créer.")
+@click.option('--products', default=400, show_default=True, help='Nombre de produits à créer (une partie est montée en arcs).')
+@click.option('--years', default=3, show_default=True, help="Saisons d'activité simulées (prêts, présences, inscriptions).")
+@click.option('--seed', type=int, default=None, help='Graine aléatoire (jeu reproductible).')
+@click.option('--batch-size', default=5000, show_default=True, help='Lignes par INSERT groupé.')
+def seed_synthetic_command(archers, products, years, seed, batch_size):
+    """Ajoute un jeu de données synthétique à l'échelle voulue (banc d'essai, charge)."""
+    from seed_synthetic import seed_synthetic_data
+
+    with app.app_context():
+        counts = seed_synthetic_data(archers, products, years, seed=seed, batch_size=batch_size)
+        click.echo(
+            f"{counts['rows']} lignes ajoutées en {counts['seconds']} s : "
+            f"{counts['archers']} archers, {counts['products']} produits, "
+            f"{counts['composites']} arcs, {counts['assignments']} prêts d'arcs, "
+            f"{counts['product_assignments']} prêts de produits, {counts['courses']} cours, "
+            f"{counts['attendance']} présences, {counts['inscription_events']} événements, "
+            f"{counts['inscription_registrations']} inscriptions, {counts['history']} entrées d'historique."
+        )
+
+
+alerts_cli = click.Group('alerts', help='Alertes matériel (arcs à vérifier, prêts en retard).')
+app.cli.add_command(alerts_cli)
+
+
+@alerts_cli.command('refresh')
+@click.option('--email', is_flag=True, help='Envoie le récapitulatif à ALERTS_MAIL_RECIPIENTS.')
+def alerts_refresh_command(email):
+    """Recalcule la table des alertes (à planifier en cron, ex. chaque nuit)."""
+    with app.app_context():
+        counts = alerts.refresh_alerts()
+        click.echo(', '.join(
+            f"{label} : {counts[kind]}" for kind, label in alerts.KIND_LABELS.items()
+        ))
+        if not email:
+            return
+        recipients = alerts.mail_recipients()
+        if not recipients:
+            click.echo('ALERTS_MAIL_RECIPIENTS vide — aucun email envoyé.', err=True)
+            return
+        sent = send_alerts_digest(
+            alerts.alerts_for_digest(), recipients, alerts.KIND_LABELS
+        )
+        click.echo(f'{sent} email(s) envoyé(s).')
+
+
+perf_cli = click.Group('perf', help='Diagnostic des performances.')
+app.cli.add_command(perf_cli)
+
+
+@perf_cli.command('slow-queries')
+@click.option('--limit', default=20, show_default=True, help='Nombre de requêtes affichées.')
+@click.option('--min-ms', default=0.0, help='Durée minimale (ms).')
+@click.option('--slowest', is_flag=True, help='Les plus lentes d\'abord (sinon les plus récentes).')
+@click.option('--plan/--no-plan', default=True, help='Affiche le plan EXPLAIN.')
+@click.option('--clear', is_flag=True, help='Vide le journal après affichage.')
+def perf_slow_queries_command(limit, min_ms, slowest, plan, clear):
+    """Requêtes SQL ayant dépassé SLOW_QUERY_THRESHOLD_MS."""
+    with app.app_context():
+        log = slow_queries.slow_query_log
+        entries = log.entries(limit=limit, min_ms=min_ms, order='slowest' if slowest else 'recent')
+        if not entries:
+            click.echo('Aucune requête lente enregistrée.')
+        for e in entries:
+            click.echo(f"[{e['recorded_at']}] {e['duration_ms']:.1f} ms — {e['endpoint'] or 'hors requête HTTP'}")
+            click.echo(f"  {e['statement']}")
+            if e['parameters']:
+                click.echo(f"  paramètres : {e['parameters']}")
+            if plan and e['plan']:
+                for line in e['plan'].splitlines():
+                    click.echo(f"  | {line}")
+            click.echo('')
+        if clear:
+            log.clear()
+            click.echo('Journal vidé.')
+
+
+snapshot_cli = click.Group('snapshot', help="Instantané complet de l'instance (export / restauration).")
+app.cli.add_command(snapshot_cli)
+
+
+@snapshot_cli.command('export')
+@click.argument('path', required=False, type=click.Path(dir_okay=False))
+@click.option('--batch-size', default=2000, show_default=True, help='Lignes lues par aller-retour.')
+def snapshot_export_command(path, batch_size):
+    """Écrit un instantané cohérent de toutes les tables (par défaut dans instance/snapshots/)."""
+    with app.app_context():
+        if not path:
+            folder = os.path.join(app.instance_path, 'snapshots')
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"aim-{datetime.now():%Y%m%d-%H%M%S}.jsonl.gz")
+        summary = snapshot.export_snapshot(db.engine, db.metadata, path, batch_size=batch_size)
+        click.echo(
+            f"{summary['rows']} lignes ({len(summary['tables'])} tables) en {summary['seconds']} s "
+            f"→ {path} ({summary['bytes'] / 1024:.0f} Kio, révision {summary['alembic_revision'] or '—'})."
+        )
+
+
+@snapshot_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help='Vide les tables de la base cible avant import.')
+@click.option('--force', is_flag=True, help='Ignore une révision de schéma différente.')
+@click.option('--batch-size', default=2000, show_default=True, help='Lignes par INSERT groupé.')
+def snapshot_import_command(path, replace, force, batch_size):
+    """Restaure un instantané (tout ou rien) dans la base configurée."""
+    with app.app_context():
+        try:
+            summary = snapshot.import_snapshot(
+                db.engine, db.metadata, path, replace=replace, force=force, batch_size=batch_size
+            )
+        except snapshot.SnapshotError as exc:
+            click.echo(f"Import annulé : {exc}", err=True)
+            raise SystemExit(1)
+        app_cache.clear()
+        for name, count in summary['tables'].items():
+            click.echo(f"  {name:<32} {count:>8}")
+        click.echo(
+            f"{summary['rows']} lignes importées en {summary['seconds']} s "
+            f"(instantané {summary['source_dialect']}, révision {summary['alembic_revision'] or '—'})."
+        )
+
+
 if __name__ == '__main__':
     import os
     # Default port handling: respect $PORT if set, otherwise
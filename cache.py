@@ -0,0 +1,257 @@
+"""Cache applicatif à deux niveaux, partagé entre les workers gunicorn.
+
+1. LRU en mémoire du processus (CACHE_LRU_SIZE entrées) ;
+2. fichier SQLite `instance/cache.db` (CACHE_PATH), commun à tous les workers.
+
+Chaque entrée porte des tags de dépendance ('products', 'composites',
+'archers'…). Au commit d'une transaction, les tables écrites (relevées par
+data_versions.py) sont traduites en tags via TABLE_TAGS et la version de ces
+tags est incrémentée dans le fichier partagé : toute entrée enregistrée avec
+une version plus ancienne est ignorée, dans tous les workers. Les entrées
+expirées sont supprimées du fichier au plus une fois par CACHE_PRUNE_INTERVAL
+secondes et par processus, lors d'une écriture.
+
+Usage :
+    summary = app_cache.get_or_set(f'composite_summary:{comp.id}', ('composites',),
+                                   lambda: _compute(comp))
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_app_context
+from sqlalchemy import event
+
+import metrics
+from data_versions import CODE_FINGERPRINT, TOUCHED_TABLES_KEY
+
+# Table écrite → tags à invalider.
+TABLE_TAGS = {
+    'category': ('categories', 'products', 'composites'),
+    'product': ('products', 'composites'),
+    'composite_product': ('composites',),
+    'composite_components': ('composites', 'products'),
+    'assignment': ('loans', 'composites'),
+    'product_assignment': ('loans', 'products'),
+    'archer': ('archers', 'loans'),
+    'archer_courses': ('archers', 'courses'),
+    'course': ('courses',),
+    'attendance': ('courses',),
+    'inscription_event': ('inscriptions',),
+    'inscription_event_registration': ('inscriptions',),
+}
+
+_MISS = object()
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cache_entry ("
+    " key TEXT PRIMARY KEY, value BLOB NOT NULL, tags TEXT NOT NULL,"
+    " tag_versions TEXT NOT NULL, expires_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS cache_tag (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_cache_entry_expires_at ON cache_entry (expires_at)",
+)
+
+
+class TwoTierCache:
+    def __init__(self):
+        self.path = None
+        self.enabled = False
+        self.default_ttl = 3600
+        self.max_entries = 512
+        self.prune_interval = 3600
+        self._last_prune = time.monotonic()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def init_app(self, app):
+        cfg = app.config
+        self.enabled = cfg.get('CACHE_ENABLED', True)
+        self.path = cfg.get('CACHE_PATH') or os.path.join(app.instance_path, 'cache.db')
+        self.default_ttl = cfg.get('CACHE_DEFAULT_TTL', 3600)
+        self.max_entries = cfg.get('CACHE_LRU_SIZE', 512)
+        self.prune_interval = cfg.get('CACHE_PRUNE_INTERVAL', 3600)
+
+    # -- fichier partagé ---------------------------------------------------
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        # Jamais de connexion héritée d'un fork (gunicorn --preload) : une par processus.
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for ddl in _SCHEMA:
+                conn.execute(ddl)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _tag_versions(self, tags):
+        """Versions courantes des tags (mémorisées pour la durée de la requête)."""
+        if not tags:
+            return ()
+        memo = g.setdefault('_cache_tag_versions', {}) if has_app_context() else {}
+        missing = [t for t in tags if t not in memo]
+        if missing:
+            rows = dict(self._conn().execute(
+                f"SELECT tag, version FROM cache_tag WHERE tag IN ({','.join('?' * len(missing))})",
+                missing,
+            ).fetchall())
+            for t in missing:
+                memo[t] = rows.get(t, 0)
+        return tuple(memo[t] for t in tags)
+
+    def invalidate_tags(self, tags):
+        tags = sorted(set(tags))
+        if not tags or not self.enabled:
+            return
+        try:
+            self._conn().executemany(
+                "INSERT INTO cache_tag (tag, version) VALUES (?, 1)"
+                " ON CONFLICT(tag) DO UPDATE SET version = version + 1",
+                [(t,) for t in tags],
+            )
+        except sqlite3.Error:
+            # Les entrées concernées resteront servies jusqu'à leur TTL : on le signale.
+            logger.exception("Invalidation du cache impossible pour %s", tags)
+        if has_app_context():
+            g.pop('_cache_tag_versions', None)
+
+    # -- API -------------------------------------------------------------------
+
+    def _key(self, key):
+        return f"{CODE_FINGERPRINT}:{key}"
+
+    def get(self, key, default=None):
+        if not self.enabled:
+            return default
+        try:
+            return self._get(self._key(key), default)
+        except sqlite3.Error:
+            logger.warning("Lecture du cache partagé impossible (%s)", key, exc_info=True)
+            return default
+
+    def _get(self, key, default):
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+        if entry is not None:
+            value, tags, versions, expires_at = entry
+            if expires_at > now and self._tag_versions(tags) == versions:
+                metrics.inc('aim_cache_requests_total', result='hit', tier='memory')
+                return value
+            with self._lock:
+                self._lru.pop(key, None)
+        row = self._conn().execute(
+            "SELECT value, tags, tag_versions, expires_at FROM cache_entry WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            metrics.inc('aim_cache_requests_total', result='miss', tier='shared')
+            return default
+        blob, tags_raw, versions_raw, expires_at = row
+        tags = tuple(t for t in tags_raw.split(',') if t)
+        versions = tuple(int(v) for v in versions_raw.split(',') if v)
+        if expires_at <= now or self._tag_versions(tags) != versions:
+            metrics.inc('aim_cache_requests_total', result='miss', tier='shared')
+            return default
+        value = pickle.loads(blob)
+        self._remember(key, value, tags, versions, expires_at)
+        metrics.inc('aim_cache_requests_total', result='hit', tier='shared')
+        return value
+
+    def set(self, key, value, tags=(), ttl=None):
+        if not self.enabled:
+            return
+        key = self._key(key)
+        tags = tuple(sorted(set(tags)))
+        try:
+            versions = self._tag_versions(tags)
+        except sqlite3.Error:
+            logger.warning("Lecture des tags du cache impossible (%s)", key, exc_info=True)
+            return
+        expires_at = time.time() + (ttl or self.default_ttl)
+        self._remember(key, value, tags, versions, expires_at)
+        try:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO cache_entry (key, value, tags, tag_versions, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ','.join(tags),
+                 ','.join(str(v) for v in versions), expires_at),
+            )
+        except sqlite3.Error:
+            logger.warning("Écriture du cache partagé impossible (%s)", key, exc_info=True)
+        self._maybe_prune()
+
+    def get_or_set(self, key, tags, producer, ttl=None):
+        value = self.get(key, _MISS)
+        if value is _MISS:
+            value = producer()
+            self.set(key, value, tags, ttl)
+        return value
+
+    def prune(self):
+        """Supprime les entrées expirées du fichier partagé ; renvoie leur nombre."""
+        cur = self._conn().execute("DELETE FROM cache_entry WHERE expires_at <= ?", (time.time(),))
+        return cur.rowcount
+
+    def _maybe_prune(self):
+        if self.prune_interval <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune < self.prune_interval:
+                return
+            self._last_prune = now
+        try:
+            removed = self.prune()
+        except sqlite3.Error:
+            # Fichier occupé par un autre worker : on retentera au prochain intervalle.
+            logger.warning("Purge du cache partagé impossible", exc_info=True)
+            return
+        if removed:
+            logger.info("Cache partagé : %d entrée(s) expirée(s) supprimée(s)", removed)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+        self._conn().execute("DELETE FROM cache_entry")
+
+    def _remember(self, key, value, tags, versions, expires_at):
+        with self._lock:
+            self._lru[key] = (value, tags, versions, expires_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+
+app_cache = TwoTierCache()
+
+
+def _after_commit(session):
+    tables = session.info.pop(TOUCHED_TABLES_KEY, None)
+    if not tables:
+        return
+    tags = {tag for table in tables for tag in TABLE_TAGS.get(table, ())}
+    app_cache.invalidate_tags(tags)
+
+
+def _after_rollback(session):
+    session.info.pop(TOUCHED_TABLES_KEY, None)
+
+
+def install_cache_invalidation(db):
+    event.listen(db.session, 'after_commit', _after_commit)
+    event.listen(db.session, 'after_rollback', _after_rollback)
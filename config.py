@@ -29,11 +29,53 @@ def _env_int(name, default):
         return default
 
 
+def _env_choice(name, default, choices):
+    """Valeur parmi `choices` (insensible à la casse) ; ValueError au chargement sinon."""
+    v = (os.environ.get(name) or '').strip().upper() or default
+    if v not in choices:
+        raise ValueError(f"{name}={v!r} invalide (valeurs possibles : {', '.join(choices)})")
+    return v
+
+
+def _engine_options(database_uri):
+    """Options du moteur SQLAlchemy selon la base (SQLite : cf. SQLITE_* / db_profiles.py).
+
+    Postgres : pool par worker gunicorn (3 workers × (PG_POOL_SIZE + PG_MAX_OVERFLOW)
+    connexions au maximum), connexions vérifiées avant usage et recyclées, et
+    `statement_timeout` côté serveur pour qu'une requête bloquée libère le worker.
+    """
+    if not database_uri.startswith(('postgresql', 'postgres://')):
+        return {}
+    options = {
+        'pool_size': _env_int('PG_POOL_SIZE', 5),
+        'max_overflow': _env_int('PG_MAX_OVERFLOW', 5),
+        'pool_timeout': _env_int('PG_POOL_TIMEOUT', 10),
+        'pool_recycle': _env_int('PG_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+    statement_timeout = _env_int('PG_STATEMENT_TIMEOUT_MS', 30000)
+    if statement_timeout > 0:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'change-this-to-a-random-secret-key'
     # DATABASE_URL dans `.env` par instance (chemin SQLite ou Postgres dédié).
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or ("sqlite:///" + _sqlite_path)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+    # Taille des lots lus par les exports CSV / PDF (curseur côté serveur sous Postgres).
+    EXPORT_YIELD_PER = _env_int('EXPORT_YIELD_PER', 500)
+    # Taille des blocs envoyés par les exports CSV en flux (octets).
+    EXPORT_CSV_CHUNK_SIZE = _env_int('EXPORT_CSV_CHUNK_SIZE', 64 * 1024)
+    # Imports CSV (archers, arcs) : lignes validées par commit ; le verrou d'écriture n'est tenu que le temps d'un lot.
+    IMPORT_BATCH_SIZE = _env_int('IMPORT_BATCH_SIZE', 500)
+    # Cache disque des exports rendus (export_cache.py), clé = export + paramètres + versions des tables.
+    EXPORT_CACHE_ENABLED = _env_bool('EXPORT_CACHE_ENABLED', True)
+    EXPORT_CACHE_PATH = os.environ.get('EXPORT_CACHE_PATH') or os.path.join(_instance_dir, 'exports')
+    EXPORT_CACHE_MAX_FILES = _env_int('EXPORT_CACHE_MAX_FILES', 200)
+    EXPORT_CACHE_MAX_AGE_HOURS = _env_int('EXPORT_CACHE_MAX_AGE_HOURS', 168)
 
     # Flask-Mail — définir dans `.env` (voir `.env.example`)
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.gmail.com'
@@ -44,4 +86,58 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD') or None
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or None
     # 0/1 pour Flask-Mail (journal SMTP sur stderr, utile avec scripts/send_test_mail.py --verbose)
-    MAIL_DEBUG = int(_env_bool('MAIL_DEBUG', False))
\ No newline at end of file
+    MAIL_DEBUG = int(_env_bool('MAIL_DEBUG', False))
+
+    # Profil SQLite appliqué à chaque connexion (db_profiles.py) : WAL + attente du verrou
+    # plutôt que « database is locked » quand plusieurs workers gunicorn écrivent.
+    SQLITE_PROFILE_ENABLED = _env_bool('SQLITE_PROFILE_ENABLED', True)
+    SQLITE_JOURNAL_MODE = _env_choice(
+        'SQLITE_JOURNAL_MODE', 'WAL', ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF')
+    )
+    SQLITE_BUSY_TIMEOUT_MS = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_MMAP_SIZE = _env_int('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)
+    SQLITE_CACHE_SIZE = _env_int('SQLITE_CACHE_SIZE', -16000)  # négatif = en Kio (≈ 16 Mo)
+    SQLITE_TEMP_STORE = os.environ.get('SQLITE_TEMP_STORE') or 'MEMORY'
+    SQLITE_OPTIMIZE_INTERVAL = _env_int('SQLITE_OPTIMIZE_INTERVAL', 3600)  # secondes, 0 = jamais
+
+    # Cache à deux niveaux (cache.py) : LRU par worker + fichier SQLite partagé sous instance/.
+    CACHE_ENABLED = _env_bool('CACHE_ENABLED', True)
+    CACHE_PATH = os.environ.get('CACHE_PATH') or os.path.join(_instance_dir, 'cache.db')
+    CACHE_DEFAULT_TTL = _env_int('CACHE_DEFAULT_TTL', 3600)  # secondes
+    CACHE_LRU_SIZE = _env_int('CACHE_LRU_SIZE', 512)
+    CACHE_PRUNE_INTERVAL = _env_int('CACHE_PRUNE_INTERVAL', 3600)  # secondes, 0 = jamais
+
+    # Instrumentation par requête (perf.py) : en-tête Server-Timing + journal /perf (admin).
+    PERF_INSTRUMENTATION = _env_bool('PERF_INSTRUMENTATION', False)
+    PERF_LOG_SIZE = _env_int('PERF_LOG_SIZE', 200)
+    PERF_SLOWEST_STATEMENTS = _env_int('PERF_SLOWEST_STATEMENTS', 5)
+
+    # Journal des requêtes SQL lentes (slow_queries.py) : seuil en ms (0 = désactivé), taille de la table circulaire.
+    SLOW_QUERY_THRESHOLD_MS = _env_int('SLOW_QUERY_THRESHOLD_MS', 250)
+    SLOW_QUERY_LOG_SIZE = _env_int('SLOW_QUERY_LOG_SIZE', 500)
+    SLOW_QUERY_PATH = os.environ.get('SLOW_QUERY_PATH') or os.path.join(_instance_dir, 'perf.db')
+
+    # Métriques Prometheus sur /metrics (metrics.py), cumulées entre workers dans instance/metrics.db.
+    METRICS_ENABLED = _env_bool('METRICS_ENABLED', True)
+    METRICS_PATH = os.environ.get('METRICS_PATH') or os.path.join(_instance_dir, 'metrics.db')
+    METRICS_FLUSH_INTERVAL = _env_int('METRICS_FLUSH_INTERVAL', 5)  # secondes
+    # Accès : jeton Bearer, sinon appel direct (sans proxy) depuis ces adresses.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+    METRICS_ALLOWED_IPS = [
+        ip.strip() for ip in (os.environ.get('METRICS_ALLOWED_IPS') or '127.0.0.1,::1').split(',') if ip.strip()
+    ]
+
+    # Rendu PDF (pdf_rendering.py) : rendu d'amorce à la première requête de chaque worker.
+    PDF_WARMUP = _env_bool('PDF_WARMUP', True)
+    # Exports PDF tabulaires : au-delà de ce nombre de lignes, moteur reportlab (pdf_tables.py) plutôt que WeasyPrint.
+    PDF_TABLE_ENGINE_THRESHOLD = _env_int('PDF_TABLE_ENGINE_THRESHOLD', 1000)
+
+    # Alertes (alerts.py, `flask alerts refresh`) — seuils en jours.
+    VERIFICATION_INTERVAL_DAYS = _env_int('VERIFICATION_INTERVAL_DAYS', 365)
+    LOAN_OVERDUE_DAYS = _env_int('LOAN_OVERDUE_DAYS', 120)
+    # Sans cron seulement : âge max. de la table avant recalcul en arrière-plan à l'ouverture
+    # du tableau de bord (un recalcul possible par worker). 0 = cron uniquement (défaut).
+    ALERTS_MAX_AGE_MINUTES = _env_int('ALERTS_MAX_AGE_MINUTES', 0)
+    # Destinataires du récapitulatif (`flask alerts refresh --email`), séparés par des virgules.
+    ALERTS_MAIL_RECIPIENTS = os.environ.get('ALERTS_MAIL_RECIPIENTS') or ''
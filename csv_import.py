@@ -0,0 +1,221 @@
+"""Lecture en flux des CSV importés (/import_archers, /import_composites) et commits par lots.
+
+Le fichier envoyé n'est jamais chargé d'un bloc : il est lu par blocs de
+CHUNK_BYTES, décodé au fil de l'eau et découpé en lignes au fur et à mesure
+que `csv.DictReader` les consomme. L'encodage est choisi sur le premier bloc
+(UTF-16 avec BOM, UTF-8 avec ou sans BOM, puis Windows-1252 — le CSV classique
+d'Excel FR — et autres pages Latin) ; un fichier reconnu UTF-8 qui contient
+plus loin un octet invalide passe en Windows-1252 pour la suite. Le séparateur
+est détecté sur les premiers caractères.
+
+`import_in_batches` applique le traitement de chaque ligne et valide tous les
+IMPORT_BATCH_SIZE lignes : la mémoire reste bornée (objets relâchés à chaque
+commit) et le verrou d'écriture SQLite n'est tenu que le temps d'un lot. Une
+erreur de base (contrainte, verrou…) annule le lot en cours seulement ; elle
+est signalée avec ses numéros de ligne, les lots précédents restent acquis.
+
+    upload = CsvUpload(request.files['file'].stream)
+    imported, errors = import_in_batches(db.session, upload, handle_row,
+                                         batch_size=app.config['IMPORT_BATCH_SIZE'])
+"""
+
+from __future__ import annotations
+
+import codecs
+import csv
+import logging
+import time
+from itertools import chain
+
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BYTES = 64 * 1024
+DELIMITER_SAMPLE_CHARS = 8192
+
+# Après UTF-16 / UTF-8 : pages Latin, la dernière décode n'importe quel octet.
+_LEGACY_ENCODINGS = ('cp1252', 'cp1250', 'iso-8859-15')
+
+
+class CsvImportError(ValueError):
+    """Fichier CSV vide, sans ligne d'en-tête ou illisible en cours de lecture."""
+
+
+def detect_delimiter(sample: str) -> str:
+    """Point-virgule (Excel FR), virgule ou tabulation selon le début du fichier."""
+    sample = (sample or '').strip()
+    if not sample:
+        return ';'
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=';,\t|').delimiter
+    except csv.Error:
+        pass
+    first = sample.splitlines()[0]
+    return ',' if first.count(',') > first.count(';') else ';'
+
+
+def unique_fieldnames(headers):
+    """Évite les clés dupliquées (ex. deux colonnes « Catégorie ») qui écrasent les valeurs dans DictReader."""
+    seen = {}
+    out = []
+    for h in headers:
+        key = (h or '').strip()
+        n = seen.get(key, 0) + 1
+        seen[key] = n
+        out.append(key if n == 1 else f'{key}_{n}')
+    return out
+
+
+def _pick_encoding(head: bytes, at_eof: bool) -> str:
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return 'utf-16'  # le décodeur utf-16 lit et retire le BOM
+    # utf-8-sig lit aussi l'UTF-8 sans BOM ; un caractère coupé en fin de bloc n'est pas une erreur.
+    for encoding in ('utf-8-sig',) + _LEGACY_ENCODINGS[:-1]:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(head, final=at_eof)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return _LEGACY_ENCODINGS[-1]
+
+
+def _decoded_chunks(stream, chunk_size):
+    """Blocs de texte de `stream` ; renvoie d'abord l'encodage retenu."""
+    raw = stream.read(chunk_size)
+    chunk = stream.read(chunk_size) if raw else b''
+    encoding = _pick_encoding(raw, at_eof=not chunk)
+    yield encoding
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while raw:
+        try:
+            text = decoder.decode(raw)
+        except UnicodeDecodeError:
+            if encoding != 'utf-8-sig':
+                raise
+            # Octet non UTF-8 au-delà du premier bloc : Windows-1252 pour la fin du fichier.
+            pending, _flag = decoder.getstate()
+            encoding = 'cp1252'
+            logger.info("Import CSV : octet non UTF-8 après le premier bloc, suite lue en Windows-1252")
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            text = decoder.decode(pending + raw)
+        if text:
+            yield text
+        raw, chunk = chunk, (stream.read(chunk_size) if chunk else b'')
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _lines(chunks):
+    """Lignes (fin de ligne comprise) ; la dernière d'un bloc attend le suivant (\\r\\n coupé, ligne partielle)."""
+    pending = ''
+    for text in chunks:
+        lines = (pending + text).splitlines(keepends=True)
+        pending = lines.pop() if lines else ''
+        yield from lines
+    if pending:
+        yield pending
+
+
+class CsvUpload:
+    """CSV envoyé, lu en flux : itérer donne (numéro de ligne dans le fichier, ligne en dict)."""
+
+    def __init__(self, stream, *, chunk_size=CHUNK_BYTES):
+        chunks = _decoded_chunks(stream, chunk_size)
+        self.encoding = next(chunks)
+        first = next(chunks, '')
+        self.delimiter = detect_delimiter(first[:DELIMITER_SAMPLE_CHARS])
+        lines = _lines(chain([first], chunks))
+        # csv.reader ne lit pas d'avance : le même flux de lignes sert ensuite au DictReader.
+        header_reader = csv.reader(lines, delimiter=self.delimiter, quotechar='"')
+        header = next(header_reader, None)
+        if not header:
+            raise CsvImportError('Le fichier CSV est vide ou mal formaté')
+        self.fieldnames = unique_fieldnames(header)
+        self._header_lines = header_reader.line_num
+        self._reader = csv.DictReader(
+            lines, fieldnames=self.fieldnames, delimiter=self.delimiter, quotechar='"'
+        )
+
+    def __iter__(self):
+        try:
+            for row in self._reader:
+                yield self._header_lines + self._reader.line_num, row
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise CsvImportError(
+                f"Ligne {self._header_lines + self._reader.line_num + 1} illisible ({exc})"
+            ) from None
+
+
+def _db_error(exc) -> str:
+    return str(getattr(exc, 'orig', None) or exc).splitlines()[0]
+
+
+def import_in_batches(session, rows, handle_row, *, batch_size=500, errors=None):
+    """Appelle `handle_row(line, row)` sur chaque ligne et valide tous les `batch_size` lignes.
+
+    `handle_row` renvoie vrai si la ligne compte comme importée ; ses propres
+    erreurs (ligne incomplète…) sont à ajouter à `errors` par l'appelant. Une
+    SQLAlchemyError levée par `handle_row` ou par le commit annule le lot en
+    cours et l'import reprend au lot suivant ; un fichier illisible en cours de
+    route (CsvImportError) l'arrête après les lots déjà validés. Renvoie
+    (lignes importées, erreurs).
+    """
+    errors = [] if errors is None else errors
+    started = time.perf_counter()
+    imported = pending = size = batches = failed = 0
+    first = last = None
+
+    def commit():
+        nonlocal imported, batches
+        try:
+            session.commit()
+        except SQLAlchemyError as exc:
+            fail(exc)
+            return
+        imported += pending
+        batches += 1
+
+    def fail(exc):
+        nonlocal failed
+        session.rollback()
+        failed += 1
+        errors.append(
+            f"Lignes {first} à {last} : lot non enregistré ({_db_error(exc)}) ; "
+            f"les lots précédents sont conservés."
+        )
+
+    try:
+        for line, row in rows:
+            if first is None:
+                first = line
+            last = line
+            try:
+                if handle_row(line, row):
+                    pending += 1
+            except SQLAlchemyError as exc:
+                # Session inutilisable jusqu'au rollback : le reste du lot est perdu de toute façon.
+                fail(exc)
+                pending = size = 0
+                first = None
+                continue
+            size += 1
+            if size >= batch_size:
+                commit()
+                pending = size = 0
+                first = None
+    except CsvImportError as exc:
+        session.rollback()
+        failed += first is not None
+        errors.append(f"{exc} : import interrompu, les lignes suivantes n'ont pas été enregistrées.")
+        if first is not None:
+            errors.append(f"Lignes {first} à {last} : lot non enregistré.")
+    else:
+        if first is not None:
+            commit()
+    logger.info(
+        "Import CSV : %d ligne(s) importée(s) en %d lot(s), %d lot(s) annulé(s), %.2f s",
+        imported, batches, failed, time.perf_counter() - started,
+    )
+    return imported, errors
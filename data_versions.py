@@ -0,0 +1,192 @@
+"""Version des données par table et GET conditionnel (ETag / 304) sur les listes et exports.
+
+Chaque écriture passant par la session — flush ORM (`after_flush`) ou UPDATE /
+INSERT / DELETE groupés (`do_orm_execute`) — incrémente, dans la même
+transaction, la ligne `data_version` des tables touchées. Une page décorée par
+`@conditional_get('product', 'category', …)` lit ces compteurs (une requête) et
+répond 304 si le navigateur a déjà la version courante, sans requête ORM ni rendu.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from datetime import date, datetime, timezone
+from functools import wraps
+
+from flask import g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event, insert, inspect, select, update
+
+from models import DataVersion, db
+
+_TABLE = DataVersion.__table__
+
+# Change à chaque déploiement (templates / code) : une page déjà en cache n'est pas
+# resservie avec l'ancien gabarit. Identique pour tous les workers d'une même version.
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+def _code_fingerprint() -> str:
+    mtimes = [os.path.getmtime(os.path.join(_basedir, 'app.py'))]
+    for dirpath, _dirs, files in os.walk(os.path.join(_basedir, 'templates')):
+        mtimes.extend(os.path.getmtime(os.path.join(dirpath, f)) for f in files)
+    return str(int(max(mtimes)))
+
+
+CODE_FINGERPRINT = _code_fingerprint()
+
+
+def _bump(connection, tables):
+    tables = sorted(t for t in tables if t != _TABLE.name)
+    if not tables:
+        return
+    now = datetime.now()
+    result = connection.execute(
+        update(_TABLE)
+        .where(_TABLE.c.table_name.in_(tables))
+        .values(version=_TABLE.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == len(tables):
+        return
+    existing = set(connection.execute(
+        select(_TABLE.c.table_name).where(_TABLE.c.table_name.in_(tables))
+    ).scalars())
+    missing = [t for t in tables if t not in existing]
+    if missing:
+        connection.execute(
+            _insert_or_bump(connection.dialect.name),
+            [{'table_name': t, 'version': 1, 'updated_at': now} for t in missing],
+        )
+
+
+def _insert_or_bump(dialect):
+    """INSERT des premières versions ; si un autre worker a inséré la ligne entre
+    l'UPDATE et ici (base créée par `create_all`, première écriture simultanée),
+    incrémente la sienne au lieu de lever IntegrityError dans le flush appelant."""
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(_TABLE)
+    stmt = dialect_insert(_TABLE)
+    return stmt.on_conflict_do_update(
+        index_elements=[_TABLE.c.table_name],
+        set_={'version': _TABLE.c.version + 1, 'updated_at': stmt.excluded.updated_at},
+    )
+
+
+def bump_versions(connection, tables):
+    """Incrémente les versions de `tables` hors session ORM (ex. restauration d'un instantané)."""
+    _bump(connection, tables)
+
+
+def _flushed_tables(session):
+    """Tables écrites par le flush, y compris les tables d'association (many-to-many)."""
+    tables = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        state = inspect(obj)
+        mapper = state.mapper
+        if obj in session.dirty and not session.is_modified(obj, include_collections=True):
+            continue
+        tables.update(t.name for t in mapper.tables)
+        for rel in mapper.relationships:
+            if rel.secondary is not None and state.attrs[rel.key].history.has_changes():
+                tables.add(rel.secondary.name)
+            elif rel.secondary is not None and obj in session.deleted:
+                tables.add(rel.secondary.name)
+    return tables
+
+
+# Clé de `session.info` : tables écrites depuis le début de la transaction (lue au commit par cache.py).
+TOUCHED_TABLES_KEY = 'data_version_touched'
+
+
+def touched_tables(session):
+    return session.info.setdefault(TOUCHED_TABLES_KEY, set())
+
+
+def _after_flush(session, _flush_context):
+    tables = _flushed_tables(session)
+    if tables:
+        _bump(session.connection(), tables)
+        touched_tables(session).update(tables)
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    name = getattr(table, 'name', None)
+    if name:
+        _bump(orm_execute_state.session.connection(), {name})
+        touched_tables(orm_execute_state.session).add(name)
+
+
+def install_data_version_hooks():
+    event.listen(db.session, 'after_flush', _after_flush)
+    event.listen(db.session, 'do_orm_execute', _do_orm_execute)
+
+
+def current_versions(tables):
+    """{table: (version, updated_at)} pour les tables demandées (absentes = version 0)."""
+    rows = db.session.execute(
+        select(_TABLE.c.table_name, _TABLE.c.version, _TABLE.c.updated_at)
+        .where(_TABLE.c.table_name.in_(tables))
+    ).all()
+    found = {name: (version, updated_at) for name, version, updated_at in rows}
+    return {t: found.get(t, (0, None)) for t in tables}
+
+
+def _etag(versions, daily=False):
+    user = getattr(current_user, '_get_current_object', lambda: current_user)()
+    parts = [
+        CODE_FINGERPRINT,
+        request.endpoint or '',
+        request.query_string.decode('latin-1'),
+        type(user).__name__,
+        str(getattr(user, 'id', '')),
+        getattr(user, 'role', '') or '',
+        getattr(user, 'username', '') or '',
+    ]
+    parts += [f"{t}:{v}" for t, (v, _u) in sorted(versions.items())]
+    if daily:
+        parts.append(date.today().isoformat())
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def conditional_get(*tables, daily=False):
+    """Décorateur : ETag / Last-Modified d'après les versions des `tables` lues par la vue.
+
+    L'ETag inclut l'utilisateur (id, rôle) : la page dépend des permissions.
+    `daily` : la réponse dépend aussi du jour (durées de prêt en cours, date
+    d'édition dans le nom du fichier ou le pied de page) ; l'ETag change chaque jour.
+    Pas de validation si des messages flash sont en attente (ils ne s'afficheraient pas)
+    ni pour une réponse de secours (`g.degraded_response`, ex. PDF reportlab après
+    un échec de WeasyPrint).
+    À placer sous `@login_required` / `@require_permission`.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+            versions = current_versions(tables)
+            g.data_versions = (frozenset(tables), versions)  # relu par export_cache
+            etag = _etag(versions, daily)
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or g.get('degraded_response'):
+                    return response
+                stamps = [u for _v, u in versions.values() if u is not None]
+                if stamps:
+                    latest = max(datetime.fromisoformat(u) if isinstance(u, str) else u for u in stamps)
+                    response.last_modified = latest.astimezone(timezone.utc)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
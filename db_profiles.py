@@ -0,0 +1,81 @@
+"""Profils moteur SQLAlchemy appliqués à chaque connexion (cf. réglages SQLITE_* de `config.py`).
+
+SQLite en production (3 workers gunicorn) : sans réglage, une écriture concurrente
+(`_record_login_event`, `log_history`, pointage des présences…) échoue aussitôt
+avec « database is locked ». Le profil passe la base en WAL (les lecteurs ne
+bloquent plus l'écrivain), attend le verrou au lieu d'échouer (`busy_timeout`) et
+règle cache / mmap / fichiers temporaires. `PRAGMA optimize` est lancé au plus
+une fois par SQLITE_OPTIMIZE_INTERVAL secondes et par processus, au retour d'une
+connexion dans le pool.
+"""
+
+from __future__ import annotations
+
+import time
+
+from sqlalchemy import event
+
+_JOURNAL_MODES = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'OFF')
+_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+_TEMP_STORE = ('DEFAULT', 'FILE', 'MEMORY')
+
+
+def _sqlite_pragmas(config) -> list[str]:
+    pragmas = []
+    journal_mode = (config.get('SQLITE_JOURNAL_MODE') or '').upper()
+    if journal_mode:
+        # Déjà vérifié par config.py ; ici pour une configuration passée autrement (tests, scripts).
+        if journal_mode not in _JOURNAL_MODES:
+            raise ValueError(f"SQLITE_JOURNAL_MODE={journal_mode!r} invalide")
+        pragmas.append(f"PRAGMA journal_mode={journal_mode}")
+    pragmas.append(f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT_MS', 0))}")
+    synchronous = (config.get('SQLITE_SYNCHRONOUS') or '').upper()
+    if synchronous in _SYNCHRONOUS:
+        pragmas.append(f"PRAGMA synchronous={synchronous}")
+    pragmas.append(f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 0))}")
+    if config.get('SQLITE_CACHE_SIZE'):
+        pragmas.append(f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}")
+    temp_store = (config.get('SQLITE_TEMP_STORE') or '').upper()
+    if temp_store in _TEMP_STORE:
+        pragmas.append(f"PRAGMA temp_store={temp_store}")
+    return pragmas
+
+
+def _install_sqlite_profile(engine, config):
+    if engine.url.database in (None, '', ':memory:'):
+        return
+    pragmas = _sqlite_pragmas(config)
+    optimize_interval = int(config.get('SQLITE_OPTIMIZE_INTERVAL', 0))
+    state = {'last_optimize': time.monotonic()}
+
+    @event.listens_for(engine, 'connect')
+    def _apply_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    if optimize_interval <= 0:
+        return
+
+    @event.listens_for(engine, 'checkin')
+    def _periodic_optimize(dbapi_connection, _record):
+        now = time.monotonic()
+        if now - state['last_optimize'] < optimize_interval:
+            return
+        state['last_optimize'] = now
+        try:
+            dbapi_connection.execute('PRAGMA optimize')
+        except Exception:
+            # Base occupée ou connexion invalidée : on retentera au prochain intervalle.
+            pass
+
+
+def install_engine_profile(app, db):
+    """Branche le profil correspondant au dialecte de la base de l'application."""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite' and app.config.get('SQLITE_PROFILE_ENABLED', True):
+        _install_sqlite_profile(engine, app.config)
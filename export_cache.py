@@ -0,0 +1,218 @@
+"""Cache disque des exports rendus (PDF, CSV, JSON Lines) sous instance/exports/.
+
+Un export est rangé sous une clé faite de l'endpoint, de ses paramètres
+(filtres, colonnes, format, moteur…), des versions `data_version` des tables
+qu'il lit et de la date du jour (durées des prêts en cours, date d'édition dans
+le nom du fichier et le pied de page des PDF) : tant qu'aucune de ces tables n'a
+changé, le téléchargement suivant du même jour est servi tel quel depuis le fichier (`send_file`, sans requête ORM ni rendu),
+par n'importe quel worker. Au premier passage la réponse est envoyée en flux
+comme d'habitude et recopiée au fil de l'eau dans un fichier temporaire,
+renommé seulement si l'envoi est allé au bout.
+
+L'ETag est celui de `@conditional_get` quand la vue en a un ; sinon la clé de
+l'artefact (304 si le navigateur l'a déjà). Éviction : l'écriture d'une
+nouvelle version supprime les anciennes du même export ; au-delà de
+EXPORT_CACHE_MAX_FILES fichiers ou de EXPORT_CACHE_MAX_AGE_HOURS, les moins
+récemment servis partent. Une réponse marquée `g.degraded_response` (PDF de
+secours après un échec de WeasyPrint) n'est ni enregistrée ni validée par ETag.
+
+Uniquement pour des exports dont le contenu ne dépend pas de l'utilisateur
+(les permissions sont vérifiées avant, par les décorateurs ou la vue) :
+
+    @app.route('/export_products_csv')
+    @login_required
+    @require_permission('view_equipment')
+    @conditional_get(*EQUIPMENT_TABLES, daily=True)
+    @cached_export(*EQUIPMENT_TABLES)
+    def export_products_csv(): …
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import g, make_response, request, send_file
+
+import metrics
+from data_versions import CODE_FINGERPRINT, current_versions
+
+logger = logging.getLogger(__name__)
+
+
+class ExportCache:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.max_files = 200
+        self.max_age = 7 * 24 * 3600
+
+    def init_app(self, app):
+        cfg = app.config
+        self.enabled = cfg.get('EXPORT_CACHE_ENABLED', True)
+        self.path = cfg.get('EXPORT_CACHE_PATH') or os.path.join(app.instance_path, 'exports')
+        self.max_files = cfg.get('EXPORT_CACHE_MAX_FILES', 200)
+        self.max_age = cfg.get('EXPORT_CACHE_MAX_AGE_HOURS', 168) * 3600
+        if self.enabled:
+            os.makedirs(self.path, exist_ok=True)
+
+    # -- clés ----------------------------------------------------------------------
+
+    @staticmethod
+    def _digest(*parts) -> str:
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+    def _names(self, tables):
+        """(préfixe de l'export, nom de l'artefact pour les versions courantes)."""
+        params = urlencode(sorted(request.args.items(multi=True)))
+        view_args = json.dumps(request.view_args or {}, sort_keys=True, default=str)
+        prefix = f"{request.endpoint}-{self._digest(CODE_FINGERPRINT, view_args, params)}"
+        known_tables, versions = g.get('data_versions', (None, None))
+        if known_tables != frozenset(tables):
+            versions = current_versions(tables)
+        version = self._digest(date.today().isoformat(), *(f"{t}:{v}" for t, (v, _u) in sorted(versions.items())))
+        return prefix, f"{prefix}-{version}"
+
+    # -- lecture -------------------------------------------------------------------
+
+    def _hit(self, name):
+        data_path = os.path.join(self.path, name)
+        try:
+            with open(data_path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            os.utime(data_path)  # « récemment servi » pour l'éviction
+        except (OSError, ValueError):
+            return None
+        response = send_file(data_path, mimetype=meta['mimetype'], conditional=False, etag=False)
+        response.headers['Content-Disposition'] = meta['content_disposition']
+        return response
+
+    # -- écriture ------------------------------------------------------------------
+
+    def _store(self, response, prefix, name):
+        """Recopie le corps de `response` pendant son envoi ; l'artefact n'existe qu'une fois complet."""
+        data_path = os.path.join(self.path, name)
+        tmp = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        meta = {
+            'mimetype': response.mimetype,
+            'content_disposition': response.headers.get('Content-Disposition', 'attachment'),
+            'endpoint': request.endpoint,
+            'url': request.full_path,
+        }
+        original = response.response
+        body = response.iter_encoded()
+
+        def tee():
+            complete = False
+            try:
+                with open(tmp, 'wb') as out:
+                    for chunk in body:
+                        out.write(chunk)
+                        yield chunk
+                complete = True
+            finally:
+                if complete:
+                    self._commit(tmp, data_path, meta, prefix)
+                elif os.path.exists(tmp):
+                    os.remove(tmp)
+
+        response.response = tee()
+        response.direct_passthrough = False
+        # Fermer tee() ne ferme pas l'itérable d'origine (contexte de stream_with_context, fichier…).
+        close = getattr(original, 'close', None)
+        if close is not None:
+            response.call_on_close(close)
+        return response
+
+    def _commit(self, tmp, data_path, meta, prefix):
+        try:
+            with open(tmp + '.json', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(tmp + '.json', data_path + '.json')
+            os.replace(tmp, data_path)
+            self._evict(prefix, os.path.basename(data_path))
+        except OSError:
+            logger.warning("Export non mis en cache (%s)", data_path, exc_info=True)
+
+    def _evict(self, prefix, keep):
+        """Anciennes versions de cet export, puis artefacts trop vieux ou en surnombre."""
+        now = time.time()
+        artefacts = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(('.json', '.tmp')):
+                continue
+            stale = entry.name.startswith(prefix + '-') and entry.name != keep
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:  # supprimé entre-temps par un autre worker
+                continue
+            if stale or now - mtime > self.max_age:
+                self._remove(entry.path)
+            else:
+                artefacts.append((mtime, entry.path))
+        artefacts.sort(reverse=True)
+        for _mtime, path in artefacts[self.max_files:]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(data_path):
+        for path in (data_path, data_path + '.json'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        if self.path and os.path.isdir(self.path):
+            for entry in os.scandir(self.path):
+                if not entry.name.endswith('.json'):
+                    self._remove(entry.path)
+
+    # -- point d'entrée --------------------------------------------------------------
+
+    def serve(self, tables, build):
+        """Réponse d'export : artefact en cache si les `tables` n'ont pas changé, sinon `build()` mis en cache."""
+        if not self.enabled or request.method != 'GET':
+            return build()
+        prefix, name = self._names(tables)
+        if name in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            response = self._hit(name)
+            metrics.inc('aim_export_cache_requests_total', endpoint=request.endpoint,
+                        result='miss' if response is None else 'hit')
+            if response is None:
+                response = make_response(build())
+                if response.status_code != 200:
+                    return response
+                if g.get('degraded_response'):
+                    # Rendu de secours après une erreur : servi cette fois, jamais réutilisé.
+                    response.headers['Cache-Control'] = 'no-store'
+                    return response
+                self._store(response, prefix, name)
+        response.set_etag(name)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+export_cache = ExportCache()
+
+
+def cached_export(*tables):
+    """Décorateur : export servi depuis le cache disque tant que les `tables` n'ont pas changé.
+
+    Sous `@conditional_get` et les contrôles de permission (ils passent avant).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return export_cache.serve(tables, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,337 @@
+"""Exports filtrés à colonnes choisies : /export/<jeu>?format=csv|jsonl&columns=…
+
+Chaque jeu de DATASETS déclare ses colonnes comme des expressions SQL et ses
+filtres comme des clauses WHERE : seules les colonnes demandées sont
+sélectionnées et seules les lignes retenues sortent de la base (pas d'objets
+ORM, pas de tri ni de filtre en Python). Les filtres des archers sont ceux de
+la liste /archers (`archer_filters`, partagé avec la vue).
+
+    /export/archers?course_id=3&has_arc=no&columns=last_name,first_name,email
+    /export/products?category=2&state=stock&loan=no&format=jsonl
+    /export/loans?status=active&kind=arc
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, func, literal, or_, select, union_all
+
+from models import (
+    Archer,
+    Assignment,
+    Category,
+    CompositeProduct,
+    Course,
+    Product,
+    ProductAssignment,
+    archer_courses,
+    composite_components,
+)
+
+FORMATS = ('csv', 'jsonl')
+
+
+def _int_arg(args, name):
+    try:
+        return int(args.get(name) or '')
+    except ValueError:
+        return None
+
+
+def _date_arg(args, name):
+    try:
+        return date.fromisoformat((args.get(name) or '').strip())
+    except ValueError:
+        return None
+
+
+def _archer_name():
+    return func.trim(func.coalesce(Archer.first_name, '') + ' ' + Archer.last_name)
+
+
+# -- archers ------------------------------------------------------------------------
+
+def archer_filters(args):
+    """Clauses WHERE des filtres de /archers (q, course_id, has_arc, category, min_age, max_age)."""
+    clauses = []
+    q = (args.get('q') or '').strip()
+    if q:
+        like = f"%{q}%"
+        clauses.append(or_(Archer.first_name.ilike(like), Archer.last_name.ilike(like)))
+    if args.get('category'):
+        clauses.append(Archer.categorie == args.get('category'))
+    min_age, max_age = _int_arg(args, 'min_age'), _int_arg(args, 'max_age')
+    if min_age is not None:
+        clauses.append(Archer.age >= min_age)
+    if max_age is not None:
+        clauses.append(Archer.age <= max_age)
+    course_id = _int_arg(args, 'course_id')
+    if course_id is not None:
+        clauses.append(Archer.courses.any(Course.id == course_id))
+    # EXISTS plutôt qu'une jointure : un archer n'apparaît qu'une fois.
+    has_open_loan = Archer.assignments.any(Assignment.date_returned.is_(None))
+    if args.get('has_arc') == 'yes':
+        clauses.append(has_open_loan)
+    elif args.get('has_arc') == 'no':
+        clauses.append(~has_open_loan)
+    return clauses
+
+
+ARCHER_COLUMNS = [
+    ('id', 'ID'),
+    ('last_name', 'Nom'),
+    ('first_name', 'Prénom'),
+    ('email', 'Email'),
+    ('license_number', 'Numéro Licence'),
+    ('age', 'Âge'),
+    ('categorie', 'Catégorie'),
+    ('bow_type', "Type d'arc"),
+    ('bow_length', "Taille d'arc"),
+    ('draw_length', 'Allonge'),
+    ('current_bow', 'Arc prêté'),
+    ('courses', 'Cours'),
+]
+
+
+def _archer_expressions():
+    current_bow = (
+        select(CompositeProduct.name)
+        .join(Assignment, Assignment.composite_id == CompositeProduct.id)
+        .where(Assignment.archer_id == Archer.id, Assignment.date_returned.is_(None))
+        .order_by(Assignment.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    courses = (
+        select(func.aggregate_strings(Course.name, ', '))
+        .select_from(archer_courses.join(Course, Course.id == archer_courses.c.course_id))
+        .where(archer_courses.c.archer_id == Archer.id)
+        .scalar_subquery()
+    )
+    return {
+        'id': Archer.id,
+        'last_name': Archer.last_name,
+        'first_name': Archer.first_name,
+        'email': Archer.email,
+        'license_number': Archer.license_number,
+        'age': Archer.age,
+        'categorie': Archer.categorie,
+        'bow_type': Archer.bow_type,
+        'bow_length': Archer.bow_length,
+        'draw_length': Archer.draw_length,
+        'current_bow': current_bow,
+        'courses': courses,
+    }
+
+
+def _archers_query(keys, args):
+    cols = _archer_expressions()
+    return (
+        select(*(cols[k].label(k) for k in keys))
+        .select_from(Archer)
+        .where(*archer_filters(args))
+        .order_by(Archer.last_name, Archer.first_name, Archer.id)
+    )
+
+
+# -- matériel -----------------------------------------------------------------------
+
+def product_filters(args):
+    """Clauses WHERE : category (id), state, loan (yes / no : prêt direct en cours), q."""
+    clauses = []
+    category_id = _int_arg(args, 'category')
+    if category_id is not None:
+        clauses.append(Product.category_id == category_id)
+    if args.get('state'):
+        clauses.append(Product.state == args.get('state'))
+    on_loan = Product.product_assignments.any(ProductAssignment.date_returned.is_(None))
+    if args.get('loan') == 'yes':
+        clauses.append(on_loan)
+    elif args.get('loan') == 'no':
+        clauses.append(~on_loan)
+    q = (args.get('q') or '').strip()
+    if q:
+        like = f"%{q}%"
+        clauses.append(or_(Product.brand.ilike(like), Product.model.ilike(like), Product.tag.ilike(like)))
+    return clauses
+
+
+PRODUCT_COLUMNS = [
+    ('id', 'ID'),
+    ('tag', 'Code'),
+    ('category', 'Catégorie'),
+    ('brand', 'Marque'),
+    ('model', 'Modèle'),
+    ('size', 'Taille'),
+    ('power', 'Puissance'),
+    ('state', 'État'),
+    ('location', 'Lieu'),
+    ('comments', 'Commentaires'),
+    ('bows', 'Arcs'),
+    ('loaned_to', 'Prêté à'),
+]
+
+
+def _product_expressions():
+    bows = (
+        select(func.aggregate_strings(CompositeProduct.name, ', '))
+        .select_from(composite_components.join(
+            CompositeProduct, CompositeProduct.id == composite_components.c.composite_id
+        ))
+        .where(composite_components.c.product_id == Product.id)
+        .scalar_subquery()
+    )
+    loaned_to = (
+        select(_archer_name())
+        .select_from(ProductAssignment)
+        .join(Archer, Archer.id == ProductAssignment.archer_id)
+        .where(ProductAssignment.product_id == Product.id, ProductAssignment.date_returned.is_(None))
+        .order_by(ProductAssignment.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return {
+        'id': Product.id,
+        'tag': Product.tag,
+        'category': Category.name,
+        'brand': Product.brand,
+        'model': Product.model,
+        'size': Product.size,
+        'power': Product.power,
+        'state': Product.state,
+        'location': Product.location,
+        'comments': Product.comments,
+        'bows': bows,
+        'loaned_to': loaned_to,
+    }
+
+
+def _products_query(keys, args):
+    cols = _product_expressions()
+    return (
+        select(*(cols[k].label(k) for k in keys))
+        .select_from(Product)
+        .outerjoin(Category, Category.id == Product.category_id)
+        .where(*product_filters(args))
+        .order_by(Category.position, Category.name, Product.brand, Product.id)
+    )
+
+
+# -- prêts (arcs + matériel) ------------------------------------------------------------
+
+LOAN_COLUMNS = [
+    ('id', 'ID'),
+    ('kind', 'Type'),
+    ('archer', 'Archer'),
+    ('license_number', 'Numéro Licence'),
+    ('item', 'Matériel'),
+    ('tag', 'Code'),
+    ('date_assigned', "Date d'assignation"),
+    ('date_returned', 'Date de retour'),
+    ('status', 'Statut'),
+]
+
+
+def loan_filters(model, args):
+    """Clauses WHERE d'un côté (Assignment / ProductAssignment) : status, archer_id, since, until."""
+    clauses = []
+    if args.get('status') == 'active':
+        clauses.append(model.date_returned.is_(None))
+    elif args.get('status') == 'returned':
+        clauses.append(model.date_returned.isnot(None))
+    archer_id = _int_arg(args, 'archer_id')
+    if archer_id is not None:
+        clauses.append(model.archer_id == archer_id)
+    since, until = _date_arg(args, 'since'), _date_arg(args, 'until')
+    if since:
+        clauses.append(model.date_assigned >= datetime.combine(since, datetime.min.time()))
+    if until:
+        clauses.append(model.date_assigned < datetime.combine(until + timedelta(days=1), datetime.min.time()))
+    return clauses
+
+
+def _loan_side(model, kind, item, tag, keys, args):
+    cols = {
+        'id': model.id,
+        'kind': literal(kind),
+        'archer': _archer_name(),
+        'license_number': Archer.license_number,
+        'item': item,
+        'tag': tag,
+        'date_assigned': model.date_assigned,
+        'date_returned': model.date_returned,
+        'status': case((model.date_returned.is_(None), 'Actif'), else_='Retourné'),
+    }
+    # Clé de tri toujours sélectionnée : elle sert au ORDER BY de l'union.
+    return (
+        select(*(cols[k].label(k) for k in keys), model.date_assigned.label('sort_date'),
+               model.id.label('sort_id'))
+        .select_from(model)
+        .join(Archer, Archer.id == model.archer_id)
+        .where(*loan_filters(model, args))
+    )
+
+
+def _loans_query(keys, args):
+    kind = args.get('kind')
+    sides = []
+    if kind in (None, '', 'arc'):
+        sides.append(
+            _loan_side(Assignment, 'Arc', CompositeProduct.name, CompositeProduct.tag, keys, args)
+            .outerjoin(CompositeProduct, CompositeProduct.id == Assignment.composite_id)
+        )
+    if kind in (None, '', 'produit'):
+        label = func.trim(
+            func.coalesce(Category.name, '') + ' ' + func.coalesce(Product.brand, '')
+            + ' ' + func.coalesce(Product.model, '')
+        )
+        sides.append(
+            _loan_side(ProductAssignment, 'Produit', label, Product.tag, keys, args)
+            .outerjoin(Product, Product.id == ProductAssignment.product_id)
+            .outerjoin(Category, Category.id == Product.category_id)
+        )
+    loans = (union_all(*sides) if len(sides) > 1 else sides[0]).subquery()
+    return select(*(loans.c[k] for k in keys)).order_by(loans.c.sort_date.desc(), loans.c.sort_id.desc())
+
+
+# nom → (fichier, permission de `require_permission`, colonnes (clé, en-tête), requête)
+DATASETS = {
+    'archers': ('archers', 'view_courses', ARCHER_COLUMNS, _archers_query),
+    'products': ('produits', 'view_equipment', PRODUCT_COLUMNS, _products_query),
+    'loans': ('prets', 'view_assignments', LOAN_COLUMNS, _loans_query),
+}
+
+# Tables lues par chaque jeu (clé du cache disque des exports, export_cache.py).
+DATASET_TABLES = {
+    'archers': ('archer', 'archer_courses', 'course', 'assignment', 'composite_product'),
+    'products': ('product', 'category', 'composite_components', 'composite_product', 'product_assignment',
+                 'archer'),
+    'loans': ('assignment', 'product_assignment', 'archer', 'composite_product', 'product', 'category'),
+}
+
+
+
+def parse_columns(dataset, raw):
+    """Clés de colonnes demandées (`columns=a,b` ou répété), toutes par défaut.
+
+    Lève ValueError en nommant les colonnes inconnues et les colonnes valides.
+    """
+    available = [key for key, _label in DATASETS[dataset][2]]
+    keys = [k.strip() for part in raw for k in part.split(',') if k.strip()]
+    if not keys:
+        return available
+    unknown = [k for k in keys if k not in available]
+    if unknown:
+        raise ValueError(f"Colonnes inconnues : {', '.join(unknown)} (disponibles : {', '.join(available)})")
+    return list(dict.fromkeys(keys))
+
+
+def headers(dataset, keys):
+    labels = dict(DATASETS[dataset][2])
+    return [labels[k] for k in keys]
+
+
+def export_query(dataset, keys, args):
+    """SELECT des seules colonnes `keys`, filtré en SQL d'après les paramètres `args`."""
+    return DATASETS[dataset][3](keys, args)
@@ -0,0 +1,55 @@
+"""Cache de fragments Jinja rendus (lignes et panneaux des listes lourdes).
+
+Dans un gabarit :
+
+    {% call cached_fragment('product_row', p.id, product_fingerprints[p.id]) %}
+        … rendu de la ligne …
+    {% endcall %}
+
+La clé combine le nom du fragment, les éléments fournis — dont une empreinte
+du contenu de l'entité calculée par la vue (voir `fingerprint`) — et les
+permissions de l'utilisateur courant. Une entité modifiée change d'empreinte :
+seul son fragment est rendu à nouveau. Stockage : `cache.app_cache`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+from flask import g
+from flask_login import current_user
+from markupsafe import Markup
+
+from cache import app_cache
+
+
+def fingerprint(*values) -> str:
+    """Empreinte courte d'un ensemble de valeurs (colonnes, relations…) affichées par un fragment."""
+    return hashlib.sha1(repr(values).encode('utf-8')).hexdigest()[:20]
+
+
+def viewer_permissions() -> tuple[str, ...]:
+    """Permissions (`can_*`) de l'utilisateur courant, calculées une fois par requête."""
+    perms = g.get('_fragment_viewer_permissions')
+    if perms is None:
+        user = current_user
+        if not getattr(user, 'is_authenticated', False):
+            perms = ('anonymous',)
+        else:
+            names = sorted(n for n in dir(type(user)) if n.startswith('can_'))
+            perms = (type(user).__name__,) + tuple(n for n in names if getattr(user, n)())
+        g._fragment_viewer_permissions = perms
+    return perms
+
+
+def cached_fragment(name, *key_parts, caller):
+    key = 'fragment:' + name + ':' + fingerprint(key_parts, viewer_permissions())
+    html = app_cache.get(key)
+    if html is None:
+        html = str(caller())
+        app_cache.set(key, html)
+    return Markup(html)
+
+
+def init_app(app):
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
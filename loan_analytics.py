@@ -0,0 +1,235 @@
+"""Statistiques de prêt : taux d'utilisation, durée médiane et inactivité du matériel.
+
+Les intervalles de prêt (`date_assigned` → `date_returned`, ou maintenant si le
+prêt est en cours) sont agrégés en SQL ensembliste : une sous-requête découpe
+chaque intervalle sur la saison demandée, des fonctions de fenêtre donnent la
+médiane, et un GROUP BY produit une ligne par arc, produit, catégorie ou saison.
+Aucune boucle Python par objet ORM.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, or_, select
+
+from models import Assignment, Category, CompositeProduct, Product, ProductAssignment, db
+
+# Saison sportive : 1er septembre → 31 août (saison « 2025 » = sept. 2025 → août 2026).
+SEASON_START_MONTH = 9
+
+SCOPES = ('composite', 'product', 'category', 'season')
+
+
+def season_of(d) -> int:
+    """Année de début de la saison contenant la date `d`."""
+    return d.year if d.month >= SEASON_START_MONTH else d.year - 1
+
+
+def season_bounds(season: int) -> tuple[datetime, datetime]:
+    return datetime(season, SEASON_START_MONTH, 1), datetime(season + 1, SEASON_START_MONTH, 1)
+
+
+def season_label(season: int) -> str:
+    return f"{season}-{season + 1}"
+
+
+def available_seasons(now: datetime | None = None) -> list[int]:
+    """Saisons couvertes par l'historique des prêts (la plus récente d'abord)."""
+    now = now or datetime.now()
+    first = db.session.execute(
+        select(func.min(Assignment.date_assigned)).union_all(
+            select(func.min(ProductAssignment.date_assigned))
+        )
+    ).scalars().all()
+    firsts = [_as_datetime(v) for v in first if v is not None]
+    current = season_of(now)
+    start = season_of(min(firsts)) if firsts else current
+    return list(range(current, start - 1, -1))
+
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _dialect():
+    return db.session.get_bind().dialect.name
+
+
+def _days_between(start, end):
+    """Durée en jours (décimaux) entre deux expressions datetime."""
+    if _dialect() == 'postgresql':
+        return func.extract('epoch', end - start) / 86400.0
+    return func.julianday(end) - func.julianday(start)
+
+
+def _greatest(a, b):
+    return func.greatest(a, b) if _dialect() == 'postgresql' else func.max(a, b)
+
+
+def _least(a, b):
+    return func.least(a, b) if _dialect() == 'postgresql' else func.min(a, b)
+
+
+def _intervals(model, key_col, window_start, window_end, now, extra_cols=()):
+    """Sous-requête : un intervalle de prêt par ligne, découpé sur la fenêtre.
+
+    Colonnes : `group_key`, `loan_days` (durée totale du prêt), `busy_days`
+    (part dans la fenêtre), `rn` / `cnt` (rang et effectif par groupe, pour la médiane).
+    """
+    end_expr = func.coalesce(model.date_returned, literal(now))
+    loan_days = _days_between(model.date_assigned, end_expr)
+    busy_days = _days_between(
+        _greatest(model.date_assigned, literal(window_start)),
+        _least(end_expr, literal(window_end)),
+    )
+    stmt = select(
+        key_col.label('group_key'),
+        loan_days.label('loan_days'),
+        busy_days.label('busy_days'),
+        func.row_number().over(partition_by=key_col, order_by=loan_days).label('rn'),
+        func.count().over(partition_by=key_col).label('cnt'),
+        *extra_cols,
+    ).where(
+        model.date_assigned.isnot(None),
+        model.date_assigned < window_end,
+        end_expr > window_start,
+    )
+    return stmt
+
+
+def _aggregate(intervals):
+    """GROUP BY sur les intervalles : nombre de prêts, jours occupés, médiane."""
+    sub = intervals.subquery()
+    is_median_row = or_(sub.c.rn == (sub.c.cnt + 1) // 2, sub.c.rn == (sub.c.cnt + 2) // 2)
+    return select(
+        sub.c.group_key,
+        func.count().label('loans'),
+        func.sum(sub.c.busy_days).label('busy_days'),
+        func.avg(case((is_median_row, sub.c.loan_days))).label('median_loan_days'),
+    ).group_by(sub.c.group_key).subquery()
+
+
+def _window(season, now):
+    start, end = season_bounds(season)
+    effective_end = min(end, now)
+    window_days = max((effective_end - start).total_seconds() / 86400.0, 0.0)
+    return start, effective_end, window_days
+
+
+def _row(key, label, loans, busy, median, window_days, units=1):
+    capacity = window_days * units
+    busy = float(busy or 0.0)
+    return {
+        'key': key,
+        'label': label,
+        'units': units,
+        'loans': int(loans or 0),
+        'busy_days': round(busy, 1),
+        'utilization': round(100.0 * busy / capacity, 1) if capacity else 0.0,
+        'median_loan_days': round(float(median), 1) if median is not None else None,
+        'idle_days': round(max(capacity - busy, 0.0), 1),
+    }
+
+
+def composite_stats(season, now=None):
+    now = now or datetime.now()
+    start, end, window_days = _window(season, now)
+    agg = _aggregate(_intervals(Assignment, Assignment.composite_id, start, end, now))
+    stmt = (
+        select(CompositeProduct.id, CompositeProduct.name, CompositeProduct.tag,
+               agg.c.loans, agg.c.busy_days, agg.c.median_loan_days)
+        .outerjoin(agg, agg.c.group_key == CompositeProduct.id)
+        .order_by(func.coalesce(agg.c.busy_days, 0).desc(), CompositeProduct.name)
+    )
+    return [
+        _row(cid, f"{name} [{tag}]" if tag else name, loans, busy, median, window_days)
+        for cid, name, tag, loans, busy, median in db.session.execute(stmt)
+    ]
+
+
+def product_stats(season, now=None):
+    """Prêts directs de produits unitaires (hors pièces montées sur un arc)."""
+    now = now or datetime.now()
+    start, end, window_days = _window(season, now)
+    agg = _aggregate(_intervals(ProductAssignment, ProductAssignment.product_id, start, end, now))
+    stmt = (
+        select(Product.id, Category.name, Product.brand, Product.model, Product.tag,
+               agg.c.loans, agg.c.busy_days, agg.c.median_loan_days)
+        .join(Category, Category.id == Product.category_id)
+        .outerjoin(agg, agg.c.group_key == Product.id)
+        .order_by(func.coalesce(agg.c.busy_days, 0).desc(), Category.position, Product.brand)
+    )
+    rows = []
+    for pid, cat, brand, model, tag, loans, busy, median in db.session.execute(stmt):
+        label = ' '.join(x for x in (cat, brand, model) if x) or f"Produit #{pid}"
+        if tag:
+            label += f" [{tag}]"
+        rows.append(_row(pid, label, loans, busy, median, window_days))
+    return rows
+
+
+def category_stats(season, now=None):
+    """Prêts directs agrégés par catégorie ; capacité = nb de produits × jours."""
+    now = now or datetime.now()
+    start, end, window_days = _window(season, now)
+    intervals = _intervals(
+        ProductAssignment, Product.category_id, start, end, now
+    ).join_from(ProductAssignment, Product, Product.id == ProductAssignment.product_id)
+    agg = _aggregate(intervals)
+    units = (
+        select(Product.category_id.label('category_id'), func.count().label('units'))
+        .group_by(Product.category_id)
+        .subquery()
+    )
+    stmt = (
+        select(Category.id, Category.name, units.c.units,
+               agg.c.loans, agg.c.busy_days, agg.c.median_loan_days)
+        .outerjoin(units, units.c.category_id == Category.id)
+        .outerjoin(agg, agg.c.group_key == Category.id)
+        .order_by(Category.position, Category.name)
+    )
+    return [
+        _row(cid, name, loans, busy, median, window_days, units=int(n or 0))
+        for cid, name, n, loans, busy, median in db.session.execute(stmt)
+    ]
+
+
+def season_stats(now=None):
+    """Une ligne par saison : arcs (prêts d'arcs) sur l'ensemble du parc actuel."""
+    now = now or datetime.now()
+    fleet = db.session.execute(select(func.count(CompositeProduct.id))).scalar() or 0
+    rows = []
+    for season in available_seasons(now):
+        start, end, window_days = _window(season, now)
+        intervals = _intervals(Assignment, literal(season), start, end, now)
+        agg = _aggregate(intervals)
+        found = db.session.execute(
+            select(agg.c.loans, agg.c.busy_days, agg.c.median_loan_days)
+        ).first()
+        loans, busy, median = found if found else (0, 0.0, None)
+        rows.append(_row(season, season_label(season), loans, busy, median, window_days, units=fleet))
+    return rows
+
+
+def loan_stats(scope, season, now=None):
+    if scope == 'product':
+        return product_stats(season, now)
+    if scope == 'category':
+        return category_stats(season, now)
+    if scope == 'season':
+        return season_stats(now)
+    return composite_stats(season, now)
+
+
+CSV_HEADERS = [
+    ('label', 'Élément'),
+    ('units', 'Unités'),
+    ('loans', 'Prêts'),
+    ('busy_days', 'Jours prêtés'),
+    ('utilization', 'Utilisation (%)'),
+    ('median_loan_days', 'Durée médiane (jours)'),
+    ('idle_days', 'Jours inactifs'),
+]
@@ -89,3 +89,43 @@ L'équipe ANC93
     except Exception as e:
         app.logger.error(f"Failed to send credentials email to {archer.email}: {str(e)}")
         return False
+
+
+def send_alerts_digest(alerts, recipients, kind_labels):
+    """
+    Send the alerts digest (bows due for verification, overdue loans) to responsibles.
+
+    One SMTP connection is opened for the whole batch (mail.connect()).
+
+    Args:
+        alerts: Alert objects, grouped by kind
+        recipients: list of email addresses
+        kind_labels: {kind: French section title}
+
+    Returns:
+        Number of emails sent
+    """
+    from app import app
+
+    if not recipients or not alerts:
+        return 0
+
+    sections = []
+    for kind, label in kind_labels.items():
+        lines = [f"- {a.summary}" for a in alerts if a.kind == kind]
+        if lines:
+            sections.append(f"{label} ({len(lines)}) :\n" + "\n".join(lines))
+
+    subject = f"Alertes matériel - {len(alerts)} point(s) à traiter - ANC93"
+    body = "Bonjour,\n\n" + "\n\n".join(sections) + "\n\nCordialement,\nAIM - ANC93\n"
+
+    sent = 0
+    try:
+        with mail.connect() as conn:
+            for recipient in recipients:
+                conn.send(Message(subject=subject, recipients=[recipient], body=body))
+                sent += 1
+        app.logger.info(f"Alerts digest sent to {sent} recipient(s)")
+    except Exception as e:
+        app.logger.error(f"Failed to send alerts digest ({sent}/{len(recipients)} sent): {str(e)}")
+    return sent
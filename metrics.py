@@ -0,0 +1,241 @@
+"""Métriques au format texte Prometheus, agrégées entre les workers gunicorn.
+
+Chaque worker accumule ses compteurs en mémoire et les ajoute, au plus toutes
+les METRICS_FLUSH_INTERVAL secondes (et à l'arrêt du processus), à un fichier
+SQLite partagé `instance/metrics.db` (METRICS_PATH). `/metrics` relit ce
+fichier : le scrape voit la somme de tous les workers, quel que soit celui qui
+répond. Les compteurs survivent aux redémarrages (toujours croissants).
+
+Familles exposées (voir FAMILIES) : requêtes HTTP et latence par endpoint,
+requêtes SQL, erreurs de verrou, durée des exports PDF (et du seul rendu),
+rendus PDF de secours, étiquettes rendues, connexions, cache (applicatif et
+exports).
+
+Ailleurs dans le code :
+    metrics.inc('aim_logins_total', result='success')
+    metrics.observe('aim_pdf_export_duration_seconds', 0.8, endpoint='export_products')
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# nom → (type, aide)
+FAMILIES = {
+    'aim_http_requests_total': ('counter', "Requêtes HTTP traitées, par endpoint, méthode et statut."),
+    'aim_http_request_duration_seconds': ('histogram', "Durée de traitement des requêtes HTTP, par endpoint."),
+    'aim_db_queries_total': ('counter', "Requêtes SQL exécutées, par endpoint."),
+    'aim_pdf_export_duration_seconds': ('histogram', "Durée de génération des exports PDF, par endpoint."),
+    'aim_pdf_render_duration_seconds': ('histogram', "Durée du seul rendu PDF, par moteur (weasyprint / reportlab) et type (export / warmup)."),
+    'aim_pdf_fallbacks_total': ('counter', "Exports PDF passés au rendu reportlab de secours, par endpoint et raison (unavailable / error)."),
+    'aim_label_renders_total': ('counter', "Étiquettes rendues sur /inventaire/etiquettes, par type."),
+    'aim_logins_total': ('counter', "Tentatives de connexion, par résultat (success / failure)."),
+    'aim_cache_requests_total': ('counter', "Lectures du cache applicatif, par résultat (hit / miss)."),
+    'aim_export_cache_requests_total': ('counter', "Exports servis depuis le cache disque ou rendus, par endpoint et résultat (hit / miss)."),
+    'aim_db_lock_errors_total': ('counter', "Erreurs de verrou de la base (SQLite « database is locked », interblocage), par endpoint."),
+}
+
+# Messages du driver qui signalent une contention plutôt qu'une requête fautive.
+_LOCK_ERROR_MARKERS = ('database is locked', 'database table is locked', 'deadlock detected',
+                       'could not obtain lock')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PDF_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_BUCKETS = {
+    'aim_http_request_duration_seconds': LATENCY_BUCKETS,
+    'aim_pdf_export_duration_seconds': PDF_BUCKETS,
+    'aim_pdf_render_duration_seconds': PDF_BUCKETS,
+}
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS metric ("
+    " name TEXT NOT NULL, labels TEXT NOT NULL, le TEXT NOT NULL DEFAULT '',"
+    " value REAL NOT NULL, PRIMARY KEY (name, labels, le))",
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _format_le(bound) -> str:
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def _format_value(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsStore:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.flush_interval = 5
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_flush = time.monotonic()
+
+    def init_app(self, app):
+        cfg = app.config
+        self.enabled = cfg.get('METRICS_ENABLED', True)
+        self.path = cfg.get('METRICS_PATH') or os.path.join(app.instance_path, 'metrics.db')
+        self.flush_interval = cfg.get('METRICS_FLUSH_INTERVAL', 5)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for ddl in _SCHEMA:
+                conn.execute(ddl)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # -- enregistrement (mémoire du worker) -----------------------------------
+
+    def _add(self, name, labels, le, value):
+        key = (name, labels, le)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + value
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            self._add(name, _labels(labels), '', value)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        rendered = _labels(labels)
+        for bound in _BUCKETS[name] + (math.inf,):
+            # Tous les seaux sont écrits, même à 0 : histogram_quantile() en a besoin.
+            self._add(name + '_bucket', rendered, _format_le(bound), 1 if value <= bound else 0)
+        self._add(name + '_sum', rendered, '', value)
+        self._add(name + '_count', rendered, '', 1)
+
+    # -- fichier partagé ---------------------------------------------------------
+
+    def flush(self):
+        """Ajoute les compteurs du worker au fichier partagé."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            conn = self._conn()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    "INSERT INTO metric (name, labels, le, value) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(name, labels, le) DO UPDATE SET value = value + excluded.value",
+                    [(name, labels, le, value) for (name, labels, le), value in pending.items()],
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            # On garde les valeurs pour le prochain essai plutôt que de les perdre.
+            logger.warning("Écriture des métriques impossible", exc_info=True)
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def render(self) -> str:
+        """Exposition texte Prometheus (version 0.0.4) de toutes les familles."""
+        self.flush()
+        rows = self._conn().execute("SELECT name, labels, le, value FROM metric").fetchall()
+        by_name = {}
+        for name, labels, le, value in rows:
+            by_name.setdefault(name, []).append((labels, le, value))
+        lines = []
+        for family, (kind, help_text) in FAMILIES.items():
+            lines.append(f'# HELP {family} {help_text}')
+            lines.append(f'# TYPE {family} {kind}')
+            suffixes = ('_bucket', '_sum', '_count') if kind == 'histogram' else ('',)
+            for suffix in suffixes:
+                series = by_name.get(family + suffix, [])
+                series.sort(key=lambda s: (s[0], float(s[1]) if s[1] else 0.0))
+                for labels, le, value in series:
+                    if le:
+                        labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                    series_name = f'{family}{suffix}{{{labels}}}' if labels else family + suffix
+                    lines.append(f'{series_name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+store = MetricsStore()
+inc = store.inc
+observe = store.observe
+
+
+# -- hooks Flask / SQLAlchemy ---------------------------------------------------
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._metrics_queries = g.get('_metrics_queries', 0) + 1
+
+
+def _count_lock_error(context):
+    message = str(context.original_exception).lower()
+    if any(marker in message for marker in _LOCK_ERROR_MARKERS):
+        endpoint = (request.endpoint or 'unmatched') if has_request_context() else 'cli'
+        store.inc('aim_db_lock_errors_total', endpoint=endpoint)
+
+
+def _start_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_queries = 0
+
+
+def _finish_request(response):
+    start = g.get('_metrics_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or 'unmatched'
+    store.inc('aim_http_requests_total', endpoint=endpoint, method=request.method,
+              status=response.status_code)
+    store.observe('aim_http_request_duration_seconds', elapsed, endpoint=endpoint)
+    store.inc('aim_db_queries_total', g.get('_metrics_queries', 0), endpoint=endpoint)
+    if response.mimetype == 'application/pdf':
+        store.observe('aim_pdf_export_duration_seconds', elapsed, endpoint=endpoint)
+    store.maybe_flush()
+    return response
+
+
+def init_app(app, db):
+    """Branche le comptage des requêtes HTTP / SQL si METRICS_ENABLED est actif."""
+    store.init_app(app)
+    if not store.enabled:
+        return
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _count_query)
+    event.listen(engine, 'handle_error', _count_lock_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    atexit.register(store.flush)
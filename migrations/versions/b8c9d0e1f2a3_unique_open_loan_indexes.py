@@ -0,0 +1,59 @@
+"""Index uniques partiels : un seul prêt ouvert par arc / par produit.
+
+Les doublons éventuels (double prêt enregistré avant ce correctif) sont clos
+au préalable : on garde le prêt ouvert le plus récent.
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b8c9d0e1f2a3'
+down_revision = 'a7b8c9d0e1f2'
+branch_labels = None
+depends_on = None
+
+
+_OPEN = sa.text('date_returned IS NULL')
+
+
+def _close_duplicate_open_loans(table, key):
+    op.execute(
+        f"""
+        UPDATE {table} SET date_returned = CURRENT_TIMESTAMP
+        WHERE date_returned IS NULL
+          AND id NOT IN (
+              SELECT MAX(id) FROM {table} WHERE date_returned IS NULL GROUP BY {key}
+          )
+        """
+    )
+
+
+def upgrade():
+    _close_duplicate_open_loans('assignment', 'composite_id')
+    _close_duplicate_open_loans('product_assignment', 'product_id')
+    op.create_index(
+        'uq_assignment_open_composite',
+        'assignment',
+        ['composite_id'],
+        unique=True,
+        sqlite_where=_OPEN,
+        postgresql_where=_OPEN,
+    )
+    op.create_index(
+        'uq_product_assignment_open_product',
+        'product_assignment',
+        ['product_id'],
+        unique=True,
+        sqlite_where=_OPEN,
+        postgresql_where=_OPEN,
+    )
+
+
+def downgrade():
+    op.drop_index('uq_product_assignment_open_product', table_name='product_assignment')
+    op.drop_index('uq_assignment_open_composite', table_name='assignment')
@@ -0,0 +1,62 @@
+"""Table des alertes (arcs à vérifier, prêts en retard) et index de plage associés.
+
+Revision ID: c0d1e2f3a4b5
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c0d1e2f3a4b5'
+down_revision = 'b8c9d0e1f2a3'
+branch_labels = None
+depends_on = None
+
+
+_OPEN = sa.text('date_returned IS NULL')
+
+
+def upgrade():
+    op.create_table(
+        'alert',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=30), nullable=False),
+        sa.Column('entity_type', sa.String(length=50), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('summary', sa.String(length=255), nullable=False),
+        sa.Column('due_date', sa.Date(), nullable=True),
+        sa.Column('details', sa.JSON(), nullable=True),
+        sa.Column('computed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_alert_kind', 'alert', ['kind'], unique=False)
+    op.create_index(
+        'ix_composite_product_last_verification_date',
+        'composite_product',
+        ['last_verification_date'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_assignment_open_date_assigned',
+        'assignment',
+        ['date_assigned'],
+        sqlite_where=_OPEN,
+        postgresql_where=_OPEN,
+    )
+    op.create_index(
+        'ix_product_assignment_open_date_assigned',
+        'product_assignment',
+        ['date_assigned'],
+        sqlite_where=_OPEN,
+        postgresql_where=_OPEN,
+    )
+
+
+def downgrade():
+    op.drop_index('ix_product_assignment_open_date_assigned', table_name='product_assignment')
+    op.drop_index('ix_assignment_open_date_assigned', table_name='assignment')
+    op.drop_index('ix_composite_product_last_verification_date', table_name='composite_product')
+    op.drop_index('ix_alert_kind', table_name='alert')
+    op.drop_table('alert')
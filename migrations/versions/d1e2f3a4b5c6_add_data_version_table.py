@@ -0,0 +1,44 @@
+"""Table data_version : compteur par table pour les ETag des listes et exports.
+
+Revision ID: d1e2f3a4b5c6
+Revises: c0d1e2f3a4b5
+Create Date: 2026-10-19
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd1e2f3a4b5c6'
+down_revision = 'c0d1e2f3a4b5'
+branch_labels = None
+depends_on = None
+
+
+_TRACKED_TABLES = (
+    'alert', 'archer', 'archer_courses', 'assignment', 'attendance', 'category',
+    'composite_components', 'composite_product', 'course', 'history_event',
+    'inscription_event', 'inscription_event_registration', 'product',
+    'product_assignment', 'user', 'user_login_event',
+)
+
+
+def upgrade():
+    data_version = op.create_table(
+        'data_version',
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name'),
+    )
+    now = datetime.now()
+    op.bulk_insert(
+        data_version,
+        [{'table_name': name, 'version': 1, 'updated_at': now} for name in _TRACKED_TABLES],
+    )
+
+
+def downgrade():
+    op.drop_table('data_version')
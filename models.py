@@ -132,7 +132,7 @@ class CompositeProduct(db.Model):
     status = db.Column(db.String(20), default='club')  # club, loan
     # Code d'identification physique (ex. "A-001") — imprimé sur l'étiquette de l'arc
     tag = db.Column(db.String(32), unique=True, index=True, nullable=True)
-    last_verification_date = db.Column(db.Date, nullable=True)
+    last_verification_date = db.Column(db.Date, nullable=True, index=True)
     components = db.relationship('Product', secondary=composite_components, backref='composites')
 
 class Archer(UserMixin, db.Model):
@@ -250,6 +250,24 @@ class Archer(UserMixin, db.Model):
         return ProductAssignment.query.filter_by(archer_id=self.id, date_returned=None).all()
 
 class Assignment(db.Model):
+    # Un arc ne peut avoir qu'un seul prêt ouvert (index unique partiel, SQLite ≥ 3.8 / PostgreSQL).
+    __table_args__ = (
+        Index(
+            'uq_assignment_open_composite',
+            'composite_id',
+            unique=True,
+            sqlite_where=db.text('date_returned IS NULL'),
+            postgresql_where=db.text('date_returned IS NULL'),
+        ),
+        # Prêts en cours triés par ancienneté (recherche des retards, cf. alerts.py).
+        Index(
+            'ix_assignment_open_date_assigned',
+            'date_assigned',
+            sqlite_where=db.text('date_returned IS NULL'),
+            postgresql_where=db.text('date_returned IS NULL'),
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     archer_id = db.Column(db.Integer, db.ForeignKey('archer.id'), nullable=False)
     composite_id = db.Column(db.Integer, db.ForeignKey('composite_product.id'), nullable=False)
@@ -260,6 +278,21 @@ class Assignment(db.Model):
 class ProductAssignment(db.Model):
     """Prêt direct d'un produit unitaire à un archer (sans passer par un arc)."""
     __tablename__ = 'product_assignment'
+    __table_args__ = (
+        Index(
+            'uq_product_assignment_open_product',
+            'product_id',
+            unique=True,
+            sqlite_where=db.text('date_returned IS NULL'),
+            postgresql_where=db.text('date_returned IS NULL'),
+        ),
+        Index(
+            'ix_product_assignment_open_date_assigned',
+            'date_assigned',
+            sqlite_where=db.text('date_returned IS NULL'),
+            postgresql_where=db.text('date_returned IS NULL'),
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     archer_id = db.Column(db.Integer, db.ForeignKey('archer.id'), nullable=False)
@@ -277,6 +310,31 @@ class HistoryEvent(db.Model):
     details = db.Column(db.JSON, nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
 
+class DataVersion(db.Model):
+    """Compteur de version par table, incrémenté à chaque écriture (cf. data_versions.py).
+
+    Sert de validateur HTTP (ETag / Last-Modified) aux listes et exports.
+    """
+    __tablename__ = 'data_version'
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.now())
+
+class Alert(db.Model):
+    """Alerte calculée périodiquement (`flask alerts refresh`) et lue par le tableau de bord.
+
+    kind : 'verification_due' (arc à vérifier) ou 'loan_overdue' (prêt trop ancien).
+    La table est entièrement recalculée à chaque passage : pas d'état d'acquittement.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False, index=True)
+    entity_type = db.Column(db.String(50), nullable=False)  # composite, assignment, product_assignment
+    entity_id = db.Column(db.Integer, nullable=False)
+    summary = db.Column(db.String(255), nullable=False)
+    due_date = db.Column(db.Date, nullable=True)
+    details = db.Column(db.JSON, nullable=True)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
 archer_courses = db.Table('archer_courses',
     db.Column('archer_id', db.Integer, db.ForeignKey('archer.id')),
     db.Column('course_id', db.Integer, db.ForeignKey('course.id'))
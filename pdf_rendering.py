@@ -0,0 +1,145 @@
+"""Rendu PDF WeasyPrint partagé par les exports (/export_products, /export_archers…).
+
+Une seule fois par worker : import de WeasyPrint, configuration des polices
+(`FontConfiguration`, résolution fontconfig comprise) et analyse des feuilles
+de style de STYLESHEETS. Un rendu d'amorce lancé dans un thread à la première
+requête servie par chaque worker (PDF_WARMUP) paie ces coûts avant le premier
+export, pas pendant — et jamais pour les commandes `flask …` ni les scripts qui
+importent l'application sans servir de requêtes.
+
+Si WeasyPrint ne s'importe pas (paquet ou bibliothèques Pango absents),
+`available()` est faux et les routes passent au rendu reportlab de secours.
+Une erreur de rendu est journalisée avec sa trace et comptée
+(`aim_pdf_fallbacks_total`) au lieu d'être avalée ; la durée de chaque rendu va
+dans `aim_pdf_render_duration_seconds` (moteur, export ou amorce).
+
+    from pdf_rendering import pdf_renderer
+    pdf_bytes = pdf_renderer.render(html, 'table')
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# nom → CSS ; analysées une fois par worker, partagées par tous les rendus.
+STYLESHEETS = {
+    'table': '''
+        body { font-family: Arial, sans-serif; font-size:12px; }
+        h1 { font-size:18px; }
+        table { width:100%; border-collapse: collapse; }
+        th, td { border: 1px solid #ddd; padding: 6px; }
+    ''',
+    'letter': '''
+        @page { margin: 2cm; size: A4; }
+        body {
+          font-family: "DejaVu Serif", "Liberation Serif", Georgia, serif;
+          font-size: 11pt;
+          line-height: 1.45;
+          color: #1a1a1a;
+        }
+        .letter {
+          white-space: pre-wrap;
+          word-wrap: break-word;
+        }
+    ''',
+}
+
+# Touche les mêmes familles de polices et les mêmes règles que les vrais exports.
+_WARMUP_HTML = (
+    '<!doctype html><html lang="fr"><head><meta charset="utf-8"></head><body>'
+    '<h1>Amorce</h1><table><thead><tr><th>Marque</th><th>État</th></tr></thead>'
+    '<tbody><tr><td>Hoyt</td><td>Prêté</td></tr></tbody></table>'
+    '<div class="letter">Madame, Monsieur,\n\nVeuillez trouver ci-joint…</div>'
+    '</body></html>'
+)
+
+
+class PdfRenderer:
+    def __init__(self):
+        # Un rendu à la fois par worker : les objets Pango partagés (polices) ne
+        # sont pas sûrs entre threads, et le rendu occupe de toute façon le GIL.
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._weasyprint = None
+        self._font_config = None
+        self._stylesheets = {}
+        self._warmup_pid = None
+        self.warmup_seconds = None
+
+    def init_app(self, app):
+        app.extensions['pdf_renderer'] = self
+        if app.config.get('PDF_WARMUP'):
+            app.before_request(self._start_warm_up)
+
+    def _start_warm_up(self):
+        """Première requête de ce processus (chaque worker, y compris après un fork --preload)."""
+        if self._warmup_pid == os.getpid():
+            return
+        self._warmup_pid = os.getpid()
+        if current_app.testing:
+            return
+        threading.Thread(target=self.warm_up, name='pdf-warmup', daemon=True).start()
+
+    def _load(self):
+        """Import de WeasyPrint, polices et feuilles de style (sous le verrou, une fois)."""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            import weasyprint
+            from weasyprint.text.fonts import FontConfiguration
+        except (ImportError, OSError) as exc:
+            # OSError : paquet présent mais libpango / libharfbuzz introuvables.
+            logger.warning("WeasyPrint indisponible (%s) : exports PDF en rendu reportlab", exc)
+            return
+        self._font_config = FontConfiguration()
+        self._stylesheets = {
+            name: weasyprint.CSS(string=css, font_config=self._font_config)
+            for name, css in STYLESHEETS.items()
+        }
+        self._weasyprint = weasyprint
+
+    def available(self) -> bool:
+        with self._lock:
+            self._load()
+        return self._weasyprint is not None
+
+    def render(self, html: str, stylesheet: str, *, kind: str = 'export') -> bytes:
+        """PDF de `html` avec la feuille `stylesheet` de STYLESHEETS (RuntimeError si WeasyPrint manque)."""
+        with self._lock:
+            self._load()
+            if self._weasyprint is None:
+                raise RuntimeError('WeasyPrint indisponible')
+            started = time.perf_counter()
+            pdf = self._weasyprint.HTML(string=html).write_pdf(
+                stylesheets=[self._stylesheets[stylesheet]], font_config=self._font_config
+            )
+            elapsed = time.perf_counter() - started
+        metrics.observe('aim_pdf_render_duration_seconds', elapsed, engine='weasyprint', kind=kind)
+        return pdf
+
+    def warm_up(self):
+        """Rendu d'amorce de chaque feuille de style (thread lancé à la première requête du worker)."""
+        started = time.perf_counter()
+        try:
+            if not self.available():
+                return
+            for name in STYLESHEETS:
+                self.render(_WARMUP_HTML, name, kind='warmup')
+        except Exception:
+            logger.exception("Rendu PDF d'amorce en échec")
+            return
+        self.warmup_seconds = round(time.perf_counter() - started, 3)
+        logger.info("Rendu PDF amorcé en %.2f s", self.warmup_seconds)
+
+
+pdf_renderer = PdfRenderer()
@@ -0,0 +1,164 @@
+"""Moteur d'export PDF tabulaire reportlab (platypus), pour les gros volumes.
+
+WeasyPrint met en page tout le document HTML d'un bloc : au-delà de quelques
+milliers de lignes, il y faut plusieurs secondes et des centaines de Mo par
+export. Ici les lignes sont posées dans des tableaux de CHUNK_ROWS lignes —
+couper un long tableau platypus entre deux pages coûte d'autant plus qu'il est
+long — avec l'en-tête répété sur chaque page, un titre à chaque changement de
+groupe (catégorie…) et un pied de page numéroté. Les cellules sont du texte
+simple (tronqué à la largeur de la colonne), sauf les colonnes `wrap`, mises en
+paragraphe et donc sur plusieurs lignes.
+
+    columns = [Column('ID', 0.08), Column('Marque', 0.3), Column('Commentaires', 0.62, wrap=True)]
+    pdf = render_table_pdf('Liste des produits', columns, ((cat, (p.id, p.brand, p.comments)) for …),
+                           grouped=True)
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from io import BytesIO
+from typing import NamedTuple
+from xml.sax.saxutils import escape
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+CHUNK_ROWS = 200
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+FONT_SIZE = 8
+MARGIN = 1.5 * cm
+CELL_PADDING = 3
+
+_TITLE_STYLE = ParagraphStyle('title', fontName=FONT_BOLD, fontSize=14, leading=18, spaceAfter=8)
+_GROUP_STYLE = ParagraphStyle('group', fontName=FONT_BOLD, fontSize=10, leading=13, spaceBefore=8,
+                              spaceAfter=4, keepWithNext=1)
+_CELL_STYLE = ParagraphStyle('cell', fontName=FONT, fontSize=FONT_SIZE, leading=FONT_SIZE + 2)
+
+_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), FONT),
+    ('FONTSIZE', (0, 0), (-1, -1), FONT_SIZE),
+    ('FONTNAME', (0, 0), (-1, 0), FONT_BOLD),
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#eeeeee')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f8f8')]),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#dddddd')),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), CELL_PADDING),
+    ('RIGHTPADDING', (0, 0), (-1, -1), CELL_PADDING),
+    ('TOPPADDING', (0, 0), (-1, -1), 2),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+])
+
+
+class Column(NamedTuple):
+    label: str
+    width: float  # part de la largeur utile (la somme des colonnes fait 1)
+    wrap: bool = False
+
+
+def _text(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d/%m/%Y %H:%M')
+    if hasattr(value, 'strftime'):
+        return value.strftime('%d/%m/%Y')
+    return str(value)
+
+
+def _fit(text: str, width: float) -> str:
+    """Tronque `text` (…) pour tenir sur une ligne de `width` points."""
+    if stringWidth(text, FONT, FONT_SIZE) <= width:
+        return text
+    while text and stringWidth(text + '…', FONT, FONT_SIZE) > width:
+        # Coupe proportionnelle d'abord, puis caractère par caractère.
+        ratio = width / stringWidth(text + '…', FONT, FONT_SIZE)
+        text = text[:min(len(text) - 1, int(len(text) * ratio))]
+    return text + '…'
+
+
+class _Chunks:
+    """Découpe le flux de lignes en tableaux de CHUNK_ROWS lignes (en-tête compris)."""
+
+    def __init__(self, columns, width):
+        self.header = [c.label for c in columns]
+        self.widths = [c.width * width for c in columns]
+        self.columns = columns
+        self.rows = []
+
+    def add(self, values):
+        row = []
+        for column, col_width, value in zip(self.columns, self.widths, values):
+            text = _text(value)
+            if column.wrap:
+                row.append(Paragraph(escape(text), _CELL_STYLE) if text else '')
+            else:
+                row.append(_fit(text, col_width - 2 * CELL_PADDING))
+        self.rows.append(row)
+
+    def flush(self):
+        if not self.rows:
+            return []
+        table = Table([self.header] + self.rows, colWidths=self.widths, repeatRows=1)
+        table.setStyle(_TABLE_STYLE)
+        self.rows = []
+        return [table]
+
+
+def _footer(title):
+    printed = datetime.now().strftime('%d/%m/%Y %H:%M')
+
+    def draw(canvas, doc):
+        canvas.saveState()
+        canvas.setFont(FONT, 7)
+        canvas.setFillColor(colors.HexColor('#666666'))
+        y = MARGIN / 2
+        canvas.drawString(MARGIN, y, title)
+        canvas.drawCentredString(doc.pagesize[0] / 2, y, f'Édité le {printed}')
+        canvas.drawRightString(doc.pagesize[0] - MARGIN, y, f'Page {doc.page}')
+        canvas.restoreState()
+
+    return draw
+
+
+def render_table_pdf(title, columns, rows, *, grouped=False, wide=False) -> bytes:
+    """PDF tabulaire de `rows` (itérable de n-uplets, ou de (groupe, n-uplet) si `grouped`).
+
+    Les lignes d'un même groupe doivent se suivre (requête triée sur le groupe).
+    `wide` : A4 paysage.
+    """
+    pagesize = landscape(A4) if wide else A4
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(
+        buffer, pagesize=pagesize, title=title,
+        leftMargin=MARGIN, rightMargin=MARGIN, topMargin=MARGIN, bottomMargin=MARGIN,
+    )
+    chunks = _Chunks(columns, doc.width)
+    story = [Paragraph(escape(title), _TITLE_STYLE)]
+    current_group = object()
+    count = 0
+    for item in rows:
+        if grouped:
+            group, values = item
+            if group != current_group:
+                story += chunks.flush()
+                story.append(Paragraph(escape(_text(group) or '—'), _GROUP_STYLE))
+                current_group = group
+        else:
+            values = item
+        chunks.add(values)
+        count += 1
+        if len(chunks.rows) >= CHUNK_ROWS:
+            story += chunks.flush()
+    story += chunks.flush()
+    if not count:
+        story.append(Spacer(0, 6))
+        story.append(Paragraph('Aucune donnée.', _CELL_STYLE))
+    footer = _footer(title)
+    doc.build(story, onFirstPage=footer, onLaterPages=footer)
+    return buffer.getvalue()
@@ -0,0 +1,126 @@
+"""Instrumentation par requête : nombre de requêtes SQL, temps SQL, temps de rendu.
+
+Activée par PERF_INSTRUMENTATION (config / `.env`). Pour chaque requête HTTP :
+  - en-tête `Server-Timing` (db, tpl, total) lisible dans l'onglet Réseau du navigateur ;
+  - entrée dans un journal circulaire en mémoire (PERF_LOG_SIZE dernières requêtes,
+    par worker), consultable par les admins sur /perf avec les requêtes SQL les
+    plus lentes. Un N+1 (ex. `current_assignment` dans une boucle de gabarit) se
+    voit tout de suite au nombre de requêtes.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+_log = deque(maxlen=200)
+_log_lock = threading.Lock()
+
+
+def _stats():
+    """Compteurs de la requête HTTP en cours (None hors requête ou si non instrumentée)."""
+    if not has_request_context():
+        return None
+    return g.get('_perf')
+
+
+# Début porté par le contexte d'exécution, pas par la connexion : une instruction
+# en échec (pas d'after_cursor_execute) ne laisse rien derrière elle.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._perf_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_perf_query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats = _stats()
+    if stats is None:
+        return
+    stats['queries'] += 1
+    stats['sql_time'] += elapsed
+    slowest = stats['slowest']
+    slowest.append((elapsed, statement))
+    slowest.sort(key=lambda item: item[0], reverse=True)
+    del slowest[stats['keep_slowest']:]
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats['render_stack'].append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats['render_stack']:
+        stats['template_time'] += time.perf_counter() - stats['render_stack'].pop()
+
+
+def _start_request():
+    g._perf = {
+        'start': time.perf_counter(),
+        'queries': 0,
+        'sql_time': 0.0,
+        'template_time': 0.0,
+        'render_stack': [],
+        'slowest': [],
+        'keep_slowest': current_app.config['PERF_SLOWEST_STATEMENTS'],
+    }
+
+
+def _finish_request(response):
+    stats = _stats()
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats['start']
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={stats["sql_time"] * 1000:.1f};desc="SQL, {stats["queries"]} requetes", '
+        f'tpl;dur={stats["template_time"] * 1000:.1f};desc="Gabarits", '
+        f'total;dur={total * 1000:.1f}',
+    )
+    entry = {
+        'at': datetime.now(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'total_ms': total * 1000,
+        'queries': stats['queries'],
+        'sql_ms': stats['sql_time'] * 1000,
+        'template_ms': stats['template_time'] * 1000,
+        'slowest': [(elapsed * 1000, statement) for elapsed, statement in stats['slowest']],
+    }
+    with _log_lock:
+        _log.append(entry)
+    return response
+
+
+def recent_requests():
+    """Journal en mémoire de ce worker, le plus récent d'abord."""
+    with _log_lock:
+        return list(reversed(_log))
+
+
+def init_app(app, db):
+    """Branche les hooks SQLAlchemy et Flask si PERF_INSTRUMENTATION est actif."""
+    global _log
+    if not app.config.get('PERF_INSTRUMENTATION'):
+        return
+    _log = deque(maxlen=app.config['PERF_LOG_SIZE'])
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
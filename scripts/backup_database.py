@@ -3,18 +3,41 @@
 
 Lit DATABASE_URL depuis l'environnement ou `.env` à la racine du dépôt.
 Les fichiers vont dans instance/backups/ (déjà couvert par .gitignore via instance/).
+
+SQLite : copie à chaud par l'API de sauvegarde (`sqlite3.Connection.backup`),
+par paquets de --pages pages avec une pause entre deux paquets : le verrou de
+lecture est relâché entre les paquets, l'application continue d'écrire (une
+simple copie du fichier pendant que l'application tourne peut être incohérente
+en WAL). Si la base change entre deux paquets, SQLite reprend la copie du
+début ; après --max-restarts reprises, la copie se fait en une passe. Chaque
+sauvegarde est vérifiée (`PRAGMA integrity_check`) avant d'être gardée, avec un
+manifeste `<fichier>.json` (lignes par table) ; seules les --keep plus récentes
+de la même étiquette (--label) sont conservées : une rotation `nightly` ne
+touche pas aux sauvegardes `predeploy`.
+
+    python scripts/backup_database.py                           # sauvegarde + vérification + rotation
+    python scripts/backup_database.py --verify instance/backups/equipment-predeploy-….db
+    python scripts/backup_database.py --restore instance/backups/equipment-predeploy-….db --yes
+
+La restauration vérifie la sauvegarde, la recopie par la même API dans la base
+cible (--target, sinon la base configurée), puis compare le nombre de lignes
+de chaque table au manifeste : code de sortie 1 au moindre écart.
 """
 from __future__ import annotations
 
+import argparse
 import gzip
+import json
 import os
-import shutil
+import sqlite3
 import subprocess
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parent.parent
+BACKUP_DIR = ROOT / "instance" / "backups"
 
 
 def load_dotenv_file() -> None:
@@ -43,39 +66,249 @@ def resolve_sqlite_path(url: str) -> Path | None:
     return db
 
 
+# -- SQLite -----------------------------------------------------------------------------
+
+class _Restarted(Exception):
+    """Trop de reprises de la copie par paquets (base modifiée pendant la copie)."""
+
+
+def table_counts(conn: sqlite3.Connection) -> dict[str, int]:
+    names = [
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    return {name: conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in names}
+
+
+def integrity_errors(conn: sqlite3.Connection, *, quick: bool = False) -> list[str]:
+    pragma = "quick_check" if quick else "integrity_check"
+    rows = [row[0] for row in conn.execute(f"PRAGMA {pragma}")]
+    return [] if rows == ["ok"] else rows
+
+
+def _copy(source: Path, dest: Path, *, pages: int, pause: float, max_restarts: int) -> dict:
+    """Copie `source` dans `dest` par l'API de sauvegarde ; renvoie {steps, restarts, single_pass}."""
+    stats = {"steps": 0, "restarts": 0, "single_pass": False}
+    previous = None
+
+    def progress(_status, remaining, _total):
+        nonlocal previous
+        stats["steps"] += 1
+        # Une écriture dans la source fait repartir la copie : le reste ne diminue plus.
+        if previous is not None and remaining >= previous:
+            stats["restarts"] += 1
+            if stats["restarts"] > max_restarts:
+                raise _Restarted
+        previous = remaining
+        if pause:
+            time.sleep(pause)
+
+    src = sqlite3.connect(source, timeout=30)
+    try:
+        for attempt_pages in (pages, -1):
+            dst = sqlite3.connect(dest)
+            try:
+                src.backup(dst, pages=attempt_pages, progress=progress if attempt_pages > 0 else None)
+                return stats
+            except _Restarted:
+                # En une passe : lecture cohérente sans reprise (en WAL, sans bloquer les écritures).
+                stats["single_pass"] = True
+            finally:
+                dst.close()
+    finally:
+        src.close()
+    return stats
+
+
+def backup_sqlite(source: Path, dest: Path, *, pages: int, pause: float, max_restarts: int,
+                  quick: bool) -> dict:
+    """Sauvegarde à chaud et vérifiée de `source` ; écrit `dest` et son manifeste, renvoie ce dernier."""
+    tmp = dest.with_name(dest.name + ".tmp")
+    started = time.perf_counter()
+    try:
+        stats = _copy(source, tmp, pages=pages, pause=pause, max_restarts=max_restarts)
+        conn = sqlite3.connect(tmp)
+        try:
+            # La copie hérite du mode WAL : on la repasse en fichier unique, autonome.
+            conn.execute("PRAGMA journal_mode=DELETE")
+            errors = integrity_errors(conn, quick=quick)
+            if errors:
+                raise RuntimeError("vérification d'intégrité en échec : " + "; ".join(errors[:5]))
+            counts = table_counts(conn)
+        finally:
+            conn.close()
+        tmp.replace(dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    manifest = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "source": str(source),
+        "bytes": dest.stat().st_size,
+        "seconds": round(time.perf_counter() - started, 2),
+        "integrity": "quick_check" if quick else "integrity_check",
+        **stats,
+        "tables": counts,
+    }
+    manifest_path(dest).write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+    return manifest
+
+
+def manifest_path(backup: Path) -> Path:
+    return backup.with_name(backup.name + ".json")
+
+
+def compare_counts(expected: dict[str, int], actual: dict[str, int]) -> list[str]:
+    problems = []
+    for name in sorted(set(expected) | set(actual)):
+        if name not in actual:
+            problems.append(f"{name} : table absente")
+        elif name not in expected:
+            problems.append(f"{name} : table absente du manifeste")
+        elif expected[name] != actual[name]:
+            problems.append(f"{name} : {actual[name]} lignes (manifeste : {expected[name]})")
+    return problems
+
+
+def verify_backup(backup: Path, *, quick: bool = False) -> list[str]:
+    """Problèmes détectés sur une sauvegarde SQLite (intégrité, écart avec son manifeste)."""
+    if not backup.is_file():
+        return [f"fichier introuvable ({backup})"]
+    conn = sqlite3.connect(f"file:{backup}?mode=ro", uri=True)
+    try:
+        problems = integrity_errors(conn, quick=quick)
+        counts = table_counts(conn)
+    finally:
+        conn.close()
+    mpath = manifest_path(backup)
+    if mpath.is_file():
+        problems += compare_counts(json.loads(mpath.read_text(encoding="utf-8"))["tables"], counts)
+    else:
+        problems.append(f"manifeste absent ({mpath.name})")
+    return problems
+
+
+def restore_sqlite(backup: Path, target: Path, *, pages: int) -> list[str]:
+    """Recopie `backup` dans `target` puis compare les lignes par table au manifeste."""
+    expected = json.loads(manifest_path(backup).read_text(encoding="utf-8"))["tables"]
+    src = sqlite3.connect(f"file:{backup}?mode=ro", uri=True)
+    dst = sqlite3.connect(target, timeout=30)
+    try:
+        src.backup(dst, pages=pages)
+        return compare_counts(expected, table_counts(dst))
+    finally:
+        dst.close()
+        src.close()
+
+
+def rotate(pattern: str, keep: int) -> list[Path]:
+    """Supprime les sauvegardes `pattern` au-delà des `keep` plus récentes (avec leur manifeste)."""
+    if keep <= 0:
+        return []
+    backups = sorted(BACKUP_DIR.glob(pattern), key=lambda p: p.stat().st_mtime, reverse=True)
+    removed = backups[keep:]
+    for path in removed:
+        path.unlink(missing_ok=True)
+        manifest_path(path).unlink(missing_ok=True)
+    return removed
+
+
+# -- point d'entrée ---------------------------------------------------------------------
+
+def configured_sqlite_path(url: str) -> Path | None:
+    if not url:
+        return ROOT / "instance" / "equipment.db"
+    if url.startswith("sqlite:"):
+        return resolve_sqlite_path(url)
+    return None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sauvegarde / vérification / restauration de la base AIM.")
+    parser.add_argument("--verify", type=Path, metavar="FICHIER", help="Vérifie une sauvegarde SQLite existante.")
+    parser.add_argument("--restore", type=Path, metavar="FICHIER", help="Restaure une sauvegarde SQLite.")
+    parser.add_argument("--target", type=Path, help="Base cible de --restore (défaut : base configurée).")
+    parser.add_argument("--yes", action="store_true", help="Confirme l'écrasement d'une base existante (--restore).")
+    parser.add_argument("--label", default="predeploy", help="Étiquette du nom de fichier (défaut : predeploy).")
+    parser.add_argument("--keep", type=int, default=int(os.environ.get("BACKUP_KEEP") or 14),
+                        help="Sauvegardes conservées par étiquette (0 : pas de rotation ; défaut : BACKUP_KEEP ou 14).")
+    parser.add_argument("--pages", type=int, default=1024, help="Pages copiées par paquet (-1 : en une passe).")
+    parser.add_argument("--step-pause-ms", type=float, default=10.0, help="Pause entre deux paquets.")
+    parser.add_argument("--max-restarts", type=int, default=3,
+                        help="Reprises tolérées avant de copier en une passe.")
+    parser.add_argument("--quick", action="store_true", help="PRAGMA quick_check au lieu de integrity_check.")
+    return parser.parse_args()
+
+
 def main() -> int:
     load_dotenv_file()
+    args = parse_args()
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-    backup_dir = ROOT / "instance" / "backups"
-    backup_dir.mkdir(parents=True, exist_ok=True)
+    BACKUP_DIR.mkdir(parents=True, exist_ok=True)
 
     url = (os.environ.get("DATABASE_URL") or "").strip()
-    sqlite_default = ROOT / "instance" / "equipment.db"
 
-    if not url:
-        if not sqlite_default.is_file():
-            print(
-                "backup-database: pas de DATABASE_URL et pas de instance/equipment.db — rien à sauvegarder.",
-                file=sys.stderr,
-            )
-            return 0
-        dest = backup_dir / f"equipment-predeploy-{ts}.db"
-        shutil.copy2(sqlite_default, dest)
-        print(f"backup-database: copie SQLite → {dest}")
+    if args.verify:
+        problems = verify_backup(args.verify, quick=args.quick)
+        for line in problems:
+            print(f"backup-database: {line}", file=sys.stderr)
+        if problems:
+            return 1
+        print(f"backup-database: {args.verify} vérifiée (intégrité, lignes par table).")
         return 0
 
-    if url.startswith("sqlite:"):
-        path = resolve_sqlite_path(url)
+    if args.restore:
+        target = args.target or configured_sqlite_path(url)
+        if target is None:
+            print("backup-database: --restore ne gère que SQLite (préciser --target).", file=sys.stderr)
+            return 1
+        problems = verify_backup(args.restore, quick=args.quick)
+        if problems:
+            for line in problems:
+                print(f"backup-database: {line}", file=sys.stderr)
+            print("backup-database: sauvegarde invalide, restauration annulée.", file=sys.stderr)
+            return 1
+        if target.exists() and not args.yes:
+            print(f"backup-database: {target} existe — relancer avec --yes pour l'écraser "
+                  "(application arrêtée de préférence).", file=sys.stderr)
+            return 1
+        problems = restore_sqlite(args.restore, target, pages=args.pages)
+        for line in problems:
+            print(f"backup-database: écart après restauration — {line}", file=sys.stderr)
+        if problems:
+            return 1
+        print(f"backup-database: {args.restore} → {target} (lignes par table identiques au manifeste).")
+        return 0
+
+    if not url or url.startswith("sqlite:"):
+        path = configured_sqlite_path(url)
         if path is None or not path.is_file():
+            if not url:
+                print(
+                    "backup-database: pas de DATABASE_URL et pas de instance/equipment.db — rien à sauvegarder.",
+                    file=sys.stderr,
+                )
+                return 0
             print(f"backup-database: fichier SQLite introuvable ({path})", file=sys.stderr)
             return 1
-        dest = backup_dir / f"equipment-predeploy-{ts}.db"
-        shutil.copy2(path, dest)
-        print(f"backup-database: copie SQLite → {dest}")
+        dest = BACKUP_DIR / f"equipment-{args.label}-{ts}.db"
+        try:
+            manifest = backup_sqlite(path, dest, pages=args.pages, pause=args.step_pause_ms / 1000,
+                                     max_restarts=args.max_restarts, quick=args.quick)
+        except (sqlite3.Error, RuntimeError) as exc:
+            print(f"backup-database: sauvegarde SQLite en échec ({exc})", file=sys.stderr)
+            return 1
+        print(
+            f"backup-database: sauvegarde SQLite → {dest} ({manifest['bytes'] / 1048576:.1f} Mio, "
+            f"{sum(manifest['tables'].values())} lignes, {manifest['seconds']} s, "
+            f"{manifest['restarts']} reprise(s){', copie en une passe' if manifest['single_pass'] else ''}) — vérifiée"
+        )
+        for old in rotate(f"equipment-{args.label}-*.db", args.keep):
+            print(f"backup-database: rotation, supprimé {old.name}")
         return 0
 
     if url.startswith(("postgresql:", "postgres:")):
-        dest = backup_dir / f"pg-predeploy-{ts}.sql.gz"
+        dest = BACKUP_DIR / f"pg-{args.label}-{ts}.sql.gz"
         r = subprocess.run(
             ["pg_dump", "--no-owner", "--no-acl", url],
             capture_output=True,
@@ -87,6 +320,8 @@ def main() -> int:
         with gzip.open(dest, "wb") as f:
             f.write(r.stdout)
         print(f"backup-database: dump PostgreSQL → {dest}")
+        for old in rotate(f"pg-{args.label}-*.sql.gz", args.keep):
+            print(f"backup-database: rotation, supprimé {old.name}")
         return 0
 
     print(
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""Banc d'essai des pages principales, avec seuils de régression.
+
+Démarre l'application sur une base SQLite temporaire remplie par
+`seed_synthetic` (ou sur --database-url, copie jetable d'une vraie base à
+confirmer par --i-know-this-is-a-scratch-db), se connecte avec un compte admin
+temporaire (mot de passe aléatoire, supprimé en fin de run) et chronomètre
+chaque route de ROUTES : percentiles de latence (p50 / p90 / p95 / p99) et
+nombre de requêtes SQL par appel.
+
+    python scripts/bench_routes.py                     # compare à la référence si elle existe
+    python scripts/bench_routes.py --update-baseline   # enregistre la référence
+    python scripts/bench_routes.py --archers 2000 --products 4000 --years 5 --only products
+
+Code de sortie 1 si une route dépasse la référence de plus de --tolerance
+(p50 et p95, au-delà de --min-delta-ms de bruit) ou fait plus de requêtes SQL.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import secrets
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DEFAULT_BASELINE = ROOT / "instance" / "bench_baseline.json"
+
+# (nom, URL) — les exports PDF passent par reportlab si WeasyPrint est absent.
+ROUTES = [
+    ("products", "/products"),
+    ("composites", "/composites"),
+    ("archers", "/archers"),
+    ("assignments", "/assignments"),
+    ("history", "/history"),
+    ("search", "/search?q=Hoyt"),
+    ("labels", "/inventaire/etiquettes?kind=mixed"),
+    ("inscription_evenement", "/inscription_evenement"),
+    ("export_products_csv", "/export_products_csv"),
+    ("export_archers_csv", "/export_archers_csv"),
+    ("export_composites_csv", "/export_composites_csv"),
+    ("export_assignments_csv", "/export_assignments_csv"),
+    ("export_products_pdf", "/export_products"),
+    ("export_assignments_pdf", "/export_assignments"),
+    ("export_composites_pdf", "/export_composites"),
+    ("export_archers_pdf", "/export_archers"),
+]
+
+BENCH_USER = "bench"
+# Tiré à chaque exécution : le compte admin du banc n'a jamais de mot de passe connu d'avance.
+BENCH_PASSWORD = secrets.token_urlsafe(16)
+# Licences des comptes archers jetables créés par load_test.py.
+SCRATCH_LICENSE_PREFIX = "CHARGE-"
+SCRATCH_FLAG = "--i-know-this-is-a-scratch-db"
+
+
+def has_real_data(db) -> bool:
+    """Vrai si la base contient d'autres comptes ou archers que ceux créés par les bancs d'essai."""
+    from sqlalchemy import exists, or_, select
+
+    from models import Archer, User
+
+    return db.session.scalar(select(or_(
+        exists().where(User.username != BENCH_USER),
+        exists().where(~Archer.license_number.startswith(SCRATCH_LICENSE_PREFIX)),
+    )))
+
+
+def boot_app(database_url: str | None, workdir: Path, *, archers: int, products: int, years: int,
+             seed: int, cache: bool = True, scratch: bool = False):
+    """Importe l'application sur une base dédiée (créée et remplie si besoin) ; renvoie (app, db).
+
+    Une base --database-url qui contient déjà des données réelles est refusée,
+    sauf si `scratch` confirme qu'il s'agit d'une copie jetable.
+    """
+    fresh = database_url is None
+    if fresh:
+        database_url = f"sqlite:///{workdir / 'bench.db'}"
+    # À fixer avant l'import de `app` : la configuration est lue à l'import.
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("CACHE_PATH", str(workdir / "cache.db"))
+    os.environ.setdefault("METRICS_PATH", str(workdir / "metrics.db"))
+    os.environ.setdefault("SLOW_QUERY_PATH", str(workdir / "perf.db"))
+    os.environ["CACHE_ENABLED"] = "true" if cache else "false"
+    # Toujours rendus : après l'échauffement, le cache disque ne mesurerait que des send_file.
+    os.environ["EXPORT_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("EXPORT_CACHE_PATH", str(workdir / "exports"))
+    os.environ.setdefault("SLOW_QUERY_THRESHOLD_MS", "0")
+    os.environ.setdefault("MAIL_SUPPRESS_SEND", "true")
+
+    from app import app
+    from models import User, db
+    from seed_synthetic import seed_synthetic_data
+
+    app.config["TESTING"] = True
+    with app.app_context():
+        if fresh:
+            db.create_all()
+            seed_synthetic_data(archers, products, years, seed=seed)
+        elif not scratch and has_real_data(db):
+            raise SystemExit(f"{database_url} contient déjà des données : travailler sur une copie "
+                             f"jetable de la base et la confirmer avec {SCRATCH_FLAG}.")
+        user = User.query.filter_by(username=BENCH_USER).first()
+        if user is None:
+            user = User(username=BENCH_USER, role="admin")
+            db.session.add(user)
+        user.set_password(BENCH_PASSWORD)
+        db.session.commit()
+    return app, db
+
+
+def remove_bench_user(app, db):
+    """Supprime le compte admin du banc (bases --database-url, qui survivent au script)."""
+    from models import User
+
+    with app.app_context():
+        User.query.filter_by(username=BENCH_USER).delete()
+        db.session.commit()
+
+
+def login_client(app):
+    client = app.test_client()
+    resp = client.post("/login", data={"username": BENCH_USER, "password": BENCH_PASSWORD})
+    if resp.status_code != 302:
+        raise SystemExit(f"Connexion impossible ({resp.status_code}).")
+    return client
+
+
+class QueryCounter:
+    """Compte les instructions SQL envoyées par le moteur de l'application."""
+
+    def __init__(self, app, db):
+        from sqlalchemy import event
+
+        self.count = 0
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *_args):
+        self.count += 1
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Percentile au rang le plus proche (valeurs déjà triées)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def bench_route(client, counter: QueryCounter, url: str, *, iterations: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        client.get(url).get_data()
+    timings, queries = [], []
+    status, size = None, 0
+    for _ in range(iterations):
+        before = counter.count
+        start = time.perf_counter()
+        resp = client.get(url)
+        body = resp.get_data()  # réponses en flux : le corps fait partie du temps mesuré
+        timings.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count - before)
+        status, size = resp.status_code, len(body)
+    timings.sort()
+    return {
+        "status": status,
+        "bytes": size,
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p90_ms": round(percentile(timings, 90), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "p99_ms": round(percentile(timings, 99), 2),
+        "max_ms": round(timings[-1], 2),
+        "mean_ms": round(sum(timings) / len(timings), 2),
+        "queries": sorted(queries)[len(queries) // 2],
+    }
+
+
+def compare(results: dict, baseline: dict, *, tolerance: float, min_delta_ms: float,
+            query_tolerance: float) -> list[str]:
+    """Régressions de `results` par rapport à `baseline` (liste de messages)."""
+    problems = []
+    for name, cur in results.items():
+        ref = baseline.get(name)
+        if ref is None:
+            continue
+        if cur["status"] != ref["status"]:
+            problems.append(f"{name} : statut {cur['status']} (référence {ref['status']})")
+        for key in ("p50_ms", "p95_ms"):
+            limit = ref[key] * (1 + tolerance)
+            if cur[key] > limit and cur[key] - ref[key] > min_delta_ms:
+                problems.append(
+                    f"{name} : {key} {cur[key]:.1f} ms > {ref[key]:.1f} ms + {tolerance:.0%}"
+                )
+        if cur["queries"] > ref["queries"] * (1 + query_tolerance):
+            problems.append(f"{name} : {cur['queries']} requêtes SQL (référence {ref['queries']})")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Banc d'essai des routes AIM (latence, requêtes SQL).")
+    parser.add_argument("--database-url", help="Copie jetable d'une base à mesurer (sinon base temporaire synthétique).")
+    parser.add_argument(SCRATCH_FLAG, dest="scratch", action="store_true",
+                        help="Confirme que --database-url est une copie jetable (base contenant déjà des données).")
+    parser.add_argument("--archers", type=int, default=500)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42, help="Graine du jeu synthétique (runs comparables).")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", action="append", default=[], help="Nom de route (répétable).")
+    parser.add_argument("--no-cache", action="store_true", help="Désactive le cache applicatif.")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Écrit les résultats comme référence.")
+    parser.add_argument("--output", type=Path, help="Écrit aussi les résultats de ce run dans ce fichier JSON.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Hausse de latence tolérée (0.25 = +25 %%).")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Écart ignoré (bruit), en ms.")
+    parser.add_argument("--query-tolerance", type=float, default=0.0, help="Hausse tolérée du nombre de requêtes SQL.")
+    args = parser.parse_args()
+
+    routes = [(n, u) for n, u in ROUTES if not args.only or n in args.only]
+    if not routes:
+        print("Aucune route sélectionnée.", file=sys.stderr)
+        return 2
+
+    with tempfile.TemporaryDirectory(prefix="aim-bench-") as tmp:
+        started = time.perf_counter()
+        app, db = boot_app(args.database_url, Path(tmp), archers=args.archers, products=args.products,
+                           years=args.years, seed=args.seed, cache=not args.no_cache, scratch=args.scratch)
+        print(f"Base prête en {time.perf_counter() - started:.1f} s.", file=sys.stderr)
+        try:
+            counter = QueryCounter(app, db)
+            client = login_client(app)
+            results = {}
+            for name, url in routes:
+                results[name] = res = bench_route(client, counter, url, iterations=args.iterations,
+                                                  warmup=args.warmup)
+                print(f"{name:<26} {res['status']}  p50 {res['p50_ms']:>8.1f} ms  p95 {res['p95_ms']:>8.1f} ms"
+                      f"  max {res['max_ms']:>8.1f} ms  {res['queries']:>5} req. SQL")
+        finally:
+            if args.database_url:
+                remove_bench_user(app, db)
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "dataset": {"archers": args.archers, "products": args.products, "years": args.years,
+                    "seed": args.seed, "database_url": args.database_url},
+        "cache": not args.no_cache,
+        "routes": results,
+    }
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Référence écrite : {args.baseline}")
+        return 0
+    if not args.baseline.is_file():
+        print(f"Pas de référence ({args.baseline}) : relancer avec --update-baseline.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("dataset") != report["dataset"]:
+        print("Attention : jeu de données différent de celui de la référence.", file=sys.stderr)
+    problems = compare(results, baseline.get("routes", {}), tolerance=args.tolerance,
+                       min_delta_ms=args.min_delta_ms, query_tolerance=args.query_tolerance)
+    if problems:
+        print("\nRégressions :")
+        for line in problems:
+            print(f"  - {line}")
+        return 1
+    print("\nAucune régression par rapport à la référence.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
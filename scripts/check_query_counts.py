@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Vérifie que le nombre de requêtes SQL des vues ne dépend pas du volume de données.
+
+Chaque vue de VIEWS est appelée sur un premier jeu synthétique, puis de
+nouveau après avoir ajouté --scale fois plus de données dans la même base
+(`seed_synthetic` fonctionne sur une base non vide). Une vue sans N+1 fait le
+même nombre de requêtes aux deux tailles : toute hausse au-delà de --slack
+fait échouer le script (code de sortie 1), avec le détail des vues fautives.
+
+    python scripts/check_query_counts.py
+    python scripts/check_query_counts.py --archers 50 --products 100 --scale 4 -v
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from bench_routes import QueryCounter, boot_app, login_client  # noqa: E402
+
+ARCHER_PASSWORD = "archer-password"
+
+# (nom, URL ou fabrique d'URL(ids), espace) — espace « staff » ou « archer ».
+VIEWS = [
+    ("archers", "/archers", "staff"),
+    ("products", "/products", "staff"),
+    ("composites", "/composites", "staff"),
+    ("assign", "/assign", "staff"),
+    ("assign_product", "/assign_product", "staff"),
+    ("assignments", "/assignments", "staff"),
+    ("add_composite", "/add_composite", "staff"),
+    ("edit_composite", lambda ids: f"/edit_composite/{ids['composite']}", "staff"),
+    ("archer_portal", "/espace-archer", "archer"),
+    ("archer_my_bow", "/espace-archer/mon-arc", "archer"),
+    ("archer_my_courses", "/espace-archer/mes-cours", "archer"),
+    ("archer_events", "/espace-archer/evenements", "archer"),
+]
+
+
+def _portal_archer(db):
+    """Archer de référence (avec un prêt, des cours, des inscriptions) doté d'un compte."""
+    from sqlalchemy import func, select
+
+    from models import Archer, Assignment, InscriptionEventRegistration
+
+    archer_id = db.session.scalar(
+        select(Assignment.archer_id)
+        .join(InscriptionEventRegistration, InscriptionEventRegistration.archer_id == Assignment.archer_id)
+        .group_by(Assignment.archer_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    ) or db.session.scalar(select(Archer.id).order_by(Archer.id).limit(1))
+    archer = db.session.get(Archer, archer_id)
+    if not archer.email:
+        archer.email = f"portail.{archer.id}@exemple.fr"
+    archer.set_password(ARCHER_PASSWORD)
+    db.session.commit()
+    return archer.email
+
+
+def _reference_ids(db):
+    from sqlalchemy import select
+
+    from models import Assignment, CompositeProduct
+
+    # Un arc avec un historique de prêts : les N+1 de la page d'édition se voient.
+    composite = db.session.scalar(
+        select(Assignment.composite_id).order_by(Assignment.id).limit(1)
+    ) or db.session.scalar(select(CompositeProduct.id).order_by(CompositeProduct.id).limit(1))
+    return {"composite": composite}
+
+
+def measure(app, counter, clients, ids) -> dict[str, tuple[int, int]]:
+    """{vue: (statut, requêtes SQL)} ; deuxième appel mesuré (caches applicatifs chauds)."""
+    results = {}
+    for name, url, space in VIEWS:
+        url = url(ids) if callable(url) else url
+        client = clients[space]
+        client.get(url).get_data()
+        before = counter.count
+        resp = client.get(url)
+        resp.get_data()
+        results[name] = (resp.status_code, counter.count - before)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Détecte les vues dont le nombre de requêtes SQL croît avec les données.")
+    parser.add_argument("--archers", type=int, default=40)
+    parser.add_argument("--products", type=int, default=120)
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--scale", type=int, default=3, help="Multiplicateur du second jeu de données.")
+    parser.add_argument("--slack", type=int, default=0, help="Requêtes supplémentaires tolérées.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="aim-queries-") as tmp:
+        # Cache désactivé : on compte les requêtes des vues elles-mêmes, pas celles évitées par le cache.
+        app, db = boot_app(None, Path(tmp), archers=args.archers, products=args.products,
+                           years=args.years, seed=args.seed, cache=False)
+        counter = QueryCounter(app, db)
+        from seed_synthetic import seed_synthetic_data
+
+        with app.app_context():
+            email = _portal_archer(db)
+            ids = _reference_ids(db)
+        clients = {"staff": login_client(app), "archer": app.test_client()}
+        resp = clients["archer"].post("/login", data={"username": email, "password": ARCHER_PASSWORD})
+        if resp.status_code != 302:
+            print("Connexion archer impossible.", file=sys.stderr)
+            return 2
+
+        small = measure(app, counter, clients, ids)
+        with app.app_context():
+            seed_synthetic_data(args.archers * (args.scale - 1), args.products * (args.scale - 1),
+                                args.years, seed=args.seed + 1)
+        large = measure(app, counter, clients, ids)
+
+    failures = []
+    width = max(len(name) for name, _url, _space in VIEWS)
+    for name, _url, _space in VIEWS:
+        (s_status, s_count), (l_status, l_count) = small[name], large[name]
+        ok = s_status == l_status == 200 and l_count <= s_count + args.slack
+        if not ok:
+            failures.append(name)
+        if args.verbose or not ok:
+            print(f"{name:<{width}}  {s_count:>5} → {l_count:>5} requêtes  "
+                  f"(statuts {s_status}/{l_status}){'' if ok else '  ÉCHEC'}")
+    if failures:
+        print(f"\n{len(failures)} vue(s) dont le nombre de requêtes croît avec les données : {', '.join(failures)}")
+        return 1
+    print(f"{len(VIEWS)} vues vérifiées : nombre de requêtes SQL indépendant du volume.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
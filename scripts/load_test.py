@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""Générateur de charge concurrent contre une instance gunicorn locale.
+
+Des utilisateurs virtuels (threads, un cookie de session chacun) rejouent un
+mélange réaliste d'une soirée d'entraînement :
+
+- encadrants (compte staff) : rafraîchissement du tableau des prêts, scans
+  d'étiquettes (/inventaire/lookup), saisie des présences d'un cours ;
+- archers (espace archer) : navigation dans leur espace, puis rafales
+  d'inscription simultanées sur un événement ouvert (--bursts rafales
+  réparties sur la durée du test, tous les archers postent en même temps).
+
+Sans --url, le script prépare une base SQLite synthétique (`seed_synthetic`)
+et démarre lui-même gunicorn (--workers, --threads) : de quoi comparer des
+réglages de workers, de WAL ou de pool avant la rentrée (gunicorn hérite des
+variables SQLITE_* / PG_POOL_* de l'environnement). Avec --url, il vise
+une instance déjà lancée sur la base --database-url, préparée de la même
+façon : archers jetables (licences CHARGE-…), compte encadrant temporaire à
+mot de passe aléatoire, événement ouvert ; tout est retiré en fin de test.
+Cette base doit être une copie jetable : une base qui contient déjà des
+données n'est acceptée qu'avec --i-know-this-is-a-scratch-db.
+
+Rapport : débit (req/s), latences p50 / p95 / p99 / max par scénario, codes
+HTTP, erreurs de verrou de la base (compteur aim_db_lock_errors_total de
+/metrics et lignes « database is locked » du journal gunicorn).
+
+    python scripts/load_test.py --workers 3 --staff-users 4 --archer-users 30 --duration 60
+    SQLITE_JOURNAL_MODE=DELETE SQLITE_BUSY_TIMEOUT_MS=0 python scripts/load_test.py --workers 6
+    cp /srv/aim/instance/aim.db /tmp/aim-charge.db   # instance de test lancée sur cette copie
+    python scripts/load_test.py --url http://127.0.0.1:5002 --database-url sqlite:////tmp/aim-charge.db --i-know-this-is-a-scratch-db
+
+Code de sortie 1 en cas d'erreur de verrou ou de réponse 5xx.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from bench_routes import (  # noqa: E402
+    BENCH_PASSWORD,
+    BENCH_USER,
+    SCRATCH_FLAG,
+    SCRATCH_LICENSE_PREFIX,
+    boot_app,
+    percentile,
+    remove_bench_user,
+)
+
+ARCHER_PASSWORD = "charge-password"
+EVENT_TITLE = "Test de charge"
+DEFAULT_MIX = "tableau_prets=5,scan=4,presences=1"
+LOCK_MARKERS = ("database is locked", "database table is locked", "deadlock detected")
+
+
+# -- préparation de la base -------------------------------------------------------
+
+def prepare_targets(db, archer_users: int) -> dict:
+    """Comptes archers jetables, événement ouvert et cibles des scénarios (codes, cours).
+
+    Les archers existants ne sont pas modifiés : le test crée ses propres
+    comptes (licence SCRATCH_LICENSE_PREFIX…), retirés par `cleanup_targets`.
+    """
+    from sqlalchemy import select
+    from werkzeug.security import generate_password_hash
+
+    from models import Archer, Course, InscriptionEvent, Product
+
+    # Un seul hachage pour tous les comptes : le hachage coûte ~0,3 s par appel.
+    password_hash = generate_password_hash(ARCHER_PASSWORD)
+    emails = []
+    for i in range(archer_users):
+        license_number = f"{SCRATCH_LICENSE_PREFIX}{i:05d}"
+        archer = db.session.scalar(select(Archer).filter_by(license_number=license_number))
+        if archer is None:
+            # Reste d'un run interrompu réutilisé tel quel, sinon nouveau compte.
+            archer = Archer(license_number=license_number, first_name="Charge", last_name=f"Archer {i}",
+                            email=f"charge.{i}@exemple.invalid")
+            db.session.add(archer)
+        archer.password_hash = password_hash
+        emails.append(archer.email)
+
+    event = db.session.scalar(select(InscriptionEvent).filter_by(title=EVENT_TITLE))
+    if event is None:
+        event = InscriptionEvent(title=EVENT_TITLE, lieu="Gymnase", start_date=date.today() + timedelta(days=30))
+        db.session.add(event)
+    event.open_for_archer_registration = True
+    event.archer_registration_deadline = None
+    db.session.commit()
+
+    tags = db.session.scalars(select(Product.tag).where(Product.tag.isnot(None)).limit(500)).all()
+    courses = []
+    for course in db.session.scalars(select(Course).order_by(Course.id)).all():
+        archer_ids = [a.id for a in course.archers]
+        if archer_ids:
+            courses.append({"id": course.id, "day_of_week": course.day_of_week, "archers": archer_ids})
+    return {"archers": emails, "event_id": event.id, "tags": tags, "courses": courses}
+
+
+def cleanup_targets(db, event_id: int) -> None:
+    """Retire l'événement de test (et ses inscriptions) puis les comptes archers jetables."""
+    from sqlalchemy import select
+
+    from models import Archer, InscriptionEvent
+
+    event = db.session.get(InscriptionEvent, event_id)
+    if event is not None:
+        db.session.delete(event)
+    for archer in db.session.scalars(
+            select(Archer).where(Archer.license_number.startswith(SCRATCH_LICENSE_PREFIX))):
+        db.session.delete(archer)
+    db.session.commit()
+
+
+# -- gunicorn ---------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers: int, threads: int, log_path: Path) -> tuple[subprocess.Popen, str]:
+    """Lance gunicorn (même environnement que ce processus) et attend qu'il réponde."""
+    port = _free_port()
+    log = open(log_path, "wb")
+    proc = subprocess.Popen(
+        ["gunicorn", "--workers", str(workers), "--threads", str(threads),
+         "--bind", f"127.0.0.1:{port}", "--timeout", "120", "app:app"],
+        cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+    )
+    log.close()
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn s'est arrêté au démarrage (voir {log_path}).")
+        try:
+            urllib.request.urlopen(base_url + "/login", timeout=2).read()
+            return proc, base_url
+        except OSError:
+            time.sleep(0.3)
+    proc.terminate()
+    raise SystemExit("gunicorn ne répond pas après 60 s.")
+
+
+# -- client HTTP ------------------------------------------------------------------
+
+class Session:
+    """Client HTTP avec cookies (un par utilisateur virtuel) ; suit les redirections."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, path: str, data: dict | None = None) -> tuple[int, str, str]:
+        """(statut, URL finale, corps) ; statut 0 si la connexion a échoué."""
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        try:
+            with self._opener.open(self.base_url + path, data=body, timeout=self.timeout) as resp:
+                return resp.status, resp.geturl(), resp.read().decode("utf-8", "replace")
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.geturl(), exc.read().decode("utf-8", "replace")
+        except OSError as exc:
+            return 0, self.base_url + path, str(exc)
+
+
+
+class Recorder:
+    """Latences et statuts par scénario, partagés entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.statuses: dict[str, dict[int, int]] = {}
+
+    def timed(self, scenario: str, session: Session, path: str, data: dict | None = None):
+        start = time.perf_counter()
+        status, final_url, body = session.request(path, data)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.samples.setdefault(scenario, []).append(elapsed)
+            counts = self.statuses.setdefault(scenario, {})
+            counts[status] = counts.get(status, 0) + 1
+        return status, final_url, body
+
+    def login(self, session: Session, username: str, password: str) -> bool:
+        status, final_url, _body = self.timed("connexion", session, "/login",
+                                              {"username": username, "password": password})
+        return status == 200 and not urllib.parse.urlparse(final_url).path.startswith("/login")
+
+
+class BurstSignal:
+    """Déclenchement simultané des rafales d'inscription (numéro de génération)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.generation = 0
+
+    def fire(self):
+        with self._cond:
+            self.generation += 1
+            self._cond.notify_all()
+
+    def wait(self, seen: int, timeout: float) -> int:
+        with self._cond:
+            self._cond.wait_for(lambda: self.generation != seen, timeout)
+            return self.generation
+
+
+# -- scénarios ----------------------------------------------------------------------
+
+def _last_course_day(day_of_week: int) -> str:
+    today = date.today()
+    return (today - timedelta(days=(today.weekday() - day_of_week) % 7)).isoformat()
+
+
+def staff_user(base_url, targets, mix, recorder, ready, stop, think, timeout, rng, failures):
+    session = Session(base_url, timeout)
+    logged_in = recorder.login(session, BENCH_USER, BENCH_PASSWORD)
+    ready.wait()
+    if not logged_in:
+        failures.append("connexion encadrant")
+        return
+    names, weights = zip(*mix.items())
+    while not stop.is_set():
+        scenario = rng.choices(names, weights)[0]
+        if scenario == "tableau_prets":
+            recorder.timed(scenario, session, "/assignments")
+        elif scenario == "scan" and targets["tags"]:
+            tag = rng.choice(targets["tags"])
+            recorder.timed(scenario, session, "/inventaire/lookup?" + urllib.parse.urlencode({"q": tag}))
+        elif scenario == "presences" and targets["courses"]:
+            course = rng.choice(targets["courses"])
+            recorder.timed(scenario, session, f"/course/{course['id']}/attendance")
+            form = {"date": _last_course_day(course["day_of_week"])}
+            form.update({f"archer_{aid}": "on" for aid in course["archers"] if rng.random() < 0.8})
+            recorder.timed(scenario, session, f"/course/{course['id']}/mark_attendance", form)
+        stop.wait(rng.expovariate(1 / think) if think > 0 else 0)
+
+
+def archer_user(base_url, email, targets, recorder, ready, stop, burst, think, timeout, rng, failures):
+    session = Session(base_url, timeout)
+    logged_in = recorder.login(session, email, ARCHER_PASSWORD)
+    ready.wait()
+    if not logged_in:
+        failures.append(f"connexion archer {email}")
+        return
+    event_path = f"/espace-archer/evenements/{targets['event_id']}/inscription"
+    seen = burst.generation
+    while not stop.is_set():
+        generation = burst.wait(seen, rng.expovariate(1 / think) if think > 0 else 0)
+        if stop.is_set():
+            break
+        if generation != seen:
+            seen = generation
+            # Ouverture des inscriptions : tout le monde poste en même temps.
+            recorder.timed("inscription_rafale", session, event_path, {})
+            continue
+        recorder.timed("espace_archer", session, rng.choice(
+            ["/espace-archer", "/espace-archer/mon-arc", "/espace-archer/evenements"]
+        ))
+
+
+# -- mesures côté serveur -------------------------------------------------------------
+
+def scrape_lock_errors(base_url: str, token: str | None) -> int | None:
+    """Somme du compteur aim_db_lock_errors_total (None si /metrics est inaccessible)."""
+    req = urllib.request.Request(base_url.rstrip("/") + "/metrics")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            text = resp.read().decode("utf-8")
+    except OSError:
+        return None
+    total = 0
+    for match in re.finditer(r"^aim_db_lock_errors_total(?:\{[^}]*\})? (\S+)$", text, re.M):
+        total += int(float(match.group(1)))
+    return total
+
+
+def read_lock_errors(metrics_path: str) -> int | None:
+    """Même compteur, lu directement dans le fichier partagé des métriques."""
+    import sqlite3
+
+    if not os.path.isfile(metrics_path):
+        return None
+    conn = sqlite3.connect(metrics_path)
+    try:
+        (total,) = conn.execute(
+            "SELECT COALESCE(SUM(value), 0) FROM metric WHERE name = 'aim_db_lock_errors_total'"
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    return int(total)
+
+
+def count_log_lock_errors(log_path: Path | None) -> int | None:
+    if log_path is None or not log_path.is_file():
+        return None
+    # Une trace par erreur : la ligne finale « sqlalchemy.exc.OperationalError: … » (la
+    # cause DBAPI chaînée répète le message plus haut dans la même trace).
+    lines = log_path.read_text(encoding="utf-8", errors="replace").lower().splitlines()
+    return sum(1 for line in lines
+               if line.startswith("sqlalchemy.exc.") and any(m in line for m in LOCK_MARKERS))
+
+
+def _parse_mix(raw: str) -> dict[str, float]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("tableau_prets", "scan", "presences"):
+            raise SystemExit(f"Scénario inconnu dans --mix : {name!r}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Test de charge concurrent (encadrants + archers) contre gunicorn.")
+    parser.add_argument("--url", help="Instance déjà lancée (sinon gunicorn est démarré par le script).")
+    parser.add_argument("--database-url", help="Base de l'instance visée (obligatoire avec --url), copie jetable.")
+    parser.add_argument(SCRATCH_FLAG, dest="scratch", action="store_true",
+                        help="Confirme que --database-url est une copie jetable (base contenant déjà des données).")
+    parser.add_argument("--workers", type=int, default=3, help="Workers gunicorn (instance démarrée par le script).")
+    parser.add_argument("--threads", type=int, default=1, help="Threads par worker gunicorn.")
+    parser.add_argument("--archers", type=int, default=300, help="Archers du jeu synthétique.")
+    parser.add_argument("--products", type=int, default=600, help="Produits du jeu synthétique.")
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--staff-users", type=int, default=4)
+    parser.add_argument("--archer-users", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=60, help="Durée du test, en secondes.")
+    parser.add_argument("--bursts", type=int, default=3, help="Rafales d'inscription pendant le test.")
+    parser.add_argument("--staff-think", type=float, default=1.0, help="Pause moyenne entre actions encadrant (s).")
+    parser.add_argument("--archer-think", type=float, default=5.0, help="Pause moyenne entre pages archer (s).")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Poids des scénarios encadrant (défaut {DEFAULT_MIX}).")
+    parser.add_argument("--timeout", type=float, default=30, help="Délai maximal d'une requête (s).")
+    parser.add_argument("--metrics-token", default=os.environ.get("METRICS_TOKEN"))
+    parser.add_argument("--output", type=Path, help="Écrit aussi le rapport dans ce fichier JSON.")
+    args = parser.parse_args()
+    if args.url and not args.database_url:
+        parser.error("--url demande --database-url (préparation des comptes de test).")
+    mix = _parse_mix(args.mix)
+
+    with tempfile.TemporaryDirectory(prefix="aim-load-") as tmp:
+        workdir = Path(tmp)
+        app, db = boot_app(args.database_url, workdir, archers=args.archers, products=args.products,
+                           years=args.years, seed=args.seed, scratch=args.scratch)
+        with app.app_context():
+            targets = prepare_targets(db, args.archer_users)
+            db.session.remove()
+            db.engine.dispose()
+        archer_emails = targets["archers"][:args.archer_users]
+
+        proc, log_path, base_url = None, None, args.url
+        if base_url is None:
+            log_path = workdir / "gunicorn.log"
+            proc, base_url = start_gunicorn(args.workers, args.threads, log_path)
+        try:
+            if proc is None:
+                lock_before = scrape_lock_errors(base_url, args.metrics_token)
+            else:
+                lock_before = read_lock_errors(os.environ["METRICS_PATH"]) or 0
+            recorder, stop, burst, failures = Recorder(), threading.Event(), BurstSignal(), []
+            rng = random.Random(args.seed)
+            ready = threading.Barrier(args.staff_users + len(archer_emails) + 1)
+            threads = [
+                threading.Thread(target=staff_user, daemon=True, args=(
+                    base_url, targets, mix, recorder, ready, stop, args.staff_think, args.timeout,
+                    random.Random(rng.random()), failures))
+                for _ in range(args.staff_users)
+            ] + [
+                threading.Thread(target=archer_user, daemon=True, args=(
+                    base_url, email, targets, recorder, ready, stop, burst, args.archer_think, args.timeout,
+                    random.Random(rng.random()), failures))
+                for email in archer_emails
+            ]
+            print(f"{args.staff_users} encadrant(s), {len(archer_emails)} archer(s)"
+                  f" sur {base_url} pendant {args.duration:.0f} s…", file=sys.stderr)
+            for thread in threads:
+                thread.start()
+            # Connexions d'abord (hachage des mots de passe), hors de la fenêtre mesurée.
+            ready.wait()
+            started = time.perf_counter()
+            burst_times = [args.duration * (i + 1) / (args.bursts + 1) for i in range(args.bursts)]
+            for at in burst_times:
+                stop.wait(max(0.0, at - (time.perf_counter() - started)))
+                burst.fire()
+            stop.wait(max(0.0, args.duration - (time.perf_counter() - started)))
+            stop.set()
+            elapsed = time.perf_counter() - started
+            for thread in threads:
+                thread.join(args.timeout + 5)
+            # Instance externe : compteurs des workers vidés au plus toutes les METRICS_FLUSH_INTERVAL s.
+            lock_after = scrape_lock_errors(base_url, args.metrics_token) if proc is None else None
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(30)
+                # Les workers vident leurs compteurs à l'arrêt : le fichier est alors complet.
+                lock_after = read_lock_errors(os.environ["METRICS_PATH"])
+            if args.database_url:
+                # Base qui survit au script : comptes de test et événement retirés.
+                with app.app_context():
+                    cleanup_targets(db, targets["event_id"])
+                    db.session.remove()
+                remove_bench_user(app, db)
+        log_locks = count_log_lock_errors(log_path)
+
+    scenarios = {}
+    for name, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        statuses = recorder.statuses[name]
+        scenarios[name] = {
+            "requests": len(samples),
+            "errors": sum(n for code, n in statuses.items() if code == 0 or code >= 500),
+            "statuses": {str(code): n for code, n in sorted(statuses.items())},
+            "throughput_rps": round(len(samples) / elapsed, 2) if name != "connexion" else None,
+            "p50_ms": round(percentile(samples, 50), 1),
+            "p95_ms": round(percentile(samples, 95), 1),
+            "p99_ms": round(percentile(samples, 99), 1),
+            "max_ms": round(samples[-1], 1),
+        }
+    # Les connexions précèdent la fenêtre mesurée : affichées à part, hors totaux.
+    all_samples = sorted(s for name, samples in recorder.samples.items() if name != "connexion" for s in samples)
+    metric_locks = None if lock_before is None or lock_after is None else lock_after - lock_before
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "target": args.url or f"gunicorn --workers {args.workers} --threads {args.threads}",
+        "users": {"staff": args.staff_users, "archers": len(archer_emails)},
+        "duration_s": round(elapsed, 1),
+        "requests": len(all_samples),
+        "throughput_rps": round(len(all_samples) / elapsed, 2),
+        "p50_ms": round(percentile(all_samples, 50), 1),
+        "p95_ms": round(percentile(all_samples, 95), 1),
+        "p99_ms": round(percentile(all_samples, 99), 1),
+        "errors": sum(s["errors"] for s in scenarios.values()),
+        "lock_errors": {"metrics": metric_locks, "server_log": log_locks},
+        "login_failures": failures,
+        "scenarios": scenarios,
+    }
+
+    print(f"\n{'scénario':<20} {'req':>6} {'err':>5} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  statuts")
+    for name, s in scenarios.items():
+        statuses = " ".join(f"{code}×{n}" for code, n in s["statuses"].items())
+        rps = "-" if s["throughput_rps"] is None else f"{s['throughput_rps']:.1f}"
+        print(f"{name:<20} {s['requests']:>6} {s['errors']:>5} {rps:>7} {s['p50_ms']:>8.1f}"
+              f" {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}  {statuses}")
+    print(f"\nTotal : {report['requests']} requêtes en {elapsed:.1f} s ({report['throughput_rps']:.1f} req/s),"
+          f" p50 {report['p50_ms']:.1f} ms, p95 {report['p95_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms,"
+          f" {report['errors']} erreur(s) 5xx / connexion")
+    print("Erreurs de verrou : "
+          f"{'n/d' if metric_locks is None else metric_locks} (/metrics), "
+          f"{'n/d' if log_locks is None else log_locks} (journal gunicorn)")
+    for failure in failures:
+        print(f"Échec : {failure}", file=sys.stderr)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 1 if report["errors"] or metric_locks or log_locks or failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
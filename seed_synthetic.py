@@ -0,0 +1,404 @@
+"""Jeu de données synthétique à l'échelle voulue (banc d'essai, tests de charge).
+
+`flask seed-synthetic --archers N --products M --years Y` ajoute — sans rien
+effacer, même sur une base déjà remplie — des archers, du matériel, des arcs
+montés et Y saisons d'activité : prêts d'arcs et de produits (retournés ou en
+cours), cours et présences hebdomadaires, historique, événements d'inscription.
+
+Les distributions suivent grossièrement un club réel : prêts concentrés à la
+rentrée de septembre, rendus en fin de saison, pas de cours l'été, ~80 % de
+présence. Toutes les lignes sont écrites par INSERT groupés (`insert(Model)`
+avec une liste de valeurs), par lots de `batch_size`.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from models import (
+    Archer,
+    Assignment,
+    Attendance,
+    Category,
+    CompositeProduct,
+    Course,
+    HistoryEvent,
+    InscriptionEvent,
+    InscriptionEventRegistration,
+    Product,
+    ProductAssignment,
+    archer_courses,
+    composite_components,
+    db,
+)
+
+# (nom, a une marque, a un modèle, champs personnalisés, unités, poids dans le parc)
+_CATEGORIES = [
+    ('Poignée', True, True, None, None, 10),
+    ('Branchages', True, True, None, None, 12),
+    ('Flèches', True, False, 'spine,longueur', {'spine': '', 'longueur': 'pouces'}, 20),
+    ('Viseur', True, True, None, None, 8),
+    ('Stabilisateur', True, False, None, None, 8),
+    ('Repose-flèche', True, False, None, None, 6),
+    ('Palette', True, False, None, None, 8),
+    ('Dragonne', False, False, None, None, 4),
+    ('Carquois', True, False, None, None, 5),
+    ('Plastron', False, False, None, None, 5),
+]
+# Catégories montées sur un arc (une pièce de chaque).
+_BOW_PARTS = ('Poignée', 'Branchages', 'Viseur', 'Stabilisateur')
+
+_BRANDS = {
+    'Poignée': [('Hoyt', ['Formula Xi', 'Satori', 'Excel']), ('WNS', ['Elite', 'Motive']),
+                ('Samick', ['Avanza', 'Polaris']), ('Win&Win', ['Wiawis', 'Inno'])],
+    'Branchages': [('Hoyt', ['Quattro', 'Grand Prix']), ('Uukha', ['VX1000', 'SX50']),
+                   ('SF', ['Premium', 'Axiom']), ('Core', ['Jet', 'Pulse'])],
+    'Viseur': [('Shibuya', ['DX', 'Ultima']), ('Axcel', ['Achieve']), ('Cartel', ['Focus'])],
+}
+_GENERIC_BRANDS = ['Easton', 'Avalon', 'Decut', 'AAE', 'Beiter', 'Fivics', 'Cartel', 'Gas Pro']
+
+_FIRST_NAMES = ['Marie', 'Lucas', 'Sophie', 'Thomas', 'Émilie', 'Antoine', 'Camille', 'Hugo', 'Léa',
+                'Louis', 'Chloé', 'Nathan', 'Manon', 'Jules', 'Inès', 'Paul', 'Sarah', 'Arthur',
+                'Julie', 'Mathis', 'Clara', 'Noah', 'Zoé', 'Gabriel', 'Anaïs', 'Raphaël']
+_LAST_NAMES = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand',
+               'Leroy', 'Moreau', 'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David',
+               'Bertrand', 'Roux', 'Vincent', 'Fournier', 'Morel', 'Girard', 'André', 'Mercier']
+# (catégorie d'âge, âge min, âge max, poids)
+_AGE_CATEGORIES = [('U11', 8, 10, 8), ('U13', 11, 12, 12), ('U15', 13, 14, 14), ('U18', 15, 17, 14),
+                   ('U21', 18, 20, 8), ('S1', 21, 39, 18), ('S2', 40, 59, 16), ('S3', 60, 80, 10)]
+_BOW_TYPES = [('Classique', 60), ('Poulies', 18), ('Barebow', 17), ('Arc droit', 5)]
+_DISCIPLINES = [('salle', 45), ('exterieur_di', 25), ('parcours', 10), ('campagne', 8),
+                ('nature', 7), ('beursault', 5)]
+_WEAPONS = {'Classique': 'CL', 'Poulies': 'CO', 'Barebow': 'BB', 'Arc droit': 'AD'}
+_COURSE_SLOTS = [(0, '18:00', '20:00', 'débutant'), (2, '18:00', '20:00', 'débutant'),
+                 (2, '20:00', '22:00', 'avancé'), (3, '18:30', '20:30', 'intermédiaire'),
+                 (5, '10:00', '12:00', 'intermédiaire'), (5, '14:00', '16:00', 'débutant'),
+                 (6, '10:00', '12:00', 'avancé')]
+
+
+def _weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights)[0]
+
+
+class _Writer:
+    """INSERT groupés par lots ; `ids()` renvoie les clés générées, dans l'ordre des lignes."""
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.rows = 0
+
+    def _chunks(self, rows):
+        for i in range(0, len(rows), self.batch_size):
+            yield rows[i:i + self.batch_size]
+
+    def insert(self, target, rows):
+        for chunk in self._chunks(rows):
+            db.session.execute(insert(target), chunk)
+        self.rows += len(rows)
+
+    def ids(self, model, rows):
+        ids = []
+        stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+        for chunk in self._chunks(rows):
+            ids.extend(db.session.scalars(stmt, chunk).all())
+        self.rows += len(rows)
+        return ids
+
+
+def _ensure_categories(writer):
+    """{nom: id} des catégories synthétiques, en réutilisant celles qui existent déjà."""
+    existing = dict(db.session.execute(select(Category.name, Category.id)).all())
+    position = (db.session.scalar(select(func.max(Category.position))) or 0) + 1
+    missing = []
+    for name, has_brand, has_model, fields, units, _weight in _CATEGORIES:
+        if name in existing:
+            continue
+        missing.append({
+            'name': name, 'position': position, 'has_brand': has_brand, 'has_model': has_model,
+            'custom_fields': fields, 'field_units': units,
+        })
+        position += 1
+    if missing:
+        existing.update(zip((r['name'] for r in missing), writer.ids(Category, missing)))
+    return {name: existing[name] for name, *_rest in _CATEGORIES}
+
+
+def _product_row(rng, category, category_id, tag):
+    row = {'category_id': category_id, 'state': 'stock', 'location': 'club', 'tag': tag}
+    if category in _BRANDS:
+        brand, models = rng.choice(_BRANDS[category])
+        row.update(brand=brand, model=rng.choice(models))
+    elif category not in ('Dragonne', 'Plastron'):
+        row['brand'] = rng.choice(_GENERIC_BRANDS)
+    if category == 'Poignée':
+        row['size'] = rng.choice(['23"', '25"', '27"'])
+    elif category == 'Branchages':
+        row.update(size=rng.choice(['S', 'M', 'L']), power=f"{rng.randint(16, 40)} lbs")
+    elif category == 'Flèches':
+        row['custom_values'] = {'spine': str(rng.choice([400, 500, 600, 700, 800, 1000])),
+                                'longueur': str(rng.randint(25, 31))}
+    elif category in ('Palette', 'Plastron'):
+        row['size'] = rng.choice(['S', 'M', 'L'])
+    if rng.random() < 0.03:
+        row['state'] = 'broken'
+        row['comments'] = 'À réparer'
+    return row
+
+
+def _loan_timeline(rng, start, today):
+    """Périodes de prêt successives (début, fin ou None si en cours) d'un même objet."""
+    periods = []
+    cursor = start + timedelta(days=rng.randint(0, 120))
+    while cursor < today:
+        if rng.random() < 0.6:
+            # La plupart des prêts partent à la rentrée (septembre – mi-octobre).
+            season = date(cursor.year if cursor.month < 9 else cursor.year + 1, 9, 1)
+            if cursor.month == 9 or (cursor.month == 10 and cursor.day <= 15):
+                season = cursor
+            cursor = max(cursor, season + timedelta(days=rng.randint(0, 45)))
+            if cursor >= today:
+                break
+        # Prêt à la rentrée, rendu en fin de saison (ou plus tôt : abandon, changement de matériel).
+        length = int(rng.triangular(14, 300, 240))
+        end = cursor + timedelta(days=length)
+        if end >= today:
+            periods.append((cursor, None if rng.random() < 0.85 else today - timedelta(days=1)))
+            break
+        periods.append((cursor, end))
+        cursor = end + timedelta(days=int(rng.triangular(3, 200, 60)))
+    return periods
+
+
+def _at(day, rng):
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randint(9, 20), minutes=rng.randint(0, 59))
+
+
+def _base36(n):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    out = ''
+    while True:
+        n, r = divmod(n, 36)
+        out = digits[r] + out
+        if not n:
+            return out
+
+
+def _run_suffix(model):
+    """Suffixe d'exécution pour `model` : id max actuel en base 36."""
+    return _base36(db.session.scalar(select(func.max(model.id))) or 0)
+
+
+def seed_synthetic_data(archers=200, products=400, years=3, seed=None, batch_size=5000):
+    """Ajoute un jeu synthétique à la base courante ; renvoie le nombre de lignes par table."""
+    rng = random.Random(seed)
+    writer = _Writer(batch_size)
+    started = time.perf_counter()
+    today = date.today()
+    first_day = today - timedelta(days=365 * years)
+    # Suffixes tirés des plus grands id existants : licences et étiquettes restent uniques sur une base
+    # déjà peuplée (chaque exécution fait avancer l'id max de la table qu'elle remplit) et la même
+    # graine sur la même base redonne les mêmes valeurs.
+    run, product_run, comp_run = (_run_suffix(model) for model in (Archer, Product, CompositeProduct))
+    counts = {}
+
+    categories = _ensure_categories(writer)
+    counts['categories'] = len(categories)
+
+    # -- archers -------------------------------------------------------------
+    archer_rows = []
+    for i in range(archers):
+        age_cat, age_min, age_max = _weighted(rng, [((c, lo, hi), w) for c, lo, hi, w in _AGE_CATEGORIES])
+        first = rng.choice(_FIRST_NAMES)
+        last = rng.choice(_LAST_NAMES)
+        archer_rows.append({
+            'first_name': first,
+            'last_name': last,
+            'age': rng.randint(age_min, age_max),
+            'license_number': f"S{run}{i:07d}"[:20],
+            'email': f"{first.lower()}.{last.lower()}.{run}{i}@exemple.fr" if rng.random() < 0.7 else None,
+            'categorie': age_cat,
+            'bow_type': _weighted(rng, _BOW_TYPES),
+        })
+    archer_ids = writer.ids(Archer, archer_rows)
+    counts['archers'] = len(archer_ids)
+
+    # -- matériel ------------------------------------------------------------
+    product_rows = []
+    product_cats = []
+    cat_weights = [(name, weight) for name, *_rest, weight in _CATEGORIES]
+    for i in range(products):
+        cat = _weighted(rng, cat_weights)
+        product_cats.append(cat)
+        product_rows.append(_product_row(rng, cat, categories[cat], f"SP-{product_run}-{i:06d}"))
+    product_ids = writer.ids(Product, product_rows)
+    counts['products'] = len(product_ids)
+
+    # Arcs montés : une pièce de chaque catégorie de _BOW_PARTS, tant qu'il en reste.
+    free = {cat: [] for cat in _BOW_PARTS}
+    loanable = []
+    for pid, cat, row in zip(product_ids, product_cats, product_rows):
+        if row['state'] == 'broken':
+            continue
+        if cat in free and rng.random() < 0.8:
+            free[cat].append(pid)
+        else:
+            loanable.append(pid)
+    n_bows = min(len(ids) for ids in free.values())
+    comp_rows = []
+    for i in range(n_bows):
+        bow_type = rng.choice(['CL', 'BB'])
+        comp_rows.append({
+            'name': f"Arc {'classique' if bow_type == 'CL' else 'barebow'} n°{i + 1}",
+            'type': bow_type,
+            'status': 'club',
+            'tag': f"SA-{comp_run}-{i:05d}",
+            'last_verification_date': today - timedelta(days=rng.randint(0, 700)) if rng.random() < 0.9 else None,
+        })
+    comp_ids = writer.ids(CompositeProduct, comp_rows)
+    writer.insert(composite_components, [
+        {'composite_id': cid, 'product_id': free[cat][i]}
+        for i, cid in enumerate(comp_ids) for cat in _BOW_PARTS
+    ])
+    loanable.extend(pid for cat in _BOW_PARTS for pid in free[cat][n_bows:])
+    counts['composites'] = len(comp_ids)
+
+    history = [{
+        'event_type': 'product_created', 'entity_type': 'product', 'entity_id': pid,
+        'summary': f"Produit créé : {cat} {row.get('brand') or ''}".strip(),
+        'created_at': _at(first_day - timedelta(days=rng.randint(0, 365)), rng),
+    } for pid, cat, row in zip(product_ids, product_cats, product_rows)]
+    history.extend({
+        'event_type': 'composite_created', 'entity_type': 'composite', 'entity_id': cid,
+        'summary': f"Arc créé : {row['name']}",
+        'created_at': _at(first_day - timedelta(days=rng.randint(0, 180)), rng),
+    } for cid, row in zip(comp_ids, comp_rows))
+
+    # -- prêts ---------------------------------------------------------------
+    def _loans(target_ids, fraction, kind):
+        rows, events, open_ids = [], [], []
+        for target in target_ids:
+            if rng.random() > fraction:
+                continue
+            for start, end in _loan_timeline(rng, first_day, today):
+                archer_id = rng.choice(archer_ids)
+                rows.append({
+                    'archer_id': archer_id, f'{kind}_id': target,
+                    'date_assigned': _at(start, rng), 'date_returned': _at(end, rng) if end else None,
+                })
+                label = 'Arc' if kind == 'composite' else 'Produit'
+                events.append({
+                    'event_type': 'assignment' if kind == 'composite' else 'product_assignment',
+                    'entity_type': 'assignment' if kind == 'composite' else 'product_assignment',
+                    'entity_id': None, 'summary': f"{label} {target} assigné à l'archer {archer_id}",
+                    'created_at': rows[-1]['date_assigned'],
+                })
+                if end:
+                    events.append({
+                        'event_type': 'assignment_return' if kind == 'composite' else 'product_assignment_return',
+                        'entity_type': events[-1]['entity_type'], 'entity_id': None,
+                        'summary': f"Retour : {label.lower()} {target} (archer {archer_id})",
+                        'created_at': rows[-1]['date_returned'],
+                    })
+                else:
+                    open_ids.append(target)
+        return rows, events, open_ids
+
+    bow_loans, bow_events, open_bows = _loans(comp_ids, 0.75, 'composite')
+    writer.insert(Assignment, bow_loans)
+    product_loans, product_events, open_products = _loans(loanable, 0.25, 'product')
+    writer.insert(ProductAssignment, product_loans)
+    for chunk_start in range(0, len(open_bows), batch_size):
+        db.session.query(CompositeProduct).filter(
+            CompositeProduct.id.in_(open_bows[chunk_start:chunk_start + batch_size])
+        ).update({'status': 'loan'}, synchronize_session=False)
+    for chunk_start in range(0, len(open_products), batch_size):
+        db.session.query(Product).filter(
+            Product.id.in_(open_products[chunk_start:chunk_start + batch_size])
+        ).update({'state': 'loan'}, synchronize_session=False)
+    history.extend(bow_events)
+    history.extend(product_events)
+    counts['assignments'] = len(bow_loans)
+    counts['product_assignments'] = len(product_loans)
+
+    # -- cours et présences --------------------------------------------------
+    n_courses = max(2, archers // 15)
+    course_rows = []
+    for i in range(n_courses):
+        day, start, end, level = _COURSE_SLOTS[i % len(_COURSE_SLOTS)]
+        course_rows.append({
+            'name': f"Cours {level} n°{i + 1} ({run})", 'day_of_week': day, 'start_time': start,
+            'end_time': end, 'level': level, 'max_archers': rng.choice([10, 12, 16, 20]), 'active': True,
+        })
+    course_ids = writer.ids(Course, course_rows)
+    members = {cid: [] for cid in course_ids}
+    for aid in archer_ids:
+        if rng.random() < 0.7:
+            members[rng.choice(course_ids)].append(aid)
+    writer.insert(archer_courses, [
+        {'archer_id': aid, 'course_id': cid} for cid, aids in members.items() for aid in aids
+    ])
+    attendance, attendance_count = [], 0
+    for cid, row in zip(course_ids, course_rows):
+        day = first_day + timedelta(days=(row['day_of_week'] - first_day.weekday()) % 7)
+        while day < today:
+            if day.month not in (7, 8):
+                for aid in members[cid]:
+                    attendance.append({
+                        'archer_id': aid, 'course_id': cid, 'date': day,
+                        'present': rng.random() < 0.8, 'recorded_at': _at(day, rng),
+                    })
+            day += timedelta(days=7)
+            if len(attendance) >= batch_size:
+                writer.insert(Attendance, attendance)
+                attendance_count += len(attendance)
+                attendance = []
+    writer.insert(Attendance, attendance)
+    counts['courses'] = len(course_ids)
+    counts['attendance'] = attendance_count + len(attendance)
+
+    # -- événements d'inscription ---------------------------------------------
+    event_rows, event_disciplines = [], []
+    for year_offset in range(years + 1):
+        for _ in range(rng.randint(4, 8)):
+            start = first_day + timedelta(days=365 * year_offset + rng.randint(0, 364))
+            discipline = _weighted(rng, _DISCIPLINES)
+            event_disciplines.append(discipline)
+            event_rows.append({
+                'title': f"Concours {discipline.replace('_', ' ')} {start:%m/%Y}",
+                'recipient_name': 'Comité départemental',
+                'lieu': rng.choice(['Gymnase municipal', 'Terrain du club', 'Complexe sportif']),
+                'start_date': start, 'end_date': start + timedelta(days=rng.choice([0, 0, 1])),
+                'open_for_archer_registration': start > today,
+                'archer_registration_deadline': start - timedelta(days=7),
+                'allowed_disciplines_json': f'["{discipline}"]',
+                'created_at': _at(start - timedelta(days=rng.randint(20, 60)), rng),
+            })
+    event_ids = writer.ids(InscriptionEvent, event_rows)
+    registrations = []
+    archer_profiles = {aid: row for aid, row in zip(archer_ids, archer_rows)}
+    for eid, discipline in zip(event_ids, event_disciplines):
+        for aid in rng.sample(archer_ids, k=int(len(archer_ids) * rng.uniform(0.05, 0.3))):
+            profile = archer_profiles[aid]
+            registrations.append({
+                'event_id': eid, 'archer_id': aid, 'discipline': discipline,
+                'age_category': profile['categorie'], 'weapon_choice': _WEAPONS[profile['bow_type']],
+                'blason': rng.choice(['Ø 40 cm', 'Trispot 40', 'Ø 60 cm', 'Ø 80 cm', 'Ø 122 cm']),
+                'distance_label': rng.choice(['18 m', '25 m', '30 m', '50 m', '70 m']),
+                'depart_index': rng.randint(0, 2),
+            })
+    writer.insert(InscriptionEventRegistration, registrations)
+    counts['inscription_events'] = len(event_ids)
+    counts['inscription_registrations'] = len(registrations)
+
+    writer.insert(HistoryEvent, history)
+    counts['history'] = len(history)
+
+    db.session.commit()
+    counts['rows'] = writer.rows
+    counts['seconds'] = round(time.perf_counter() - started, 1)
+    return counts
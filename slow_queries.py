@@ -0,0 +1,184 @@
+"""Journal des requêtes SQL lentes, avec plan d'exécution.
+
+Toute instruction plus longue que SLOW_QUERY_THRESHOLD_MS est enregistrée avec
+ses paramètres, l'endpoint appelant et un instantané du plan (`EXPLAIN QUERY
+PLAN` sous SQLite, `EXPLAIN` sous Postgres — aucun des deux n'exécute la
+requête). Stockage : fichier SQLite partagé `instance/perf.db`
+(SLOW_QUERY_PATH), table circulaire limitée à SLOW_QUERY_LOG_SIZE lignes.
+
+Consultation : /perf/requetes-lentes (admins) ou `flask perf slow-queries`.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS slow_query ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT, recorded_at TEXT NOT NULL,"
+    " duration_ms REAL NOT NULL, endpoint TEXT, statement TEXT NOT NULL,"
+    " parameters TEXT, plan TEXT)",
+    "CREATE INDEX IF NOT EXISTS ix_slow_query_duration ON slow_query (duration_ms)",
+)
+
+# Seules ces instructions ont un plan utile (et EXPLAIN ne les exécute pas).
+_EXPLAINABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+_MAX_PARAMETERS_CHARS = 2000
+
+
+class SlowQueryLog:
+    def __init__(self):
+        self.threshold = 0.0
+        self.path = None
+        self.size = 500
+        self._local = threading.local()
+
+    def init_app(self, app):
+        cfg = app.config
+        self.threshold = cfg.get('SLOW_QUERY_THRESHOLD_MS', 0) / 1000.0
+        self.path = cfg.get('SLOW_QUERY_PATH') or os.path.join(app.instance_path, 'perf.db')
+        self.size = cfg.get('SLOW_QUERY_LOG_SIZE', 500)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            for ddl in _SCHEMA:
+                conn.execute(ddl)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def record(self, duration, statement, parameters, plan):
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint or request.path
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cur = conn.execute(
+                "INSERT INTO slow_query (recorded_at, duration_ms, endpoint, statement, parameters, plan)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), duration * 1000, endpoint,
+                 statement, parameters, plan),
+            )
+            conn.execute("DELETE FROM slow_query WHERE id <= ?", (cur.lastrowid - self.size,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def entries(self, limit=100, min_ms=0, order='recent'):
+        """Entrées du journal (dict), les plus récentes ou les plus lentes d'abord."""
+        order_by = 'duration_ms DESC' if order == 'slowest' else 'id DESC'
+        cur = self._conn().execute(
+            "SELECT id, recorded_at, duration_ms, endpoint, statement, parameters, plan"
+            f" FROM slow_query WHERE duration_ms >= ? ORDER BY {order_by} LIMIT ?",
+            (min_ms, limit),
+        )
+        cols = [c[0] for c in cur.description]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def clear(self):
+        self._conn().execute("DELETE FROM slow_query")
+
+
+slow_query_log = SlowQueryLog()
+
+
+def _format_parameters(statement, parameters):
+    if not parameters:
+        return None
+    # Hash de mot de passe, jeton… : jamais recopiés dans le journal. Pour un SELECT,
+    # seuls les critères comptent (la colonne lue n'est pas un paramètre).
+    lowered = statement.lower()
+    if lowered.lstrip().startswith('select'):
+        lowered = lowered.partition(' where ')[2]
+    if 'password' in lowered or 'token' in lowered:
+        return '[masqué]'
+    text = repr(parameters)
+    if len(text) > _MAX_PARAMETERS_CHARS:
+        text = text[:_MAX_PARAMETERS_CHARS] + '…'
+    return text
+
+
+def _explain(conn, statement, parameters):
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    # Curseur DBAPI brut : ni événement SQLAlchemy (pas de récursion) ni autobegin.
+    cursor = conn.connection.dbapi_connection.cursor()
+    # Postgres : un EXPLAIN en échec annulerait la transaction de la requête HTTP.
+    savepoint = conn.dialect.name != 'sqlite'
+    try:
+        if savepoint:
+            cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            cursor.execute(prefix + statement, parameters or ())
+            rows = cursor.fetchall()
+        except Exception:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            raise
+        if savepoint:
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+    finally:
+        cursor.close()
+    if conn.dialect.name == 'sqlite':
+        # (id, parent, notused, detail) : indentation selon la profondeur dans l'arbre.
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _unused, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + str(detail))
+        return '\n'.join(lines)
+    return '\n'.join(str(row[0]) for row in rows)
+
+
+# Même principe que perf.py : début porté par le contexte d'exécution, rien ne
+# reste sur la connexion quand une instruction échoue.
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._slow_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_slow_query_start', None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    if duration < slow_query_log.threshold:
+        return
+    plan = None
+    if not executemany:
+        try:
+            plan = _explain(conn, statement, parameters)
+        except Exception as exc:
+            plan = f'EXPLAIN impossible : {exc}'
+    try:
+        slow_query_log.record(duration, statement, _format_parameters(statement, parameters), plan)
+    except sqlite3.Error:
+        logger.warning("Journal des requêtes lentes indisponible", exc_info=True)
+
+
+def init_app(app, db):
+    """Branche le chronométrage des instructions si SLOW_QUERY_THRESHOLD_MS > 0."""
+    slow_query_log.init_app(app)
+    if slow_query_log.threshold <= 0:
+        return
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
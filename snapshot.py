@@ -0,0 +1,279 @@
+"""Instantané complet d'une instance : `flask snapshot export` / `flask snapshot import`.
+
+Format : un fichier JSON Lines compressé (gzip), versionné.
+
+    {"format": "aim-snapshot", "version": 1, "dialect": …, "alembic_revision": …, "tables": […]}
+    {"table": "category", "columns": ["id", "position", …]}
+    [1, 0, "Poignée", …]                      ← une ligne par enregistrement
+    {"end": "category", "rows": 12}
+    …
+    {"complete": true, "rows": 48210}
+
+L'export lit toutes les tables dans une seule transaction en lecture (SQLite :
+BEGIN explicite, Postgres : REPEATABLE READ en lecture seule) : l'instantané est
+cohérent même si l'application écrit pendant ce temps. Les dates sont en ISO 8601,
+les colonnes JSON restent du JSON : le fichier se relit indifféremment sous
+SQLite ou Postgres. Un JSON `null` et un NULL SQL, lus tous deux None par
+l'application, sont restaurés en NULL SQL.
+
+L'import tient aussi en une transaction : tables vidées (--replace), index
+secondaires supprimés, INSERT groupés dans l'ordre des dépendances (clés
+étrangères), index recréés, séquences Postgres recalées. La base cible doit
+avoir le schéma à jour (`flask db upgrade`) ; la révision Alembic de
+l'instantané doit être la même (sauf --force).
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import time
+from datetime import date, datetime
+from datetime import time as dt_time
+
+from sqlalchemy import JSON, Date, DateTime, Integer, MetaData, Table, Time, bindparam, func, inspect, select, text
+
+import data_versions
+from models import DataVersion
+
+FORMAT = 'aim-snapshot'
+VERSION = 1
+
+# Compteurs d'ETag : propres à l'instance, jamais exportés ni écrasés. L'import
+# les incrémente, ils ne reviennent donc pas à une valeur déjà vue par un navigateur.
+SKIPPED_TABLES = frozenset({DataVersion.__tablename__})
+
+
+class SnapshotError(Exception):
+    """Instantané illisible, incomplet ou incompatible avec la base cible."""
+
+
+def _encode(value):
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} non sérialisable")
+
+
+def _decoder(column):
+    """Conversion inverse de `_encode` d'après le type de la colonne cible (None : valeur telle quelle)."""
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat
+    if isinstance(column.type, Date):
+        return date.fromisoformat
+    if isinstance(column.type, Time):
+        return dt_time.fromisoformat
+    return None
+
+
+def _alembic_revision(conn):
+    if not inspect(conn).has_table('alembic_version'):
+        return None
+    return conn.execute(text('SELECT version_num FROM alembic_version')).scalar()
+
+
+def _begin_snapshot(conn):
+    """Ouvre la transaction qui fige la vue des données pour tout l'export."""
+    if conn.dialect.name == 'sqlite':
+        # pysqlite n'ouvre pas de transaction pour un SELECT : sans BEGIN, chaque
+        # table serait lue dans un état différent.
+        conn.exec_driver_sql('BEGIN')
+    elif conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+
+
+def export_snapshot(engine, metadata, path, *, batch_size=2000, compresslevel=6):
+    """Écrit l'instantané dans `path` (fichier temporaire puis renommage) ; renvoie le résumé (lignes par table…)."""
+    started = time.perf_counter()
+    counts = {}
+    tmp_path = f'{path}.tmp'
+    with engine.connect() as conn:
+        _begin_snapshot(conn)
+        existing = set(inspect(conn).get_table_names())
+        tables = [t for t in metadata.sorted_tables if t.name in existing and t.name not in SKIPPED_TABLES]
+        header = {
+            'format': FORMAT,
+            'version': VERSION,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'dialect': conn.dialect.name,
+            'alembic_revision': _alembic_revision(conn),
+            'tables': [t.name for t in tables],
+        }
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=compresslevel) as out:
+                out.write(json.dumps(header, ensure_ascii=False) + '\n')
+                for table in tables:
+                    columns = [c.name for c in table.columns]
+                    out.write(json.dumps({'table': table.name, 'columns': columns}) + '\n')
+                    order = list(table.primary_key.columns) or list(table.columns)
+                    result = conn.execution_options(yield_per=batch_size).execute(
+                        select(table).order_by(*order)
+                    )
+                    n = 0
+                    for row in result:
+                        out.write(json.dumps(list(row), ensure_ascii=False, default=_encode) + '\n')
+                        n += 1
+                    out.write(json.dumps({'end': table.name, 'rows': n}) + '\n')
+                    counts[table.name] = n
+                out.write(json.dumps({'complete': True, 'rows': sum(counts.values())}) + '\n')
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            conn.rollback()
+    os.replace(tmp_path, path)
+    return {'tables': counts, 'rows': sum(counts.values()), 'seconds': round(time.perf_counter() - started, 2),
+            'bytes': os.path.getsize(path), 'alembic_revision': header['alembic_revision']}
+
+
+def _parse_header(line):
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != FORMAT:
+        raise SnapshotError("Ce fichier n'est pas un instantané AIM.")
+    if header.get('version') != VERSION:
+        raise SnapshotError(f"Version d'instantané {header.get('version')} non prise en charge (attendu : {VERSION}).")
+    return header
+
+
+# -- import -------------------------------------------------------------------------
+
+def _drop_indexes(conn, name):
+    """Supprime les index secondaires de la table et renvoie de quoi les recréer."""
+    reflected = Table(name, MetaData(), autoload_with=conn)
+    indexes = [idx for idx in reflected.indexes if idx.name]
+    for idx in indexes:
+        idx.drop(conn)
+    return indexes
+
+
+def _reset_sequences(conn, tables):
+    """Postgres : les id insérés explicitement ne font pas avancer les séquences."""
+    if conn.dialect.name != 'postgresql':
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    for table in tables:
+        pk = list(table.primary_key.columns)
+        if len(pk) != 1 or not isinstance(pk[0].type, Integer):
+            continue
+        col = pk[0].name
+        conn.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence(:table, :col), "
+                f"COALESCE(MAX({quote(col)}), 0) + 1, false) FROM {quote(table.name)}"
+            ),
+            {'table': table.name, 'col': col},
+        )
+
+
+def _insert_statement(table):
+    """INSERT groupé de la table ; un None des colonnes JSON reste un NULL SQL (et non le JSON `null`)."""
+    json_columns = {
+        c.name: bindparam(c.name, type_=JSON(none_as_null=True))
+        for c in table.columns if isinstance(c.type, JSON)
+    }
+    return table.insert().values(json_columns) if json_columns else table.insert()
+
+
+def _flush(conn, insert_stmt, batch):
+    if batch:
+        conn.execute(insert_stmt, batch)
+        batch.clear()
+
+
+def import_snapshot(engine, metadata, path, *, replace=False, force=False, batch_size=2000):
+    """Restaure l'instantané `path` dans la base de `engine` (une transaction) ; renvoie le résumé.
+
+    Lève SnapshotError si le fichier est incomplet, si la révision du schéma
+    diffère (sans `force`) ou si la base contient déjà des données (sans `replace`).
+    """
+    started = time.perf_counter()
+    tables_by_name = {t.name: t for t in metadata.sorted_tables if t.name not in SKIPPED_TABLES}
+    counts = {}
+    with engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            # Même raison qu'à l'export : DROP / CREATE INDEX et INSERT dans une seule transaction.
+            conn.exec_driver_sql('BEGIN')
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as src:
+                header = _parse_header(src.readline())
+                target_revision = _alembic_revision(conn)
+                if not force and header.get('alembic_revision') != target_revision:
+                    raise SnapshotError(
+                        f"Révision du schéma différente (instantané : {header.get('alembic_revision')}, "
+                        f"base : {target_revision}). Mettre la base au même niveau (`flask db upgrade`) ou --force."
+                    )
+                existing = set(inspect(conn).get_table_names())
+                missing = [n for n in header['tables'] if n not in existing]
+                if missing:
+                    raise SnapshotError(f"Tables absentes de la base cible : {', '.join(missing)}.")
+                present = [t for t in tables_by_name.values() if t.name in existing]
+                non_empty = [
+                    t.name for t in present
+                    if conn.execute(select(func.count()).select_from(t)).scalar()
+                ]
+                if non_empty and not replace:
+                    raise SnapshotError(
+                        f"La base contient déjà des données ({', '.join(non_empty)}) : relancer avec --replace."
+                    )
+                # Suppression en ordre inverse des dépendances (enfants d'abord).
+                for table in reversed(present):
+                    if table.name in non_empty:
+                        conn.execute(table.delete())
+
+                table = insert_stmt = columns = decoders = indexes = None
+                batch = []
+                inserted = 0
+                complete = False
+                for line in src:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        raise SnapshotError('Instantané tronqué ou corrompu : rien n\'a été importé.') from None
+                    if isinstance(record, list):
+                        batch.append({
+                            col: (dec(value) if dec and value is not None else value)
+                            for col, dec, value in zip(columns, decoders, record)
+                            if col is not None
+                        })
+                        inserted += 1
+                        if len(batch) >= batch_size:
+                            _flush(conn, insert_stmt, batch)
+                    elif 'table' in record:
+                        table = tables_by_name.get(record['table'])
+                        if table is None:
+                            raise SnapshotError(f"Table inconnue dans l'instantané : {record['table']}.")
+                        # Colonnes disparues du modèle ignorées, nouvelles colonnes à leur défaut.
+                        columns = [c if c in table.c else None for c in record['columns']]
+                        decoders = [_decoder(table.c[c]) if c else None for c in columns]
+                        insert_stmt = _insert_statement(table)
+                        indexes = _drop_indexes(conn, table.name)
+                        inserted = 0
+                    elif 'end' in record:
+                        _flush(conn, insert_stmt, batch)
+                        for idx in indexes:
+                            idx.create(conn)
+                        if inserted != record['rows']:
+                            raise SnapshotError(f"{table.name} : {inserted} lignes lues, {record['rows']} annoncées.")
+                        counts[table.name] = inserted
+                        table = None
+                    elif record.get('complete'):
+                        complete = record.get('rows') == sum(counts.values())
+                if not complete:
+                    raise SnapshotError('Instantané tronqué ou incomplet : rien n\'a été importé.')
+
+            _reset_sequences(conn, [tables_by_name[n] for n in counts])
+            # Nouvelles versions partout : ETag et cache applicatif ne resservent rien d'avant l'import.
+            data_versions.bump_versions(conn, set(counts) | set(non_empty))
+            conn.commit()
+        except (EOFError, gzip.BadGzipFile) as exc:
+            conn.rollback()
+            raise SnapshotError(f"Archive illisible ({exc}) : rien n'a été importé.") from None
+        except BaseException:
+            conn.rollback()
+            raise
+    return {'tables': counts, 'rows': sum(counts.values()), 'seconds': round(time.perf_counter() - started, 2),
+            'alembic_revision': header.get('alembic_revision'), 'source_dialect': header.get('dialect')}